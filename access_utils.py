@@ -0,0 +1,72 @@
+"""
+Role checks and request-scoped profiles of the logged in user.
+"""
+from functools import wraps
+from flask import g, flash, redirect, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from app import db
+from models import Client, Professional
+
+def _load_profile(model):
+    """
+    Get or create the profile row of the current user
+
+    The ``User`` row is joined in the same query and handed to the session
+    user, so views updating ``current_user`` do not load it again.
+    """
+    profile = db.session.scalar(
+        select(model).where(model.user_id == current_user.id).options(joinedload(model.user))
+    )
+    if profile is None:
+        # Profiles are created on first use, as the profile pages always did
+        profile = model(user_id=current_user.id)
+        db.session.add(profile)
+        db.session.commit()
+    else:
+        attach = getattr(current_user._get_current_object(), 'attach', None)
+        if attach is not None:
+            attach(profile.user)
+    return profile
+
+def current_client():
+    """
+    Client profile of the logged in user, loaded once per request
+
+    Returns:
+        Client: The profile, also available as ``g.client``
+    """
+    if 'client' not in g:
+        g.client = _load_profile(Client)
+    return g.client
+
+def current_professional():
+    """
+    Professional profile of the logged in user, loaded once per request
+
+    Returns:
+        Professional: The profile, also available as ``g.professional``
+    """
+    if 'professional' not in g:
+        g.professional = _load_profile(Professional)
+    return g.professional
+
+def _role_required(view, has_role, load_profile):
+    @wraps(view)
+    @login_required
+    def wrapped(*args, **kwargs):
+        if not has_role():
+            flash('No tienes permisos para acceder a esta página', 'danger')
+            return redirect(url_for('main.index'))
+        load_profile()
+        return view(*args, **kwargs)
+    return wrapped
+
+def client_required(view):
+    """Restrict a view to logged in clients and load ``g.client``"""
+    return _role_required(view, lambda: current_user.is_client(), current_client)
+
+def professional_required(view):
+    """Restrict a view to logged in professionals and load ``g.professional``"""
+    return _role_required(view, lambda: current_user.is_professional(), current_professional)
@@ -5,6 +5,7 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
 from flask_mail import Mail
+from flask_migrate import Migrate
 from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
 
@@ -19,6 +20,7 @@ class Base(DeclarativeBase):
 db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
 mail = Mail()
+migrate = Migrate()
 
 # Create the app
 app = Flask(__name__)
@@ -30,6 +32,7 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 db.init_app(app)
 login_manager.init_app(app)
 mail.init_app(app)
+migrate.init_app(app, db)
 
 # Configure login
 login_manager.login_view = 'auth.login'
@@ -39,7 +42,7 @@ login_manager.login_message_category = 'info'
 # Import models
 with app.app_context():
     # Import models here to avoid circular imports
-    from models import User, Professional, Client, Appointment, Specialty, Schedule
+    from models import User, Professional, Client, Appointment, Specialty, Schedule, AvailabilityDay, AvailabilityMaterializedDay, CacheVersion, EmailOutbox, ReminderJob
     
     # Create all tables
     db.create_all()
@@ -73,13 +76,18 @@ def internal_server_error(e):
                           error_message="Error interno del servidor"), 500
 
 # User loader for Flask-Login
-@login_manager.user_loader
-def load_user(user_id):
-    from models import User
-    from sqlalchemy.exc import PendingRollbackError
-    try:
-        return User.query.get(int(user_id))
-    except PendingRollbackError:
-        # Si hay una transacción pendiente, hacemos rollback y reintentamos
-        db.session.rollback()
-        return User.query.get(int(user_id))
+from login_utils import load_user, set_user_cache
+login_manager.user_loader(load_user)
+
+if app.config['USER_CACHE_REDIS_URL']:
+    # Changes to a user then reach every worker process on its next request
+    from cache_utils import RedisCache
+    set_user_cache(RedisCache(app.config['USER_CACHE_REDIS_URL'], 'user', ttl=app.config['USER_CACHE_TTL']))
+
+# Email outbox delivery, started by the first request of each worker process
+from outbox_utils import start_outbox_workers
+
+@app.before_request
+def start_email_outbox():
+    if not app.testing:
+        start_outbox_workers(app)
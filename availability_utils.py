@@ -0,0 +1,648 @@
+"""
+Availability engine for computing free appointment slots of professionals.
+"""
+from datetime import datetime, time, timedelta
+from array import array
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+from sqlalchemy import event, inspect, select, delete, insert, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from flask import current_app
+from app import db
+from cache_utils import LRUCache
+from config import Config
+from models import (Appointment, Schedule, Professional, Specialty, AvailabilityDay, AvailabilityMaterializedDay,
+                    professional_specialty)
+
+# Cache of computed slots keyed by (professional_id, date). Entries are
+# invalidated on Appointment/Schedule/slot settings flushes in this process; the TTL bounds
+# how long other worker processes may serve a stale day (bookings are always
+# validated against the database, so staleness only affects what is shown).
+slot_cache = LRUCache(max_entries=Config.AVAILABILITY_CACHE_SIZE,
+                      ttl=Config.AVAILABILITY_CACHE_TTL)
+
+
+def _to_minutes(value):
+    """Convert a time object to minutes since midnight"""
+    return value.hour * 60 + value.minute
+
+def _to_time(minutes):
+    """Convert minutes since midnight back to a time object"""
+    return time(minutes // 60, minutes % 60)
+
+class DaySlots:
+    """
+    Free slots of one day, stored compactly as a flat array of minute offsets
+    ``[start0, end0, start1, end1, ...]``.
+
+    Iterating yields ``(start, end)`` pairs in minutes since midnight; the
+    availability endpoint serves them as such and the booking page formats
+    them.
+    """
+    __slots__ = ('minutes',)
+
+    def __init__(self, minutes=()):
+        self.minutes = array('H', minutes)
+
+    def __iter__(self):
+        return zip(self.minutes[::2], self.minutes[1::2])
+
+    def __len__(self):
+        return len(self.minutes) // 2
+
+    def __eq__(self, other):
+        return isinstance(other, DaySlots) and self.minutes == other.minutes
+
+    def __repr__(self):
+        return f'<DaySlots {list(self)}>'
+
+    @property
+    def free_minutes(self):
+        return sum(end - start for start, end in self)
+
+def _busy_intervals(appointments, buffer=0):
+    """
+    Build the sorted, merged list of busy intervals of a day
+
+    Args:
+        appointments (list): Rows with ``start_time`` and ``end_time``
+        buffer (int): Minutes kept free before and after every appointment
+
+    Returns:
+        list: Non-overlapping ``[start, end)`` minute pairs sorted by start
+    """
+    intervals = sorted(
+        (_to_minutes(a.start_time) - buffer, _to_minutes(a.end_time) + buffer) for a in appointments
+    )
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+def _compute_day_slots(schedules, appointments, duration=60, buffer=0):
+    """
+    Compute the free slots of a single day
+
+    Slots of ``duration`` minutes, separated by ``buffer`` minutes, are laid on
+    a grid starting at each schedule's start time and checked against the
+    merged busy intervals with a single forward sweep, so a day costs
+    O(slots + appointments) after sorting the appointments.
+
+    Args:
+        schedules (list): Schedule rows for the weekday being computed
+        appointments (list): Non-cancelled appointments of that day
+        duration (int): Slot length in minutes
+        buffer (int): Minutes between consecutive slots and around appointments
+
+    Returns:
+        DaySlots: Free slots of the day
+    """
+    busy = _busy_intervals(appointments, buffer)
+    busy_ends = [end for _, end in busy]
+    busy_count = len(busy)
+
+    free = []
+    for schedule in schedules:
+        current = _to_minutes(schedule.start_time)
+        end = _to_minutes(schedule.end_time)
+        # First busy interval that ends after the schedule starts
+        index = bisect_right(busy_ends, current)
+
+        while current < end:
+            slot_end = min(current + duration, end)
+
+            # Skip the busy intervals that finish before this slot starts
+            while index < busy_count and busy_ends[index] <= current:
+                index += 1
+
+            # The slot is free unless the next busy interval starts inside it
+            if index == busy_count or busy[index][0] >= slot_end:
+                free.append(current)
+                free.append(slot_end)
+
+            # Move to next slot
+            current = slot_end + buffer
+
+    return DaySlots(free)
+
+def _schedule_query():
+    """
+    Select schedule rows together with the slot settings of their professional:
+    the professional's own duration and buffer and the shortest duration
+    configured on any of its specialties
+    """
+    specialty_duration = select(func.min(Specialty.slot_duration)).where(
+        professional_specialty.c.professional_id == Schedule.professional_id,
+        professional_specialty.c.specialty_id == Specialty.id
+    ).scalar_subquery()
+    return select(
+        Schedule.professional_id, Schedule.day_of_week, Schedule.start_time, Schedule.end_time,
+        Professional.slot_duration, Professional.slot_buffer,
+        specialty_duration.label('specialty_slot_duration')
+    ).join(Professional, Professional.id == Schedule.professional_id)
+
+def _slot_settings(row):
+    """Slot duration and buffer of a schedule row: professional, then specialty, then default"""
+    duration = (row.slot_duration or row.specialty_slot_duration
+                or current_app.config['DEFAULT_APPOINTMENT_DURATION'])
+    return duration, row.slot_buffer or 0
+
+def _compute_slots_range(professional_id, start_date, end_date):
+    """
+    Compute the slots of every day of a date range straight from the database.
+
+    All schedules and all non-cancelled appointments of the window are loaded
+    in two queries and every day is computed in memory, so the cost does not
+    grow with the number of days requested.
+    """
+    schedule_rows = db.session.execute(
+        _schedule_query().where(Schedule.professional_id == professional_id)).all()
+    schedules_by_day = defaultdict(list)
+    for row in schedule_rows:
+        schedules_by_day[row.day_of_week].append(row)
+
+    appointments_by_date = defaultdict(list)
+    if schedule_rows:
+        duration, buffer = _slot_settings(schedule_rows[0])
+        appointments = db.session.execute(select(
+            Appointment.date, Appointment.start_time, Appointment.end_time
+        ).where(
+            Appointment.professional_id == professional_id,
+            Appointment.starts_at >= datetime.combine(start_date, time.min),
+            Appointment.starts_at < datetime.combine(end_date + timedelta(days=1), time.min),
+            Appointment.status != 'cancelled'
+        )).all()
+        for appointment in appointments:
+            appointments_by_date[appointment.date].append(appointment)
+
+    days = {}
+    current_date = start_date
+    while current_date <= end_date:
+        schedules = schedules_by_day.get(current_date.weekday())
+        if schedules:
+            days[current_date] = _compute_day_slots(
+                schedules, appointments_by_date.get(current_date, []), duration, buffer)
+        else:
+            days[current_date] = DaySlots()
+        current_date += timedelta(days=1)
+
+    return days
+
+def get_available_slots_range(professional_id, start_date, end_date):
+    """
+    Get available appointment slots for a professional on every day of a date range.
+
+    Days are served from the availability cache; the days that are missing
+    are computed together with two queries and stored back in the cache.
+
+    Args:
+        professional_id (int): Professional ID
+        start_date (date): First day of the range (inclusive)
+        end_date (date): Last day of the range (inclusive)
+
+    Returns:
+        dict: Ordered mapping of date -> DaySlots for every day in the range.
+            The DaySlots are shared with the cache and must not be modified.
+    """
+    days = {}
+    missing = []
+    current_date = start_date
+    while current_date <= end_date:
+        slots = slot_cache.get((professional_id, current_date))
+        if slots is None:
+            missing.append(current_date)
+        days[current_date] = slots
+        current_date += timedelta(days=1)
+
+    if missing:
+        generation = slot_cache.generation
+        computed = _compute_slots_range(professional_id, missing[0], missing[-1])
+        for check_date in missing:
+            slots = computed[check_date]
+            slot_cache.set((professional_id, check_date), slots, generation)
+            days[check_date] = slots
+
+    return days
+
+def get_available_slots(professional_id, date):
+    """Get available appointment slots for a professional on a specific date"""
+    return get_available_slots_range(professional_id, date, date)[date]
+
+def iter_available_slots(professional_id, start_date, end_date, chunk_days=7):
+    """
+    Lazily yield the free slots of a professional in chronological order.
+
+    Days are computed in chunks through get_available_slots_range, so a
+    consumer that stops early never computes the rest of the calendar.
+    Slots of today that already started are skipped.
+
+    Yields:
+        tuple: ``(date, start, end, professional_id)`` with minute offsets
+    """
+    now = datetime.now()
+    today, now_minutes = now.date(), _to_minutes(now)
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+        for day, slots in get_available_slots_range(professional_id, chunk_start, chunk_end).items():
+            for start, end in sorted(slots):
+                if day == today and start <= now_minutes:
+                    continue
+                yield (day, start, end, professional_id)
+        chunk_start = chunk_end + timedelta(days=1)
+
+def earliest_available_slots(specialty_id, limit=5, start_date=None, days=None):
+    """
+    Find the earliest free slots across every professional of a specialty.
+
+    The materialized summary gives, in one query, the first free slot of each
+    professional, which seeds a heap. A professional's slot stream is only
+    opened when their entry reaches the top of the heap, and consumption
+    stops as soon as ``limit`` slots have been found, so professionals whose
+    first free slot comes too late are never computed.
+
+    Args:
+        specialty_id (int): Specialty ID
+        limit (int): Number of slots to return
+        start_date (date, optional): First day to consider, today by default
+        days (int, optional): Days to look ahead, AVAILABILITY_HORIZON_DAYS by default
+
+    Returns:
+        list: Dicts with ``professional_id``, ``date``, ``start`` and ``end``
+    """
+    start_date = max(start_date or datetime.now().date(), datetime.now().date())
+    end_date = start_date + timedelta(days=(days or Config.AVAILABILITY_HORIZON_DAYS) - 1)
+    ensure_materialized(start_date, end_date)
+
+    free_days = select(
+        AvailabilityDay.professional_id,
+        AvailabilityDay.date,
+        AvailabilityDay.first_free,
+        func.row_number().over(partition_by=AvailabilityDay.professional_id,
+                               order_by=AvailabilityDay.date).label('position')
+    ).join(
+        professional_specialty,
+        professional_specialty.c.professional_id == AvailabilityDay.professional_id
+    ).where(
+        professional_specialty.c.specialty_id == specialty_id,
+        AvailabilityDay.date >= start_date,
+        AvailabilityDay.date <= end_date,
+        AvailabilityDay.free_slots > 0
+    ).subquery()
+    first_free_days = db.session.execute(
+        select(free_days.c.professional_id, free_days.c.date, free_days.c.first_free)
+        .where(free_days.c.position == 1)
+    ).all()
+
+    # Entries are (date, start, professional_id, end, stream); a professional
+    # has one entry at a time, so ties never compare the streams. Seeds carry
+    # the summary's first free slot and no stream yet.
+    heap = [(day, _to_minutes(first_free) if first_free else 0, professional_id, None, None)
+            for professional_id, day, first_free in first_free_days]
+    heapq.heapify(heap)
+
+    slots = []
+    while heap and len(slots) < limit:
+        day, start, professional_id, end, stream = heapq.heappop(heap)
+        if stream is None:
+            stream = iter_available_slots(professional_id, day, end_date)
+        else:
+            slots.append({'professional_id': professional_id, 'date': day,
+                          'start': _to_time(start), 'end': _to_time(end)})
+        slot = next(stream, None)
+        if slot is not None:
+            heapq.heappush(heap, (slot[0], slot[1], professional_id, slot[2], stream))
+    return slots
+
+def invalidate_availability(professional_id=None, date=None):
+    """
+    Drop cached availability
+
+    Args:
+        professional_id (int, optional): Professional ID; every professional when omitted
+        date (date, optional): Single day to drop; every day when omitted
+    """
+    if professional_id is None:
+        slot_cache.clear()
+    elif date is not None:
+        slot_cache.delete((professional_id, date))
+    else:
+        slot_cache.discard_where(lambda key: key[0] == professional_id)
+
+# Last availability_version seen per professional by this process
+_seen_versions = {}
+
+def availability_version(professional_id):
+    """
+    Get the availability version of a professional.
+
+    The version is bumped in the database on every change that affects the
+    professional's slots, so it identifies a state of their calendar across
+    processes. When it differs from the version this process last saw, the
+    cached days of the professional are dropped, since another process
+    changed them.
+
+    Args:
+        professional_id (int): Professional ID
+
+    Returns:
+        int: Current version, or None if the professional does not exist
+    """
+    version = db.session.execute(
+        select(Professional.availability_version).where(Professional.id == professional_id)
+    ).scalar()
+    if version is not None and _seen_versions.get(professional_id) != version:
+        invalidate_availability(professional_id)
+        _seen_versions[professional_id] = version
+    return version
+
+def _bump_availability_versions(connection, keys):
+    """Increment availability_version of the professionals touched by a flush"""
+    professional_table = Professional.__table__
+    query = update(professional_table).values(
+        availability_version=professional_table.c.availability_version + 1)
+    if (None, None) not in keys:
+        query = query.where(professional_table.c.id.in_({pid for pid, _ in keys}))
+    connection.execute(query)
+
+_APPOINTMENT_SLOT_FIELDS = ('professional_id', 'date', 'start_time', 'end_time', 'status')
+_PROFESSIONAL_SLOT_FIELDS = ('slot_duration', 'slot_buffer', 'specialties')
+
+def _summarize_days(dates, schedule_rows, appointment_rows):
+    """
+    Build AvailabilityDay rows for every professional working on each date
+
+    Args:
+        dates (iterable): Dates to summarize
+        schedule_rows (list): Rows of _schedule_query()
+        appointment_rows (list): Non-cancelled rows with professional_id, date, start_time, end_time
+
+    Returns:
+        list: Dicts ready to be inserted into the availability_day table
+    """
+    schedules_by_weekday = defaultdict(lambda: defaultdict(list))
+    for row in schedule_rows:
+        schedules_by_weekday[row.day_of_week][row.professional_id].append(row)
+
+    appointments_by_key = defaultdict(list)
+    for row in appointment_rows:
+        appointments_by_key[(row.professional_id, row.date)].append(row)
+
+    now = datetime.utcnow()
+    summaries = []
+    for day in dates:
+        for professional_id, schedules in schedules_by_weekday[day.weekday()].items():
+            duration, buffer = _slot_settings(schedules[0])
+            free = _compute_day_slots(
+                schedules, appointments_by_key.get((professional_id, day), []), duration, buffer)
+            summaries.append({
+                'professional_id': professional_id,
+                'date': day,
+                'free_slots': len(free),
+                'free_minutes': free.free_minutes,
+                'first_free': _to_time(min(free)[0]) if free else None,
+                'updated_at': now
+            })
+    return summaries
+
+def _materialize_days(connection, dates, professional_ids=None):
+    """
+    Recompute the availability_day rows of the given dates
+
+    Recomputing every professional also records the dates as materialized,
+    so dates on which nobody works are not rebuilt on every lookup.
+
+    Args:
+        connection (Connection): Connection of the current transaction
+        dates (list): Dates to recompute
+        professional_ids (iterable, optional): Restrict to these professionals
+
+    Returns:
+        int: Number of rows written
+    """
+    if not dates:
+        return 0
+
+    schedule_table = Schedule.__table__
+    appointment_table = Appointment.__table__
+    summary_table = AvailabilityDay.__table__
+
+    schedules_query = _schedule_query().where(
+        schedule_table.c.day_of_week.in_({day.weekday() for day in dates}))
+    appointments_query = select(
+        appointment_table.c.professional_id, appointment_table.c.date,
+        appointment_table.c.start_time, appointment_table.c.end_time
+    ).where(
+        appointment_table.c.date.in_(dates),
+        appointment_table.c.status != 'cancelled'
+    )
+    delete_query = delete(summary_table).where(summary_table.c.date.in_(dates))
+
+    if professional_ids is not None:
+        professional_ids = list(professional_ids)
+        schedules_query = schedules_query.where(schedule_table.c.professional_id.in_(professional_ids))
+        appointments_query = appointments_query.where(appointment_table.c.professional_id.in_(professional_ids))
+        delete_query = delete_query.where(summary_table.c.professional_id.in_(professional_ids))
+
+    schedule_rows = connection.execute(schedules_query).all()
+    appointment_rows = connection.execute(appointments_query).all() if schedule_rows else []
+    summaries = _summarize_days(dates, schedule_rows, appointment_rows)
+
+    connection.execute(delete_query)
+    if summaries:
+        connection.execute(insert(summary_table), summaries)
+    if professional_ids is None:
+        marker_table = AvailabilityMaterializedDay.__table__
+        now = datetime.utcnow()
+        connection.execute(delete(marker_table).where(marker_table.c.date.in_(dates)))
+        connection.execute(insert(marker_table), [{'date': day, 'materialized_at': now} for day in dates])
+    return len(summaries)
+
+def _materialized_dates(connection, dates=None):
+    """Dates from today on whose availability_day rows have been built"""
+    marker_table = AvailabilityMaterializedDay.__table__
+    query = select(marker_table.c.date).where(marker_table.c.date >= datetime.now().date())
+    if dates is not None:
+        query = query.where(marker_table.c.date.in_(dates))
+    return sorted(connection.execute(query).scalars())
+
+def rebuild_availability(start_date, end_date, chunk_days=14):
+    """
+    Rebuild the materialized availability of every professional for a date range.
+
+    Rows older than today are pruned. The caller is responsible for committing.
+
+    Args:
+        start_date (date): First day of the range (inclusive)
+        end_date (date): Last day of the range (inclusive)
+        chunk_days (int): Days recomputed per batch of queries
+
+    Returns:
+        int: Number of rows written
+    """
+    connection = db.session.connection()
+    today = datetime.now().date()
+    summary_table = AvailabilityDay.__table__
+    marker_table = AvailabilityMaterializedDay.__table__
+    connection.execute(delete(summary_table).where(summary_table.c.date < today))
+    connection.execute(delete(marker_table).where(marker_table.c.date < today))
+
+    written = 0
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+        dates = [chunk_start + timedelta(days=i) for i in range((chunk_end - chunk_start).days + 1)]
+        written += _materialize_days(connection, dates)
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
+
+def ensure_materialized(start_date, end_date):
+    """
+    Make sure every date of a range from today on has been materialized.
+
+    Dates not materialized yet are computed in one batch and committed.
+    Once a window is materialized, including the dates on which nobody
+    works, a search over it costs a single lookup query and no write.
+
+    Args:
+        start_date (date): First day of the range (inclusive)
+        end_date (date): Last day of the range (inclusive)
+    """
+    start_date = max(start_date, datetime.now().date())
+    if start_date > end_date:
+        return
+
+    dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    connection = db.session.connection()
+    present = set(_materialized_dates(connection, dates))
+    missing = [day for day in dates if day not in present]
+    if not missing:
+        return
+
+    try:
+        _materialize_days(connection, missing)
+        db.session.commit()
+    except IntegrityError:
+        # Another request materialized the same dates concurrently
+        db.session.rollback()
+
+def free_capacity_query(start_date, end_date):
+    """
+    Subquery with the free slots of each professional over a date range
+
+    Args:
+        start_date (date): First day of the range (inclusive)
+        end_date (date): Last day of the range (inclusive)
+
+    Returns:
+        Subquery: Columns ``professional_id`` and ``free_slots`` for professionals
+            with at least one free slot in the range
+    """
+    return db.session.query(
+        AvailabilityDay.professional_id.label('professional_id'),
+        func.sum(AvailabilityDay.free_slots).label('free_slots')
+    ).filter(
+        AvailabilityDay.date >= start_date,
+        AvailabilityDay.date <= end_date,
+        AvailabilityDay.free_slots > 0
+    ).group_by(AvailabilityDay.professional_id).subquery()
+
+def _refresh_materialized_days(connection, keys):
+    """
+    Incrementally refresh the availability_day rows touched by a flush.
+
+    Only dates that are already materialized are refreshed; other dates are
+    built by rebuild_availability when they enter the horizon.
+    """
+    if (None, None) in keys:
+        _materialize_days(connection, _materialized_dates(connection))
+        return
+
+    # Schedule changes: every materialized date of the professional
+    whole_professionals = {pid for pid, day in keys if day is None}
+    if whole_professionals:
+        _materialize_days(connection, _materialized_dates(connection), whole_professionals)
+
+    by_date = defaultdict(set)
+    for pid, day in keys:
+        if day is not None and pid not in whole_professionals:
+            by_date[day].add(pid)
+    if by_date:
+        for day in _materialized_dates(connection, list(by_date)):
+            _materialize_days(connection, [day], by_date[day])
+
+def _collect_availability_changes(session):
+    """
+    Collect the (professional_id, date) keys touched by pending Appointment and
+    Schedule changes and by edits to the slot settings. A date of None stands for every day of the professional
+    and a key of (None, None) for the whole cache.
+    """
+    keys = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Appointment):
+            state = inspect(obj)
+            if obj in session.dirty and not any(
+                    state.attrs[name].history.has_changes() for name in _APPOINTMENT_SLOT_FIELDS):
+                # Notes or payment updates do not change availability
+                continue
+            professional_ids = _attribute_values(state, 'professional_id')
+            dates = _attribute_values(state, 'date') or {None}
+            if not professional_ids:
+                keys.add((None, None))
+            keys.update((pid, day) for pid in professional_ids for day in dates)
+        elif isinstance(obj, Schedule):
+            state = inspect(obj)
+            professional_ids = _attribute_values(state, 'professional_id') or {None}
+            keys.update((pid, None) for pid in professional_ids)
+        elif isinstance(obj, Professional) and obj in session.dirty:
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in _PROFESSIONAL_SLOT_FIELDS):
+                keys.add((obj.id, None))
+        elif isinstance(obj, Specialty) and obj in session.dirty:
+            if inspect(obj).attrs['slot_duration'].history.has_changes():
+                # Affects every professional of the specialty
+                keys.add((None, None))
+    return keys
+
+def _attribute_values(state, attribute):
+    """Loaded value of an attribute plus the value it had before the pending change"""
+    history = state.attrs[attribute].history
+    values = set(history.added or ()) | set(history.unchanged or ()) | set(history.deleted or ())
+    values.discard(None)
+    return values
+
+def _invalidate_keys(keys):
+    for professional_id, date in keys:
+        invalidate_availability(professional_id, date)
+
+@event.listens_for(Session, 'after_flush')
+def _availability_after_flush(session, flush_context):
+    """
+    Invalidate cached availability, refresh the materialized summary and bump
+    the availability versions, in the same transaction, as soon as appointments,
+    schedules or slot settings are flushed
+    """
+    keys = _collect_availability_changes(session)
+    if keys:
+        _invalidate_keys(keys)
+        connection = session.connection()
+        _refresh_materialized_days(connection, keys)
+        _bump_availability_versions(connection, keys)
+        session.info.setdefault('availability_changes', set()).update(keys)
+
+@event.listens_for(Session, 'after_commit')
+def _availability_after_commit(session):
+    """Invalidate again once committed, in case another request cached the old state meanwhile"""
+    keys = session.info.pop('availability_changes', None)
+    if keys:
+        _invalidate_keys(keys)
+
+@event.listens_for(Session, 'after_rollback')
+def _availability_after_rollback(session):
+    session.info.pop('availability_changes', None)
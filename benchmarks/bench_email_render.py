@@ -0,0 +1,106 @@
+"""
+Rendering cost of the reminder emails.
+
+Renders the reminders of one busy day (10,000 by default) and times:
+
+* the former f-string body built from ORM instances
+* the reminder template compiled for every message, as a template that is
+  not kept would be
+* ``email_utils.render_batch`` on plain rows, joining each row's escaped
+  values with the fragments of the template, rendered once
+* ``email_utils.render_recipients``, the per-recipient substitutions of a
+  bulk SendGrid send, whose shared body is rendered once
+
+Usage:
+    python -m benchmarks.bench_email_render [--reminders N]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, time as clock
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+# Importing the app creates its tables, so it is pointed at a throwaway
+# database instead of instance/app.db first
+_database_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir.name, 'app.db')}"
+
+from app import app  # noqa: E402,F401  (initializes models)
+from email_utils import TEMPLATE_DIR, appointment_row, render_batch, render_recipients, shared_body
+from models import User, Client, Professional, Appointment
+
+DAY = date(2024, 3, 2)
+
+
+def build_appointments(reminders, seed=42):
+    """Transient appointments with their client and professional users, as the ORM loads them"""
+    rng = random.Random(seed)
+    professionals = [Professional(user=User(first_name=f'Pro{index}', last_name='Apellido', email=f'pro{index}@example.com'))
+                     for index in range(200)]
+    return [Appointment(date=DAY, start_time=clock(rng.randint(8, 19), rng.choice((0, 30))), status='confirmed',
+                        professional=rng.choice(professionals),
+                        client=Client(user=User(first_name=f'Cliente{index}', last_name='Apellido',
+                                                email=f'cliente{index}@example.com')))
+            for index in range(reminders)]
+
+
+def fstring_body(appointment):
+    """The reminder body as it was written before the templates"""
+    professional_name = appointment.professional.user.get_full_name()
+    return f'''
+    <h2>Recordatorio de Cita</h2>
+    <p>Hola {appointment.client.user.first_name},</p>
+    <p>Te recordamos que tienes una cita programada para mañana.</p>
+    <p><strong>Profesional:</strong> {professional_name}</p>
+    <p><strong>Fecha:</strong> {appointment.date.strftime('%d/%m/%Y')}</p>
+    <p><strong>Hora:</strong> {appointment.start_time.strftime('%H:%M')}</p>
+
+    <p>Si necesitas cancelar o reprogramar, por favor hazlo con al menos 24 horas de anticipación.</p>
+    <p>Gracias por usar nuestro servicio.</p>
+    '''
+
+
+def compile_every_time(rows):
+    """Render each row with a template loaded and compiled from scratch"""
+    bodies = []
+    for row in rows:
+        environment = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['html']))
+        bodies.append(environment.get_template('reminder.html').render(
+            first_name=row['first_name'], professional_name=row['professional_name'],
+            date=row['date'].strftime('%d/%m/%Y'), time=row['start_time'].strftime('%H:%M')))
+    return bodies
+
+
+def measure(action, *args):
+    """Milliseconds of ``action(*args)``"""
+    started = time.perf_counter()
+    action(*args)
+    return (time.perf_counter() - started) * 1e3
+
+
+def run(reminders):
+    appointments = build_appointments(reminders)
+    rows = [appointment_row(appointment) for appointment in appointments]
+    shared_body('reminder')
+
+    print(f"{reminders} reminders\n")
+    print(f"  {'method':<42}  {'total':>10}  {'per email':>10}")
+    for label, action, argument in (
+        ('f-string from ORM instances', lambda items: [fstring_body(item) for item in items], appointments),
+        ('template compiled per email', compile_every_time, rows[:max(reminders // 20, 1)]),
+        ('render_batch (template fragments, rows)', lambda items: render_batch('reminder', items), rows),
+        ('render_recipients (bulk substitutions)', lambda items: render_recipients('reminder', items), rows),
+    ):
+        elapsed = measure(action, argument)
+        # The per-email compile is timed on a sample and extrapolated
+        elapsed *= reminders / len(argument)
+        print(f"  {label:<42}  {elapsed:>7.1f} ms  {elapsed * 1e3 / reminders:>7.1f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reminders', type=int, default=10000)
+    run(parser.parse_args().reminders)
@@ -0,0 +1,130 @@
+"""
+Query counts of the professional listings and the specialty update.
+
+Builds a throwaway SQLite database of professionals with two or three
+specialties each and, for growing page sizes, counts the statements and
+times:
+
+* a listing page (search results / featured professionals) that shows the
+  specialties of every card, with the lazy loads it used to trigger and with
+  ``selectinload``
+* replacing a professional's specialties from the profile form, with one
+  ``get`` per selected id and with a single ``IN`` query
+
+Usage:
+    python -m benchmarks.bench_listing_queries [--professionals N]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.orm import Session, selectinload
+
+# Importing the app creates its tables, so it is pointed at a throwaway
+# database instead of instance/app.db first
+_database_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir.name, 'app.db')}"
+
+from app import app  # noqa: E402,F401  (initializes models)
+from config import Config
+from models import db, User, Professional, Specialty, professional_specialty
+
+SPECIALTIES = 40
+PAGE_SIZES = (Config.PROFESSIONALS_PER_PAGE, 24, 48, 96)
+
+
+def build_database(engine, professionals, seed=42):
+    """Create the schema and load ``professionals`` with their users and specialties"""
+    db.metadata.create_all(engine)
+    rng = random.Random(seed)
+    with engine.begin() as connection:
+        connection.execute(insert(Specialty.__table__), [
+            {'id': index, 'name': f'Especialidad {index}'} for index in range(1, SPECIALTIES + 1)])
+        connection.execute(insert(User.__table__), [
+            {'id': index, 'username': f'pro{index}', 'email': f'pro{index}@example.com',
+             'password_hash': 'unused', 'first_name': 'Pro', 'last_name': str(index),
+             'role': 'professional', 'is_active': True}
+            for index in range(1, professionals + 1)])
+        connection.execute(insert(Professional.__table__), [
+            {'id': index, 'user_id': index} for index in range(1, professionals + 1)])
+        connection.execute(insert(professional_specialty), [
+            {'professional_id': index, 'specialty_id': specialty_id}
+            for index in range(1, professionals + 1)
+            for specialty_id in rng.sample(range(1, SPECIALTIES + 1), rng.randint(2, 3))])
+
+
+class StatementCounter:
+    """Count the statements executed on an engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def render_listing(session, page_size, eager):
+    """Load one page of professionals and read every card's specialties, as the templates do"""
+    query = select(Professional, User).join(User).order_by(Professional.id).limit(page_size)
+    if eager:
+        query = query.options(selectinload(Professional.specialties))
+    return sum(len(professional.specialties) for professional, _ in session.execute(query))
+
+
+def update_specialties(session, professional, specialty_ids, bulk):
+    """Replace the specialties of a professional as the profile form does"""
+    if bulk:
+        professional.specialties = session.scalars(
+            select(Specialty).where(Specialty.id.in_(specialty_ids))).all()
+    else:
+        professional.specialties = [session.get(Specialty, specialty_id) for specialty_id in specialty_ids]
+    session.flush()
+
+
+def measure(engine, counter, action):
+    """Statements and milliseconds of ``action(session)`` on a fresh session"""
+    with Session(engine) as session:
+        counter.count = 0
+        started = time.perf_counter()
+        action(session)
+        elapsed = time.perf_counter() - started
+        session.rollback()
+    return counter.count, elapsed * 1e3
+
+
+def run(professionals):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        build_database(engine, professionals)
+        counter = StatementCounter(engine)
+
+        print(f"{professionals} professionals, {SPECIALTIES} specialties\n")
+        print("Listing page (professionals + their specialties):")
+        print(f"  {'page size':>9}  {'lazy':>18}  {'selectinload':>18}")
+        for page_size in PAGE_SIZES:
+            lazy = measure(engine, counter, lambda session: render_listing(session, page_size, False))
+            eager = measure(engine, counter, lambda session: render_listing(session, page_size, True))
+            print(f"  {page_size:>9}  {lazy[0]:>4} q {lazy[1]:>8.2f} ms  {eager[0]:>4} q {eager[1]:>8.2f} ms")
+
+        print("\nProfile update (replace the selected specialties):")
+        print(f"  {'selected':>9}  {'get() per id':>18}  {'IN query':>18}")
+        for selected in (1, 5, 10, 20):
+            specialty_ids = list(range(1, selected + 1))
+
+            def update(session, bulk):
+                update_specialties(session, session.get(Professional, 1), specialty_ids, bulk)
+
+            per_id = measure(engine, counter, lambda session: update(session, False))
+            bulk = measure(engine, counter, lambda session: update(session, True))
+            print(f"  {selected:>9}  {per_id[0]:>4} q {per_id[1]:>8.2f} ms  {bulk[0]:>4} q {bulk[1]:>8.2f} ms")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--professionals', type=int, default=500)
+    run(parser.parse_args().professionals)
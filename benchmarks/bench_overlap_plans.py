@@ -0,0 +1,175 @@
+"""
+Query plans and timings of the appointment range and overlap queries.
+
+Builds a throwaway SQLite database with a synthetic table of appointments
+(1M rows by default) and compares, before and after the starts_at/ends_at
+columns and their (professional_id, starts_at, ends_at) index:
+
+* the professional calendar query (appointments of one month)
+* the booking validation: schedule lookup and overlap check, two queries
+  before and a single EXISTS query after
+
+The "before" database has the schema that preceded the change, without the
+interval columns and with only the active slot index; the change is then
+applied to it as the migration does.
+
+Usage:
+    python -m benchmarks.bench_overlap_plans [--rows N]
+"""
+import argparse
+import os
+import random
+import tempfile
+import timeit
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import create_engine, select, insert, text
+
+# Importing the app creates its tables, so it is pointed at a throwaway
+# database instead of instance/app.db first
+_database_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir.name, 'app.db')}"
+
+from app import app  # noqa: E402,F401  (initializes models)
+from models import Appointment, Schedule, db
+
+PROFESSIONALS = 500
+PER_DAY = 5
+FIRST_DAY = date(2024, 1, 1)
+
+
+# Indexes of the appointment and schedule tables before the interval columns;
+# those added since then (the interval index and the hot query indexes) are
+# dropped so the "before" plans are the ones the change replaced
+PRE_INTERVAL_INDEXES = {'uq_appointment_active_slot'}
+
+
+def build_database(engine, rows, seed=42):
+    """
+    Create the schema as it was before the interval columns and load ``rows``
+    appointments spread over PROFESSIONALS
+    """
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        indexes = connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+            "AND tbl_name IN ('appointment', 'schedule')").scalars().all()
+        for name in indexes:
+            if name not in PRE_INTERVAL_INDEXES:
+                connection.exec_driver_sql(f'DROP INDEX {name}')
+        connection.exec_driver_sql('ALTER TABLE appointment DROP COLUMN starts_at')
+        connection.exec_driver_sql('ALTER TABLE appointment DROP COLUMN ends_at')
+
+    rng = random.Random(seed)
+    days = rows // (PROFESSIONALS * PER_DAY)
+    table = Appointment.__table__
+
+    with engine.begin() as connection:
+        connection.execute(insert(Schedule.__table__), [
+            {'professional_id': pid, 'day_of_week': day, 'start_time': time(8, 0), 'end_time': time(20, 0)}
+            for pid in range(1, PROFESSIONALS + 1) for day in range(7)
+        ])
+
+        batch = []
+        for pid in range(1, PROFESSIONALS + 1):
+            for offset in range(days):
+                day = FIRST_DAY + timedelta(days=offset)
+                for hour in sorted(rng.sample(range(8, 20), PER_DAY)):
+                    batch.append({
+                        'professional_id': pid, 'client_id': rng.randint(1, 10000), 'date': day,
+                        'start_time': time(hour, 0), 'end_time': time(hour, 45),
+                        'status': 'cancelled' if rng.random() < 0.1 else 'confirmed',
+                        'created_at': datetime.combine(day, time(hour, 0)),
+                    })
+                if len(batch) >= 50000:
+                    connection.execute(insert(table), batch)
+                    batch = []
+        if batch:
+            connection.execute(insert(table), batch)
+        connection.execute(text('ANALYZE'))
+    return days
+
+
+def add_interval_columns(engine):
+    """Apply the change: add and backfill starts_at/ends_at and create their index"""
+    with engine.begin() as connection:
+        connection.exec_driver_sql('ALTER TABLE appointment ADD COLUMN starts_at DATETIME')
+        connection.exec_driver_sql('ALTER TABLE appointment ADD COLUMN ends_at DATETIME')
+        # SQLite stores dates, times and datetimes as text, so concatenating is the combined value
+        connection.exec_driver_sql("UPDATE appointment SET starts_at = date || ' ' || start_time, "
+                                   "ends_at = date || ' ' || end_time")
+        connection.exec_driver_sql('CREATE INDEX ix_appointment_professional_starts_at '
+                                   'ON appointment (professional_id, starts_at, ends_at)')
+        connection.execute(text('ANALYZE'))
+
+
+def legacy_queries(professional_id, month_start, month_end, new):
+    """Queries as written before the interval columns"""
+    calendar = select(Appointment.id).where(
+        Appointment.professional_id == professional_id,
+        Appointment.date >= month_start,
+        Appointment.date <= month_end
+    )
+    conflict = select(Appointment.id).where(
+        Appointment.professional_id == new.professional_id,
+        Appointment.date == new.date,
+        Appointment.status != 'cancelled',
+        ((Appointment.start_time <= new.start_time) & (Appointment.end_time > new.start_time)) |
+        ((Appointment.start_time < new.end_time) & (Appointment.end_time >= new.end_time)) |
+        ((Appointment.start_time >= new.start_time) & (Appointment.end_time <= new.end_time))
+    )
+    schedule = select(Schedule.id).where(
+        Schedule.professional_id == new.professional_id,
+        Schedule.day_of_week == new.date.weekday()
+    )
+    return {'calendar': calendar, 'schedule': schedule, 'overlap': conflict}
+
+
+def interval_queries(professional_id, month_start, month_end, new):
+    """Queries on starts_at/ends_at, as used by the application"""
+    calendar = select(Appointment.id).where(
+        Appointment.professional_id == professional_id,
+        Appointment.starts_at >= datetime.combine(month_start, time.min),
+        Appointment.starts_at < datetime.combine(month_end + timedelta(days=1), time.min)
+    )
+    return {'calendar': calendar, 'schedule + overlap': new.slot_check_query()}
+
+
+def report(engine, queries, number=200):
+    with engine.connect() as connection:
+        for name, query in queries.items():
+            sql = str(query.compile(engine, compile_kwargs={'literal_binds': True}))
+            print(f"  {name}:")
+            for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}'):
+                print(f"    {row[-1]}")
+            seconds = min(timeit.repeat(lambda: connection.exec_driver_sql(sql).all(),
+                                        number=number, repeat=3)) / number
+            print(f"    -> {seconds * 1e3:.3f} ms")
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        days = build_database(engine, rows)
+
+        professional_id = PROFESSIONALS // 2
+        month_start = FIRST_DAY + timedelta(days=days // 2)
+        month_end = month_start + timedelta(days=30)
+        new = Appointment(professional_id=professional_id, date=month_start,
+                          start_time=time(10, 30), end_time=time(11, 15))
+
+        print(f"{rows} appointments, {PROFESSIONALS} professionals, {days} days\n")
+        print("Before (date/start_time/end_time, only the active slot index):")
+        report(engine, legacy_queries(professional_id, month_start, month_end, new))
+
+        add_interval_columns(engine)
+
+        print("\nAfter (starts_at/ends_at with (professional_id, starts_at, ends_at) index):")
+        report(engine, interval_queries(professional_id, month_start, month_end, new))
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    run(parser.parse_args().rows)
@@ -0,0 +1,112 @@
+"""
+Microbenchmark for the daily slot computation.
+
+Compares the previous nested slot x appointment scan with the sweep-line
+implementation in availability_utils for clinics using short slots and
+dozens of bookings per day, and the memory held by a booking window of
+slots as lists of dicts versus DaySlots minute arrays.
+
+Usage:
+    python -m benchmarks.bench_slots
+"""
+import os
+import random
+import tempfile
+import timeit
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, date, time, timedelta
+
+# Importing the app creates its tables, so it is pointed at a throwaway
+# database instead of instance/app.db first
+_database_dir = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir.name, 'app.db')}"
+
+from app import app  # noqa: E402,F401  (initializes models)
+from availability_utils import _compute_day_slots, _to_time
+
+Interval = namedtuple('Interval', ['start_time', 'end_time'])
+
+DAY = date(2025, 1, 6)
+
+
+def legacy_day_slots(schedules, appointments, duration=60):
+    """Previous O(slots x appointments) implementation, kept for comparison"""
+    slots = []
+    for schedule in schedules:
+        current_time = schedule.start_time
+        end_time = schedule.end_time
+
+        while current_time < end_time:
+            slot_end = (datetime.combine(DAY, current_time) + timedelta(minutes=duration)).time()
+
+            if slot_end > end_time:
+                slot_end = end_time
+
+            is_available = True
+            for appointment in appointments:
+                if (current_time < appointment.end_time and
+                    slot_end > appointment.start_time):
+                    is_available = False
+                    break
+
+            if is_available:
+                slots.append({'start': current_time, 'end': slot_end})
+
+            current_time = slot_end
+
+    return slots
+
+
+def build_day(duration, bookings, seed=42):
+    """Build a 08:00-20:00 working day with ``bookings`` random appointments on the slot grid"""
+    rng = random.Random(seed)
+    schedules = [Interval(time(8, 0), time(20, 0))]
+    grid = list(range(8 * 60, 20 * 60, duration))
+    appointments = []
+    for start in sorted(rng.sample(grid, min(bookings, len(grid)))):
+        end = start + duration
+        appointments.append(Interval(time(start // 60, start % 60), time(end // 60, end % 60)))
+    rng.shuffle(appointments)
+    return schedules, appointments
+
+
+def run():
+    print(f"{'slot':>5} {'bookings':>9} {'legacy (us)':>12} {'sweep (us)':>11} {'speedup':>8}")
+    for duration in (10, 15, 30, 60):
+        for bookings in (0, 12, 24, 48, 72):
+            schedules, appointments = build_day(duration, bookings)
+            assert legacy_day_slots(schedules, appointments, duration) == [
+                {'start': _to_time(start), 'end': _to_time(end)}
+                for start, end in _compute_day_slots(schedules, appointments, duration)]
+
+            number = 200
+            legacy = min(timeit.repeat(lambda: legacy_day_slots(schedules, appointments, duration),
+                                       number=number, repeat=5)) / number * 1e6
+            sweep = min(timeit.repeat(lambda: _compute_day_slots(schedules, appointments, duration),
+                                      number=number, repeat=5)) / number * 1e6
+            print(f"{duration:>5} {bookings:>9} {legacy:>12.1f} {sweep:>11.1f} {legacy / sweep:>7.1f}x")
+
+
+def measure(build):
+    """Bytes still allocated by the object returned from ``build``"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def run_memory(days=14):
+    print(f"\n{'slot':>5} {'dicts (KiB)':>12} {'DaySlots (KiB)':>15}")
+    for duration in (10, 15, 30, 60):
+        schedules, appointments = build_day(duration, 0)
+        legacy = measure(lambda: [legacy_day_slots(schedules, appointments, duration) for _ in range(days)])
+        compact = measure(lambda: [_compute_day_slots(schedules, appointments, duration) for _ in range(days)])
+        print(f"{duration:>5} {legacy / 1024:>12.1f} {compact / 1024:>15.1f}")
+
+
+if __name__ == '__main__':
+    run()
+    run_memory()
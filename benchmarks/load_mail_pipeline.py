@@ -0,0 +1,210 @@
+"""
+Load test of the booking flow and its notification pipeline.
+
+Runs the application in-process against a throwaway SQLite database and,
+for each mail transport, drives ``--concurrency`` client/professional pairs
+through the real routes: book an appointment, confirm it as the
+professional and cancel it as the client. Every step queues a status email
+in the outbox, delivered by ``--workers`` outbox threads to an in-process
+fake SendGrid API or SMTP sink, with the given latency and failure rate.
+
+Reports for each transport:
+
+* request latency (p50 / p99) of each step, and all steps together
+* end-to-end notification throughput: emails delivered per second, from
+  the first request until the outbox is drained
+* delivery delay of the emails (queued to sent, p50 / p99), retries and
+  emails given up
+
+Usage:
+    python -m benchmarks.load_mail_pipeline [--appointments N] [--concurrency N]
+        [--workers N] [--latency S] [--jitter S] [--failure-rate R]
+        [--transports sendgrid smtp]
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as clock, timedelta
+
+from fake_mail_servers import FakeSendGridServer, FakeSMTPServer
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24  # 08:00 to 20:00
+PASSWORD = 'password123'
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of ``values``"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def seed_users(pairs):
+    """One professional with a full week of schedules and one client per pair"""
+    from app import db
+    from models import User, Client, Professional, Schedule
+
+    db.drop_all()
+    db.create_all()
+    users = []
+    for index in range(pairs):
+        professional_user = User(username=f'pro{index}', email=f'pro{index}@example.com',
+                                 first_name='Pro', last_name=str(index), role='professional')
+        client_user = User(username=f'client{index}', email=f'client{index}@example.com',
+                           first_name='Cliente', last_name=str(index), role='client')
+        for user in (professional_user, client_user):
+            user.set_password(PASSWORD)
+        db.session.add_all([professional_user, client_user])
+        db.session.flush()
+        professional = Professional(user_id=professional_user.id)
+        db.session.add_all([professional, Client(user_id=client_user.id)])
+        db.session.flush()
+        db.session.add_all([Schedule(professional_id=professional.id, day_of_week=day,
+                                     start_time=clock(8, 0), end_time=clock(20, 0)) for day in range(7)])
+        users.append((professional.id, professional_user.email, client_user.email))
+    db.session.commit()
+    return users
+
+
+def logged_in(app, email):
+    browser = app.test_client()
+    response = browser.post('/login', data={'email': email, 'password': PASSWORD})
+    assert response.status_code == 302, f'login failed for {email}'
+    return browser
+
+
+def run_pair(app, professional_id, professional_email, client_email, count, latencies):
+    """Book, confirm and cancel ``count`` appointments of one professional, recording request times"""
+    from models import Appointment
+
+    professional = logged_in(app, professional_email)
+    client = logged_in(app, client_email)
+    first_day = date.today() + timedelta(days=1)
+
+    def timed(step, browser, url, data):
+        started = time.perf_counter()
+        response = browser.post(url, data=data)
+        latencies[step].append(time.perf_counter() - started)
+        assert response.status_code == 302, f'{step} answered {response.status_code}'
+
+    for index in range(count):
+        day = first_day + timedelta(days=index // SLOTS_PER_DAY)
+        start = datetime.combine(day, clock(8, 0)) + timedelta(minutes=SLOT_MINUTES * (index % SLOTS_PER_DAY))
+        end = start + timedelta(minutes=SLOT_MINUTES)
+        timed('book', client, f'/client/book_appointment/{professional_id}',
+              {'date': day.isoformat(), 'start_time': start.strftime('%H:%M'), 'end_time': end.strftime('%H:%M')})
+        with app.app_context():
+            appointment_id = Appointment.query.filter_by(
+                professional_id=professional_id, date=day, start_time=start.time()).one().id
+        timed('confirm', professional, f'/professional/update_appointment/{appointment_id}', {'status': 'confirmed'})
+        timed('cancel', client, f'/client/cancel_appointment/{appointment_id}', {})
+
+
+def wait_for_outbox(timeout):
+    """Wait until no email is pending or being sent; returns False on timeout"""
+    from app import db
+    from models import EmailOutbox
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        remaining = db.session.query(EmailOutbox.id).filter(EmailOutbox.status.in_(['pending', 'sending'])).count()
+        db.session.rollback()
+        if not remaining:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def run_transport(app, transport, options):
+    from app import db
+    from models import EmailOutbox
+    from outbox_utils import OutboxWorkerPool
+
+    fake = (FakeSendGridServer if transport == 'sendgrid' else FakeSMTPServer)(
+        latency=options.latency, jitter=options.jitter, failure_rate=options.failure_rate, seed=42)
+    with fake, app.app_context():
+        app.config.update(MAIL_TRANSPORT=transport, SENDGRID_API_KEY='fake-key', SENDGRID_API_HOST=fake.url
+                          if transport == 'sendgrid' else app.config['SENDGRID_API_HOST'],
+                          MAIL_SERVER=fake.host, MAIL_PORT=fake.port, MAIL_USE_TLS=False, MAIL_PASSWORD=None,
+                          MAIL_SUPPRESS_SEND=False)
+        users = seed_users(options.concurrency)
+        per_pair = options.appointments // options.concurrency
+        latencies = {'book': [], 'confirm': [], 'cancel': []}
+
+        pool = OutboxWorkerPool(app, options.workers)
+        pool.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options.concurrency) as executor:
+            for future in [executor.submit(run_pair, app, *user, per_pair, latencies) for user in users]:
+                future.result()
+        requests_done = time.perf_counter() - started
+        drained = wait_for_outbox(options.timeout)
+        elapsed = time.perf_counter() - started
+        pool.stop(timeout=10)
+
+        emails = EmailOutbox.query.all()
+        sent = [email for email in emails if email.status == 'sent']
+        delays = [(email.sent_at - email.created_at).total_seconds() for email in sent]
+        retries = sum(email.attempts - 1 for email in emails)
+        dead = sum(email.status == 'dead' for email in emails)
+        db.session.remove()
+
+    all_requests = [value for values in latencies.values() for value in values]
+    print(f"\n{transport}: {per_pair * options.concurrency} appointments, {len(all_requests)} requests, "
+          f"{len(emails)} emails{'' if drained else ' (outbox NOT drained before the timeout)'}")
+    print(f"  {'requests':<10}  {'p50':>9}  {'p99':>9}")
+    for step, values in list(latencies.items()) + [('all', all_requests)]:
+        print(f"  {step:<10}  {percentile(values, 0.5) * 1e3:>6.1f} ms  {percentile(values, 0.99) * 1e3:>6.1f} ms")
+    print(f"  requests finished in {requests_done:.1f} s ({len(all_requests) / requests_done:.0f} req/s)")
+    print(f"  {len(sent)} emails delivered in {elapsed:.1f} s: {len(sent) / elapsed:.0f} emails/s end to end")
+    if delays:
+        print(f"  delivery delay p50 {statistics.median(delays) * 1e3:.0f} ms, p99 {percentile(delays, 0.99) * 1e3:.0f} ms")
+    print(f"  fake {transport}: {fake.requests} requests, {fake.failures} injected failures; "
+          f"{retries} retries, {dead} emails given up")
+
+
+def run(options):
+    with tempfile.TemporaryDirectory() as directory:
+        # The app reads DATABASE_URL when imported, so it is imported once the throwaway database is set
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'load.db')}"
+        from sqlalchemy import event
+        from app import app, db
+
+        app.secret_key = 'load-test'
+        # Injected failures are counted in the report instead of logged one by one
+        logging.getLogger('outbox_utils').setLevel(logging.ERROR)
+        app.config.update(WTF_CSRF_ENABLED=False, EMAIL_OUTBOX_WORKERS=0, EMAIL_OUTBOX_POLL_INTERVAL=0.05,
+                          EMAIL_OUTBOX_BACKOFF=options.backoff, EMAIL_OUTBOX_BACKOFF_MAX=options.backoff * 8)
+        with app.app_context():
+            # Requests and outbox workers write concurrently: let SQLite readers and the writer overlap
+            @event.listens_for(db.engine, 'connect')
+            def set_sqlite_pragmas(connection, record):
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA busy_timeout=30000')
+            db.engine.dispose()
+
+        print(f"{options.appointments} appointments by {options.concurrency} concurrent pairs, "
+              f"{options.workers} outbox workers, fake latency {options.latency * 1e3:.0f} ms "
+              f"(+ up to {options.jitter * 1e3:.0f} ms), failure rate {options.failure_rate:.0%}")
+        for transport in options.transports:
+            run_transport(app, transport, options)
+        with app.app_context():
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--appointments', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added by the fake server to every request')
+    parser.add_argument('--jitter', type=float, default=0.02, help='up to this many extra seconds per request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests the fake server rejects')
+    parser.add_argument('--backoff', type=float, default=0.1, help='first retry delay of the outbox, in seconds')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds to wait for the outbox to drain')
+    parser.add_argument('--transports', nargs='+', choices=['sendgrid', 'smtp'], default=['sendgrid', 'smtp'])
+    run(parser.parse_args())
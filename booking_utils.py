@@ -0,0 +1,100 @@
+"""
+Atomic appointment booking.
+"""
+import logging
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app import db
+from models import Professional
+
+logger = logging.getLogger(__name__)
+
+class BookingError(Exception):
+    """Base class for bookings rejected by the database checks"""
+
+class OutsideScheduleError(BookingError):
+    """The requested time is outside the professional's schedule"""
+
+class SlotTakenError(BookingError):
+    """The requested time overlaps another appointment"""
+
+class BookingBusyError(BookingError):
+    """The professional's bookings stayed locked by other requests past the lock timeout"""
+
+def _lock_professional(professional_id):
+    """
+    Serialize the bookings of a professional until the transaction ends.
+
+    Bumping the professional's availability_version is the first write of the
+    transaction: PostgreSQL keeps the row locked until commit, like
+    ``SELECT ... FOR UPDATE``, and SQLite takes its write lock, as
+    ``BEGIN IMMEDIATE`` would, waiting up to the busy timeout. Concurrent
+    bookings of the same professional therefore check for conflicts one after
+    the other and always see each other's appointments.
+
+    Returns:
+        int: The professional's slot buffer in minutes, read by the same statement
+    """
+    professional_table = Professional.__table__
+    return db.session.execute(
+        update(professional_table)
+        .where(professional_table.c.id == professional_id)
+        .values(availability_version=professional_table.c.availability_version + 1)
+        .returning(professional_table.c.slot_buffer)
+    ).scalar() or 0
+
+def reserve_appointment(appointment, before_commit=None):
+    """
+    Validate and insert an appointment atomically.
+
+    The schedule and conflict checks run while holding the professional's
+    lock, keeping the professional's slot buffer free around the new
+    appointment, and the partial unique index on active slots rejects duplicates
+    written by any other code path. The transaction is committed on success
+    and rolled back when the booking is rejected. When waiting for the lock
+    times out (SQLite's busy timeout, PostgreSQL's lock timeout) the attempt
+    is rolled back and retried up to ``BOOKING_LOCK_RETRIES`` times.
+
+    Args:
+        appointment (Appointment): New, not yet added appointment
+        before_commit (callable, optional): Called with the flushed appointment
+            just before committing, to write related rows such as queued
+            emails in the same transaction
+
+    Returns:
+        Appointment: The committed appointment
+
+    Raises:
+        OutsideScheduleError: If the time is outside the professional's schedule
+        SlotTakenError: If the time overlaps another active appointment
+        BookingBusyError: If the lock could not be taken after every retry
+    """
+    retries = current_app.config['BOOKING_LOCK_RETRIES']
+    for attempt in range(retries + 1):
+        try:
+            buffer = _lock_professional(appointment.professional_id)
+            within_schedule, has_conflict = appointment.check_slot(buffer)
+            if not within_schedule:
+                raise OutsideScheduleError()
+            if has_conflict:
+                raise SlotTakenError()
+
+            db.session.add(appointment)
+            if before_commit is not None:
+                db.session.flush()
+                before_commit(appointment)
+            db.session.commit()
+            return appointment
+        except BookingError:
+            db.session.rollback()
+            raise
+        except IntegrityError:
+            db.session.rollback()
+            raise SlotTakenError() from None
+        except OperationalError as e:
+            db.session.rollback()
+            logger.warning(f"Booking lock of professional {appointment.professional_id} timed out "
+                           f"(attempt {attempt + 1} of {retries + 1}): {e}")
+
+    raise BookingBusyError()
@@ -0,0 +1,183 @@
+"""
+In-process caching helpers shared by the application modules.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a bounded number of entries.
+
+    Entries optionally expire after ``ttl`` seconds. Every invalidation bumps
+    ``generation`` so a value computed from data read before the invalidation
+    can be discarded instead of being stored (see ``set``).
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key`` or ``default`` when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, generation=None):
+        """
+        Store a value, evicting the least recently used entries beyond ``max_entries``
+
+        Args:
+            key: Cache key
+            value: Value to store
+            generation (int, optional): Generation read before computing the value;
+                the value is dropped if the cache was invalidated in the meantime
+
+        Returns:
+            bool: True if the value was stored
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def delete(self, key):
+        """Remove a single entry"""
+        with self._lock:
+            self.generation += 1
+            self._entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        """Remove every entry whose key matches ``predicate``"""
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RedisCache:
+    """
+    Cache of JSON-serializable values kept in Redis and shared by every process.
+
+    Offers the ``get``/``set``/``delete`` interface of ``LRUCache``, so a
+    deletion made by one worker process is seen by all of them. Requires the
+    ``redis`` package.
+    """
+
+    def __init__(self, url, prefix, ttl=None):
+        import redis  # optional dependency, only needed when a shared cache is configured
+
+        self.prefix = prefix
+        self.ttl = ttl
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key`` or ``default`` when missing or expired"""
+        value = self._client.get(self._key(key))
+        return default if value is None else json.loads(value)
+
+    def set(self, key, value):
+        """Store a value, expiring after ``ttl`` seconds when set"""
+        self._client.set(self._key(key), json.dumps(value), ex=self.ttl)
+        return True
+
+    def delete(self, key):
+        """Remove a single entry"""
+        self._client.delete(self._key(key))
+
+class Snapshot:
+    """
+    Single value recomputed at most once every ``ttl`` seconds.
+
+    The first call computes the value synchronously. Afterwards an expired
+    snapshot keeps being served while one background thread recomputes it,
+    so readers never wait for the loader and at most one load runs at a time.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._value = _MISSING
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def get(self, loader):
+        """
+        Return the snapshot, loading or scheduling a refresh with ``loader``
+
+        Args:
+            loader (callable): Computes the value; runs in a background
+                thread on refreshes, so it must set up its own context
+
+        Returns:
+            The current, possibly slightly stale, value
+        """
+        with self._lock:
+            value = self._value
+            if value is not _MISSING and time.monotonic() - self._loaded_at >= self.ttl and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, args=(loader,), daemon=True).start()
+        if value is not _MISSING:
+            return value
+
+        with self._load_lock:
+            if self._value is _MISSING:
+                self._store(loader())
+            return self._value
+
+    def invalidate(self):
+        """Force the next call to load synchronously"""
+        with self._lock:
+            self._value = _MISSING
+
+    def _refresh(self, loader):
+        try:
+            with self._load_lock:
+                self._store(loader())
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _store(self, value):
+        with self._lock:
+            self._value = value
+            self._loaded_at = time.monotonic()
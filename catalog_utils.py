@@ -0,0 +1,107 @@
+"""
+Versioned in-process cache of the specialty catalogue.
+"""
+import threading
+from sqlalchemy import event, inspect, select, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app import db
+from models import Specialty, CacheVersion
+
+SPECIALTY_CATALOG = 'specialty'
+
+# Choices built from the last loaded catalogue and the version they match.
+# Every process compares it with the counter in cache_version, which is
+# bumped in the same transaction as any Specialty write, so workers reload
+# only after a real change, whichever process made it.
+_specialties = {'version': None, 'choices': ()}
+_lock = threading.Lock()
+
+# INSERT ... ON CONFLICT DO UPDATE of the dialects that have it
+_UPSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+def catalog_version(name):
+    """
+    Get the current version of a catalogue
+
+    Args:
+        name (str): Catalogue name, e.g. ``SPECIALTY_CATALOG``
+
+    Returns:
+        int: Version counter, 0 if the catalogue was never changed
+    """
+    return db.session.scalar(select(CacheVersion.version).where(CacheVersion.name == name)) or 0
+
+def specialty_choices():
+    """
+    Get the specialties as ``(id, name)`` choices ordered by name
+
+    Returns:
+        tuple: Choices shared between requests; copy before modifying
+    """
+    version = catalog_version(SPECIALTY_CATALOG)
+    with _lock:
+        if _specialties['version'] == version:
+            return _specialties['choices']
+
+    choices = tuple(map(tuple, db.session.execute(select(Specialty.id, Specialty.name).order_by(Specialty.name))))
+    with _lock:
+        _specialties.update(version=version, choices=choices)
+    return choices
+
+def invalidate_specialties():
+    """Drop the cached specialties of this process"""
+    with _lock:
+        _specialties.update(version=None, choices=())
+
+def _bump_catalog_version(connection, name):
+    """
+    Increment the version of a catalogue, creating its counter on first use
+
+    Where the dialect supports it this is a single upsert, so concurrent first
+    writes of a catalogue cannot both insert its counter.
+    """
+    table = CacheVersion.__table__
+    upsert = _UPSERTS.get(connection.dialect.name)
+    if upsert is not None:
+        connection.execute(
+            upsert(table).values(name=name, version=1)
+            .on_conflict_do_update(index_elements=[table.c.name], set_={'version': table.c.version + 1}))
+        return
+
+    result = connection.execute(
+        update(table).where(table.c.name == name).values(version=table.c.version + 1))
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(name=name, version=1))
+
+def _changes_catalog(session, obj):
+    """Whether a pending change alters the (id, name) choices"""
+    if not isinstance(obj, Specialty):
+        return False
+    if obj in session.dirty:
+        # Edits to the description, slot duration or professionals keep the choices
+        return inspect(obj).attrs['name'].history.has_changes()
+    return True
+
+@event.listens_for(CacheVersion.__table__, 'after_create')
+def _catalog_versions_created(target, connection, **kw):
+    """A new cache_version table restarts the counters, so cached versions mean nothing"""
+    invalidate_specialties()
+
+@event.listens_for(Session, 'after_flush')
+def _specialties_after_flush(session, flush_context):
+    """Bump the specialty catalogue version when specialties are added, renamed or deleted"""
+    if any(_changes_catalog(session, obj) for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        _bump_catalog_version(session.connection(), SPECIALTY_CATALOG)
+        invalidate_specialties()
+        session.info['specialties_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _specialties_after_commit(session):
+    """Invalidate again once committed, in case another request cached the old catalogue meanwhile"""
+    if session.info.pop('specialties_changed', False):
+        invalidate_specialties()
+
+@event.listens_for(Session, 'after_rollback')
+def _specialties_after_rollback(session):
+    session.info.pop('specialties_changed', None)
@@ -21,9 +21,12 @@ class Config:
     MAIL_USERNAME = 'apikey'
     MAIL_PASSWORD = os.environ.get('SENDGRID_API_KEY')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'noreply@appointmentmanager.com')
+    MAIL_TIMEOUT = 30  # seconds to connect to the SMTP server
+    MAIL_TRANSPORT = os.environ.get('MAIL_TRANSPORT', 'auto')  # sendgrid, smtp, or auto: SendGrid when SENDGRID_API_KEY is set
     
     # SendGrid configuration
     SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
+    SENDGRID_API_HOST = os.environ.get('SENDGRID_API_HOST', 'https://api.sendgrid.com')
     
     # PayPal configuration
     PAYPAL_CLIENT_ID = os.environ.get('PAYPAL_CLIENT_ID')
@@ -40,5 +43,26 @@ class Config:
     APPOINTMENTS_PER_PAGE = 10
     PROFESSIONALS_PER_PAGE = 12
     DEFAULT_APPOINTMENT_DURATION = 60  # minutes
+    BOOKING_WINDOW_DAYS = 14  # days of availability shown on the booking page
+    BOOKING_LOCK_RETRIES = 2  # extra attempts when waiting for the professional's booking lock times out
+    AVAILABILITY_API_MAX_DAYS = 31  # longest range served by the availability JSON endpoint
+    CALENDAR_MAX_RANGE_DAYS = 62  # longest range served by the professional calendar feed
+    ADMIN_STATS_TTL = 60  # seconds between refreshes of the admin dashboard counts
+    AVAILABILITY_CACHE_SIZE = 20000  # cached (professional, day) entries per process
+    AVAILABILITY_CACHE_TTL = 300  # seconds
+    AVAILABILITY_HORIZON_DAYS = 60  # days kept in the materialized availability table
+    USER_CACHE_SIZE = 10000  # cached session users per process
+    USER_CACHE_TTL = 60  # seconds a cached user record is kept before it is read again
+    USER_CACHE_REDIS_URL = os.environ.get('USER_CACHE_REDIS_URL')  # share the user cache between processes
+    FIRST_AVAILABLE_MAX_RESULTS = 50  # cap for the earliest-available-slot search
+    EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS', '2'))  # delivery threads per process, 0 to disable
+    EMAIL_OUTBOX_BATCH_SIZE = 20  # emails claimed by a worker at a time
+    EMAIL_OUTBOX_POLL_INTERVAL = 5  # seconds between checks when the outbox is idle
+    EMAIL_OUTBOX_MAX_ATTEMPTS = 6  # deliveries tried before an email is dead-lettered
+    EMAIL_OUTBOX_BACKOFF = 30  # seconds before the first retry, doubled on every further attempt
+    EMAIL_OUTBOX_BACKOFF_MAX = 3600  # longest wait between retries, in seconds
+    EMAIL_OUTBOX_LEASE = 300  # seconds a claimed email stays reserved for its worker, renewed before each send
+    REMINDER_BATCH_SIZE = 1000  # reminders per SendGrid request, the API maximum of personalizations
+    REMINDER_JOB_LEASE = 300  # seconds without a checkpoint before a running reminder job is resumed elsewhere
     ENABLE_PAYMENT = True  # Enable payment functionality
     APPOINTMENT_COST = 50  # Default cost in currency units
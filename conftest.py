@@ -0,0 +1,17 @@
+"""
+Pytest setup shared by the test modules.
+
+The app reads DATABASE_URL when it is first imported, so the suite points it
+at a throwaway SQLite file before any test module imports the app: the tests
+drop and recreate every table and must never touch instance/app.db. A file,
+rather than ``:memory:``, lets the concurrency tests share the database
+between threads.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+_directory = tempfile.mkdtemp(prefix='gestor-citas-tests-')
+atexit.register(shutil.rmtree, _directory, ignore_errors=True)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory, 'test.db')}"
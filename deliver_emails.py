@@ -0,0 +1,47 @@
+"""Script para entregar los correos pendientes de la bandeja de salida
+
+Los procesos web entregan el outbox (tabla email_outbox) con sus propios
+hilos en segundo plano. Este script permite hacerlo desde un proceso
+dedicado, por ejemplo con EMAIL_OUTBOX_WORKERS=0 en los servidores web, o
+vaciar la cola una sola vez.
+
+Uso:
+    python deliver_emails.py [--workers N] [--once] [--requeue-dead]
+"""
+import argparse
+import signal
+import threading
+from app import app
+from outbox_utils import OutboxWorkerPool, deliver_pending, requeue_dead_emails
+
+def main():
+    parser = argparse.ArgumentParser(description='Entrega los correos pendientes del outbox')
+    parser.add_argument('--workers', type=int, default=max(app.config['EMAIL_OUTBOX_WORKERS'], 1),
+                        help='Número de hilos de entrega')
+    parser.add_argument('--once', action='store_true',
+                        help='Entregar los correos ya vencidos y terminar')
+    parser.add_argument('--requeue-dead', action='store_true',
+                        help='Volver a encolar los correos descartados tras agotar los reintentos')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.requeue_dead:
+            print(f"Correos reencolados: {requeue_dead_emails()}")
+        if args.once:
+            total = 0
+            while (delivered := deliver_pending()):
+                total += delivered
+            print(f"Correos procesados: {total}")
+            return
+
+    pool = OutboxWorkerPool(app, args.workers)
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    pool.start()
+    print(f"Entregando correos con {args.workers} hilos (Ctrl+C para detener)")
+    stop.wait()
+    pool.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Email bodies rendered from the Jinja templates in templates/email/.
+"""
+import os
+import re
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader, meta, select_autoescape
+from markupsafe import escape
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+
+STATUS_LABELS = {
+    'pending': 'Pendiente',
+    'confirmed': 'Confirmada',
+    'cancelled': 'Cancelada',
+    'completed': 'Completada'
+}
+
+SUBJECTS = {
+    'confirmation': 'Confirmación de Cita con {professional_name}',
+    'reminder': 'Recordatorio de Cita con {professional_name}',
+}
+
+# Values every email template receives, one per recipient
+CONTEXT_FIELDS = ('first_name', 'professional_name', 'date', 'time', 'status_label')
+
+# The ``-field-`` tag of every context field in a shared body
+_TAG = re.compile('-(' + '|'.join(CONTEXT_FIELDS) + ')-')
+
+# Rows rendered both by Jinja and from the fragments when an email's
+# fragments are built: values that differ per field and need escaping, with
+# each status label in turn
+_PROBES = tuple(
+    {**{field: f'<{field}> & "{field}"' for field in CONTEXT_FIELDS}, 'status_label': label}
+    for label in STATUS_LABELS.values()
+)
+
+# Independent of the Flask app so workers render without an app or request
+# context. With auto_reload off a template is compiled on first use and
+# never checked on disk again.
+_environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+)
+
+def appointment_row(appointment):
+    """
+    Build the plain row the email templates are rendered from
+
+    Args:
+        appointment (Appointment): Appointment with its client and professional users
+
+    Returns:
+        dict: ``email``, ``first_name``, ``professional_name``, ``date``,
+        ``start_time`` and ``status``
+    """
+    return {
+        'email': appointment.client.user.email,
+        'first_name': appointment.client.user.first_name,
+        'professional_name': appointment.professional.user.get_full_name(),
+        'date': appointment.date,
+        'start_time': appointment.start_time,
+        'status': appointment.status,
+    }
+
+def _contexts(rows):
+    """Template values of every row; dates and times repeat within a batch, so each is formatted once"""
+    dates = {}
+    times = {}
+    for row in rows:
+        day = row['date']
+        start = row['start_time']
+        if day not in dates:
+            dates[day] = day.strftime('%d/%m/%Y')
+        if start not in times:
+            times[start] = start.strftime('%H:%M')
+        yield row, {
+            'first_name': row['first_name'],
+            'professional_name': row['professional_name'],
+            'date': dates[day],
+            'time': times[start],
+            'status_label': STATUS_LABELS.get(row['status'], row['status']),
+        }
+
+def get_template(name):
+    """Compiled template of an email, e.g. ``'reminder'``"""
+    return _environment.get_template(f'{name}.html')
+
+def render_batch(name, rows):
+    """
+    Render one email per row
+
+    The template is rendered once, through ``_fragments``; each email then
+    only escapes its own values and joins them with the static text.
+
+    Args:
+        name (str): Email name, ``'confirmation'`` or ``'reminder'``
+        rows (iterable): Rows shaped as ``appointment_row`` returns them
+
+    Returns:
+        list: ``(recipient, subject, html_body)`` tuples, in the order of ``rows``
+    """
+    head, tail = _fragments(name)
+    subject = SUBJECTS[name]
+    messages = []
+    for row, context in _contexts(rows):
+        pieces = [head]
+        for field, text in tail:
+            pieces.append(escape(context[field]))
+            pieces.append(text)
+        messages.append((row['email'], subject.format(**context), ''.join(pieces)))
+    return messages
+
+def render_email(name, row):
+    """
+    Render a single email
+
+    Returns:
+        tuple: ``(recipient, subject, html_body)``
+    """
+    return render_batch(name, [row])[0]
+
+@lru_cache(maxsize=None)
+def shared_body(name):
+    """
+    Body of an email with a ``-field-`` tag in place of every per-recipient value
+
+    Bulk sends deliver this body once and fill the tags of each recipient
+    with the values of ``render_recipients``.
+    """
+    return get_template(name).render({field: f'-{field}-' for field in CONTEXT_FIELDS})
+
+@lru_cache(maxsize=None)
+def _fragments(name):
+    """
+    An email split around its fields: the text before the first field, then
+    ``(field, text after it)`` pairs
+
+    Built from ``shared_body(name)``, which the templates allow because they
+    only print their fields, without logic on them, as bulk sends require.
+    A template that filters a field or tests it in a condition is rejected:
+    every field it uses must show up as its tag, and the fragments filled
+    with each probe row must be what Jinja renders for that row.
+
+    Raises:
+        ValueError: If the template cannot be rendered from its fragments
+    """
+    parts = _TAG.split(shared_body(name))
+    head, tail = parts[0], tuple(zip(parts[1::2], parts[2::2]))
+
+    source = _environment.loader.get_source(_environment, f'{name}.html')[0]
+    used = meta.find_undeclared_variables(_environment.parse(source)) & set(CONTEXT_FIELDS)
+    missing = sorted(used.difference(field for field, _ in tail))
+    if missing:
+        raise ValueError(f"Email template {name} does not print {', '.join(missing)} as is")
+
+    template = get_template(name)
+    for probe in _PROBES:
+        if ''.join([head, *(str(escape(probe[field])) + text for field, text in tail)]) != template.render(probe):
+            raise ValueError(f"Email template {name} has logic on its fields and cannot be rendered in bulk")
+    return head, tail
+
+def render_recipients(name, rows):
+    """
+    Recipients of a bulk send of an email
+
+    Args:
+        name (str): Email name
+        rows (iterable): Rows shaped as ``appointment_row`` returns them
+
+    Returns:
+        list: Dicts with ``email``, ``subject`` and the escaped ``substitutions``
+        of the tags of ``shared_body(name)``
+    """
+    subject = SUBJECTS[name]
+    recipients = []
+    for row, context in _contexts(rows):
+        recipients.append({
+            'email': row['email'],
+            'subject': subject.format(**context),
+            'substitutions': {f'-{field}-': str(escape(value)) for field, value in context.items()},
+        })
+    return recipients
+
+def fill_substitutions(html_body, substitutions):
+    """
+    Replace the ``-field-`` tags of a shared body with the values of one recipient
+
+    Every tag is replaced in a single pass, so a value that contains a tag,
+    e.g. a first name of ``-date-``, is inserted as is.
+    """
+    return _TAG.sub(lambda match: substitutions[match.group(0)], html_body)
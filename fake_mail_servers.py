@@ -0,0 +1,191 @@
+"""
+In-process stand-ins for SendGrid's HTTP API and an SMTP server.
+
+Both run on a local port in a background thread, accept what the mail
+transports send them and keep it for inspection. They can add latency to
+every request and reject a fraction of them, to test and load-test the
+email pipeline without reaching real services.
+
+Usage:
+    with FakeSendGridServer(latency=0.05, failure_rate=0.01) as sendgrid:
+        app.config.update(MAIL_TRANSPORT='sendgrid', SENDGRID_API_KEY='fake',
+                          SENDGRID_API_HOST=sendgrid.url)
+
+    with FakeSMTPServer(latency=0.02) as smtp:
+        app.config.update(MAIL_TRANSPORT='smtp', MAIL_SERVER=smtp.host, MAIL_PORT=smtp.port,
+                          MAIL_USE_TLS=False, MAIL_SUPPRESS_SEND=False)
+"""
+import email
+import email.policy
+import json
+import random
+import socketserver
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _FakeServer(ABC):
+    """Latency and failure injection, start/stop and the received messages of a fake server"""
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.host = '127.0.0.1'
+        self.requests = 0
+        self.failures = 0
+        self.messages = []  # (recipient, subject) of every accepted email
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def _handle(self, messages):
+        """Wait the injected latency, then accept ``messages`` or fail; returns True if accepted"""
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.requests += 1
+            if fail:
+                self.failures += 1
+            else:
+                self.messages.extend(messages)
+        return not fail
+
+    @abstractmethod
+    def _create_server(self):
+        """The socket server, bound to a free port of ``host``"""
+
+    def start(self):
+        self._server = self._create_server()
+        self._thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class FakeSendGridServer(_FakeServer):
+    """
+    Fake of SendGrid's ``POST /v3/mail/send``.
+
+    Answers 202 like SendGrid, or 503 for injected failures. Point
+    ``SENDGRID_API_HOST`` at ``url``.
+    """
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def _create_server(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path != '/v3/mail/send':
+                    self._reply(404, {'errors': [{'message': 'Not found'}]})
+                    return
+                message = json.loads(body)
+                recipients = [(to['email'], personalization.get('subject', message.get('subject')))
+                              for personalization in message['personalizations'] for to in personalization['to']]
+                if fake._handle(recipients):
+                    self._reply(202)
+                else:
+                    self._reply(503, {'errors': [{'message': 'Injected failure'}]})
+
+            def _reply(self, status, payload=None):
+                body = json.dumps(payload).encode() if payload else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((self.host, 0), Handler)
+        server.daemon_threads = True
+        return server
+
+
+class FakeSMTPServer(_FakeServer):
+    """
+    SMTP sink speaking enough of the protocol for ``smtplib``.
+
+    Accepts any AUTH PLAIN credentials and answers injected failures with a
+    temporary 451 error after the message data.
+    """
+
+    def _create_server(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b'\r\n')
+
+            def handle(self):
+                self.reply('220 fake-smtp ESMTP')
+                recipients = []
+                for raw in self.rfile:
+                    command = raw.decode(errors='replace').strip()
+                    verb = command[:4].upper()
+                    if verb == 'EHLO':
+                        self.reply('250-fake-smtp')
+                        self.reply('250-AUTH PLAIN')
+                        self.reply('250 8BITMIME')
+                    elif verb == 'HELO':
+                        self.reply('250 fake-smtp')
+                    elif verb == 'AUTH':
+                        self.reply('235 2.7.0 Authentication successful')
+                    elif verb == 'MAIL':
+                        recipients = []
+                        self.reply('250 OK')
+                    elif verb == 'RCPT':
+                        recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                        self.reply('250 OK')
+                    elif verb == 'DATA':
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        subject = self.read_subject()
+                        if fake._handle([(recipient, subject) for recipient in recipients]):
+                            self.reply('250 OK')
+                        else:
+                            self.reply('451 4.3.0 Injected failure')
+                    elif verb in ('RSET', 'NOOP'):
+                        self.reply('250 OK')
+                    elif verb == 'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('502 Command not implemented')
+
+            def read_subject(self):
+                lines = []
+                for line in self.rfile:
+                    if line == b'.\r\n':
+                        break
+                    lines.append(line[1:] if line.startswith(b'..') else line)
+                return email.message_from_bytes(b''.join(lines), policy=email.policy.default)['Subject']
+
+        server = socketserver.ThreadingTCPServer((self.host, 0), Handler)
+        server.daemon_threads = True
+        return server
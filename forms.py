@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, TextAreaField, SelectField
 from wtforms import DateField, TimeField, SelectMultipleField, IntegerField, SubmitField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, ValidationError
+from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, ValidationError, NumberRange
 from models import User
 
 class LoginForm(FlaskForm):
@@ -49,6 +49,8 @@ class ProfessionalProfileForm(FlaskForm):
     years_experience = IntegerField('Años de Experiencia', validators=[Optional()])
     specialties = SelectMultipleField('Especialidades', coerce=int)
     accepts_insurance = BooleanField('Acepta Seguros')
+    slot_duration = IntegerField('Duración de las Citas (minutos)', validators=[Optional(), NumberRange(min=5, max=240)])
+    slot_buffer = IntegerField('Descanso entre Citas (minutos)', validators=[Optional(), NumberRange(min=0, max=120)])
     submit = SubmitField('Guardar Cambios')
 
 class ScheduleForm(FlaskForm):
@@ -78,11 +80,21 @@ class AppointmentForm(FlaskForm):
 class SearchForm(FlaskForm):
     specialty = SelectField('Especialidad', coerce=int)
     date = DateField('Fecha', validators=[Optional()])
+    date_end = DateField('Hasta', validators=[Optional()])
+    sort = SelectField('Ordenar por', choices=[
+        ('', 'Relevancia'),
+        ('availability', 'Mayor disponibilidad')
+    ], validators=[Optional()])
     submit = SubmitField('Buscar')
+    
+    def validate_date_end(self, date_end):
+        if date_end.data and self.date.data and date_end.data < self.date.data:
+            raise ValidationError('La fecha final debe ser posterior a la fecha inicial.')
 
 class SpecialtyForm(FlaskForm):
     name = StringField('Nombre', validators=[DataRequired(), Length(max=100)])
     description = TextAreaField('Descripción', validators=[Optional(), Length(max=500)])
+    slot_duration = IntegerField('Duración de las Citas (minutos)', validators=[Optional(), NumberRange(min=5, max=240)])
     submit = SubmitField('Guardar Especialidad')
 
 class ChangePasswordForm(FlaskForm):
@@ -11,6 +11,7 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from flask import current_app, url_for, session, redirect, request
 from models import Appointment
+from email_utils import STATUS_LABELS
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -174,10 +175,4 @@ def add_appointment_to_calendar(appointment_id):
 
 def get_status_display(status):
     """Convert status code to display text"""
-    status_map = {
-        'pending': 'Pendiente',
-        'confirmed': 'Confirmada',
-        'cancelled': 'Cancelada',
-        'completed': 'Completada'
-    }
-    return status_map.get(status, status)
\ No newline at end of file
+    return STATUS_LABELS.get(status, status)
@@ -0,0 +1,180 @@
+"""
+Cached user loading for Flask-Login.
+"""
+from flask_login import UserMixin
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import PendingRollbackError
+from sqlalchemy.orm import Session
+from app import db
+from cache_utils import LRUCache
+from config import Config
+from models import User
+
+# Columns copied into the cached record; the password hash is never cached
+_CACHED_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'phone', 'role', 'is_active')
+
+# Changes to these columns drop the cached record of the user
+_WATCHED_FIELDS = _CACHED_FIELDS + ('password_hash',)
+
+# Records keyed by user id, served without querying the database. Changes
+# drop the record of the user once committed; with this per-process default
+# other worker processes see a change when their copy expires after
+# USER_CACHE_TTL. A cache shared by every process, set with
+# ``set_user_cache`` (``USER_CACHE_REDIS_URL`` in app.py), makes each change
+# seen by all of them on their next request.
+user_cache = LRUCache(max_entries=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+
+
+class CachedUser(UserMixin):
+    """
+    Lightweight stand-in for ``User`` built from a cached record.
+
+    The cached columns and role checks are answered without touching the
+    database. Any other attribute, and every assignment, goes to the ``User``
+    row, which is loaded on first use, so code writing to ``current_user``
+    keeps working within the request's session.
+    """
+
+    def __init__(self, record):
+        object.__setattr__(self, '_record', dict(record))
+        object.__setattr__(self, '_user', None)
+
+    @property
+    def user(self):
+        """The ``User`` row, loaded on first access"""
+        if self._user is None:
+            object.__setattr__(self, '_user', db.session.get(User, self._record['id']))
+        return self._user
+
+    def attach(self, user):
+        """Use an already loaded ``User`` row instead of loading it on first access"""
+        if user.id == self._record['id']:
+            object.__setattr__(self, '_user', user)
+
+    @property
+    def is_active(self):
+        return bool(self._record['is_active'])
+
+    def get_id(self):
+        return str(self._record['id'])
+
+    def get_full_name(self):
+        return f"{self._record['first_name']} {self._record['last_name']}"
+
+    def is_professional(self):
+        return self._record['role'] == 'professional'
+
+    def is_admin(self):
+        return self._record['role'] == 'admin'
+
+    def is_client(self):
+        return self._record['role'] == 'client'
+
+    def __getattr__(self, name):
+        record = self.__dict__['_record']
+        if name in record:
+            return record[name]
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.user, name, value)
+        if name in self._record:
+            self._record[name] = value
+
+    def __eq__(self, other):
+        if isinstance(other, (CachedUser, User)):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+
+def set_user_cache(cache):
+    """
+    Replace the per-process cache of user records
+
+    Args:
+        cache: Object with ``get(key)``, ``set(key, value)`` and ``delete(key)``
+            storing plain dicts, such as an adapter over a shared cache server
+    """
+    global user_cache
+    user_cache = cache
+
+def _read_record(user_id):
+    columns = [getattr(User, name) for name in _CACHED_FIELDS]
+    return db.session.execute(select(*columns).where(User.id == user_id)).first()
+
+def load_user(user_id):
+    """
+    Load the session user from the cache, reading the database on a miss
+
+    Args:
+        user_id (str): User ID stored in the session
+
+    Returns:
+        CachedUser: The user, or None if it does not exist or is deactivated
+    """
+    user_id = int(user_id)
+    cache = user_cache
+    record = cache.get(user_id)
+    if record is None:
+        generation = getattr(cache, 'generation', None)
+        try:
+            row = _read_record(user_id)
+        except PendingRollbackError:
+            # Si hay una transacción pendiente, hacemos rollback y reintentamos
+            db.session.rollback()
+            row = _read_record(user_id)
+        if row is None:
+            return None
+        record = dict(zip(_CACHED_FIELDS, row))
+        if generation is not None:
+            cache.set(user_id, record, generation=generation)
+        else:
+            cache.set(user_id, record)
+
+    if not record['is_active']:
+        # Deactivated accounts are signed out on their next request
+        return None
+    return CachedUser(record)
+
+def invalidate_user(user_id):
+    """Drop the cached record of a user"""
+    user_cache.delete(user_id)
+
+def _collect_user_changes(session):
+    """IDs of the users whose cached columns change or who are deleted in this flush"""
+    user_ids = set()
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, User) or obj.id is None:
+            continue
+        if obj in session.deleted or any(
+                inspect(obj).attrs[name].history.has_changes() for name in _WATCHED_FIELDS):
+            user_ids.add(obj.id)
+    return user_ids
+
+@event.listens_for(Session, 'after_flush')
+def _users_after_flush(session, flush_context):
+    """Drop the records of changed users as soon as the change is flushed"""
+    user_ids = _collect_user_changes(session)
+    if user_ids:
+        for user_id in user_ids:
+            invalidate_user(user_id)
+        session.info.setdefault('user_changes', set()).update(user_ids)
+
+@event.listens_for(Session, 'after_commit')
+def _users_after_commit(session):
+    """
+    Drop them again once committed, in case another request cached the old
+    row meanwhile; with a shared cache this reaches every process
+    """
+    for user_id in session.info.pop('user_changes', ()):
+        invalidate_user(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _users_after_rollback(session):
+    session.info.pop('user_changes', None)
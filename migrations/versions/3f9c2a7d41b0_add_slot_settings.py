@@ -0,0 +1,44 @@
+"""Add slot duration and buffer settings
+
+Revision ID: 3f9c2a7d41b0
+Revises:
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b0'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    return {column['name'] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    # Tables are created by db.create_all() on startup; only databases created
+    # before the slot settings existed are missing these columns.
+    professional_columns = _columns('professional')
+    with op.batch_alter_table('professional') as batch_op:
+        if 'slot_duration' not in professional_columns:
+            batch_op.add_column(sa.Column('slot_duration', sa.Integer(), nullable=True))
+        if 'slot_buffer' not in professional_columns:
+            batch_op.add_column(sa.Column('slot_buffer', sa.Integer(), nullable=False, server_default='0'))
+
+    if 'slot_duration' not in _columns('specialty'):
+        with op.batch_alter_table('specialty') as batch_op:
+            batch_op.add_column(sa.Column('slot_duration', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('specialty') as batch_op:
+        batch_op.drop_column('slot_duration')
+
+    with op.batch_alter_table('professional') as batch_op:
+        batch_op.drop_column('slot_buffer')
+        batch_op.drop_column('slot_duration')
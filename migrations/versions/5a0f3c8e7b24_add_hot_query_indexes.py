@@ -0,0 +1,40 @@
+"""Add indexes for the dashboard, reminder and schedule queries
+
+Revision ID: 5a0f3c8e7b24
+Revises: e2d8f4b6a913
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a0f3c8e7b24'
+down_revision = 'e2d8f4b6a913'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_appointment_professional_date_status', 'appointment', ['professional_id', 'date', 'status'], {}),
+    ('ix_appointment_client_date_status', 'appointment', ['client_id', 'date', 'status'], {}),
+    ('ix_appointment_status', 'appointment', ['status'], {}),
+    ('ix_appointment_created_at', 'appointment', ['created_at'], {}),
+    ('ix_appointment_confirmed_date', 'appointment', ['date'], {
+        'sqlite_where': sa.text("status = 'confirmed'"),
+        'postgresql_where': sa.text("status = 'confirmed'"),
+    }),
+    ('ix_schedule_professional_day', 'schedule', ['professional_id', 'day_of_week'], {}),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns, options in INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, **options)
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
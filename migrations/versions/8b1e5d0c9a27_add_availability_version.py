@@ -0,0 +1,28 @@
+"""Add professional availability version
+
+Revision ID: 8b1e5d0c9a27
+Revises: 3f9c2a7d41b0
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e5d0c9a27'
+down_revision = '3f9c2a7d41b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('professional')}
+    if 'availability_version' not in columns:
+        with op.batch_alter_table('professional') as batch_op:
+            batch_op.add_column(sa.Column('availability_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('professional') as batch_op:
+        batch_op.drop_column('availability_version')
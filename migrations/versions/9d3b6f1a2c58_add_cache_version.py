@@ -0,0 +1,30 @@
+"""Add the cache_version table for catalogue caches
+
+Revision ID: 9d3b6f1a2c58
+Revises: 5a0f3c8e7b24
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3b6f1a2c58'
+down_revision = '5a0f3c8e7b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'cache_version' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            'cache_version',
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('version', sa.Integer(), server_default='0', nullable=False),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade():
+    op.drop_table('cache_version')
@@ -0,0 +1,31 @@
+"""Add the availability_materialized_day table of materialized dates
+
+Revision ID: a8c4e1f7d392
+Revises: f3a9b5d7c140
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c4e1f7d392'
+down_revision = 'f3a9b5d7c140'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'availability_materialized_day' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'availability_materialized_day',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('materialized_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('date')
+    )
+
+
+def downgrade():
+    op.drop_table('availability_materialized_day')
@@ -0,0 +1,31 @@
+"""Add unique index on active appointment slots
+
+Revision ID: c4a7e92f1d36
+Revises: 8b1e5d0c9a27
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7e92f1d36'
+down_revision = '8b1e5d0c9a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fails if the table already holds two active appointments in the same
+    # slot; cancel the duplicates before upgrading.
+    indexes = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('appointment')}
+    if 'uq_appointment_active_slot' not in indexes:
+        op.create_index('uq_appointment_active_slot', 'appointment',
+                        ['professional_id', 'date', 'start_time'], unique=True,
+                        sqlite_where=sa.text("status != 'cancelled'"),
+                        postgresql_where=sa.text("status != 'cancelled'"))
+
+
+def downgrade():
+    op.drop_index('uq_appointment_active_slot', table_name='appointment')
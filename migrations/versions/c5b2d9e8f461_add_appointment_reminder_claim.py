@@ -0,0 +1,31 @@
+"""Add the reminder claim of appointments, separate from reminder_sent_at
+
+Revision ID: c5b2d9e8f461
+Revises: a8c4e1f7d392
+Create Date: 2026-10-17 23:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5b2d9e8f461'
+down_revision = 'a8c4e1f7d392'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('appointment')}
+    with op.batch_alter_table('appointment') as batch_op:
+        if 'reminder_claimed_by' not in columns:
+            batch_op.add_column(sa.Column('reminder_claimed_by', sa.String(length=32), nullable=True))
+        if 'reminder_claimed_until' not in columns:
+            batch_op.add_column(sa.Column('reminder_claimed_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('appointment') as batch_op:
+        batch_op.drop_column('reminder_claimed_until')
+        batch_op.drop_column('reminder_claimed_by')
@@ -0,0 +1,28 @@
+"""Add appointment.reminder_sent_at for the daily reminders
+
+Revision ID: d1f6a8c3e527
+Revises: b7e2c9d4f015
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f6a8c3e527'
+down_revision = 'b7e2c9d4f015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('appointment')}
+    if 'reminder_sent_at' not in columns:
+        with op.batch_alter_table('appointment') as batch_op:
+            batch_op.add_column(sa.Column('reminder_sent_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('appointment') as batch_op:
+        batch_op.drop_column('reminder_sent_at')
@@ -0,0 +1,73 @@
+"""Add appointment starts_at/ends_at with a composite index
+
+Revision ID: e2d8f4b6a913
+Revises: c4a7e92f1d36
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2d8f4b6a913'
+down_revision = 'c4a7e92f1d36'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+appointment = sa.table(
+    'appointment',
+    sa.column('id', sa.Integer),
+    sa.column('date', sa.Date),
+    sa.column('start_time', sa.Time),
+    sa.column('end_time', sa.Time),
+    sa.column('starts_at', sa.DateTime),
+    sa.column('ends_at', sa.DateTime),
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    columns = {column['name'] for column in inspector.get_columns('appointment')}
+    with op.batch_alter_table('appointment') as batch_op:
+        if 'starts_at' not in columns:
+            batch_op.add_column(sa.Column('starts_at', sa.DateTime(), nullable=True))
+        if 'ends_at' not in columns:
+            batch_op.add_column(sa.Column('ends_at', sa.DateTime(), nullable=True))
+
+    # Backfill in batches, combining the values in Python to stay portable
+    # across SQLite and PostgreSQL
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(appointment.c.id, appointment.c.date, appointment.c.start_time, appointment.c.end_time)
+            .where(appointment.c.id > last_id, appointment.c.starts_at.is_(None))
+            .order_by(appointment.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            appointment.update().where(appointment.c.id == sa.bindparam('row_id')).values(
+                starts_at=sa.bindparam('row_starts_at'), ends_at=sa.bindparam('row_ends_at')),
+            [{'row_id': row.id,
+              'row_starts_at': datetime.combine(row.date, row.start_time),
+              'row_ends_at': datetime.combine(row.date, row.end_time)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    indexes = {index['name'] for index in inspector.get_indexes('appointment')}
+    if 'ix_appointment_professional_starts_at' not in indexes:
+        op.create_index('ix_appointment_professional_starts_at', 'appointment',
+                        ['professional_id', 'starts_at', 'ends_at'])
+
+
+def downgrade():
+    op.drop_index('ix_appointment_professional_starts_at', table_name='appointment')
+    with op.batch_alter_table('appointment') as batch_op:
+        batch_op.drop_column('ends_at')
+        batch_op.drop_column('starts_at')
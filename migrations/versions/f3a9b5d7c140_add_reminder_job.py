@@ -0,0 +1,48 @@
+"""Add the reminder_job table for background daily reminders
+
+Revision ID: f3a9b5d7c140
+Revises: d1f6a8c3e527
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9b5d7c140'
+down_revision = 'd1f6a8c3e527'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'reminder_job' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'reminder_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('sent', sa.Integer(), nullable=False),
+        sa.Column('failed', sa.Integer(), nullable=False),
+        sa.Column('batches', sa.Integer(), nullable=False),
+        sa.Column('last_appointment_id', sa.Integer(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('claimed_by', sa.String(length=36), nullable=True),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_reminder_job_status_locked_until', 'reminder_job', ['status', 'locked_until'])
+    op.create_index('ix_reminder_job_day', 'reminder_job', ['day'])
+
+
+def downgrade():
+    op.drop_index('ix_reminder_job_day', table_name='reminder_job')
+    op.drop_index('ix_reminder_job_status_locked_until', table_name='reminder_job')
+    op.drop_table('reminder_job')
@@ -1,4 +1,5 @@
 from datetime import datetime, timedelta
+from sqlalchemy import event, inspect
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -55,12 +56,16 @@ class Professional(db.Model):
     years_experience = db.Column(db.Integer)
     rating = db.Column(db.Float, default=0.0)
     accepts_insurance = db.Column(db.Boolean, default=False)
+    slot_duration = db.Column(db.Integer)  # minutes, NULL to use the specialty or default duration
+    slot_buffer = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # minutes between appointments
+    availability_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # bumped on every availability change
     
     # Relationships
     user = db.relationship('User', back_populates='professional')
     specialties = db.relationship('Specialty', secondary=professional_specialty, backref='professionals')
     schedules = db.relationship('Schedule', back_populates='professional', cascade='all, delete-orphan')
     appointments = db.relationship('Appointment', back_populates='professional', cascade='all, delete-orphan')
+    availability_days = db.relationship('AvailabilityDay', back_populates='professional', cascade='all, delete-orphan')
     
     def __repr__(self):
         return f'<Professional {self.user.username}>'
@@ -82,6 +87,7 @@ class Specialty(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
+    slot_duration = db.Column(db.Integer)  # minutes, NULL to use the default duration
     
     def __repr__(self):
         return f'<Specialty {self.name}>'
@@ -93,6 +99,10 @@ class Schedule(db.Model):
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_schedule_professional_day', 'professional_id', 'day_of_week'),
+    )
+    
     # Relationships
     professional = db.relationship('Professional', back_populates='schedules')
     
@@ -101,14 +111,25 @@ class Schedule(db.Model):
 
 class Appointment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    professional_id = db.Column(db.Integer, db.ForeignKey('professional.id'), nullable=False)
+    # active_history keeps the previous professional and date of a moved
+    # appointment so both days can be refreshed in the availability engine
+    professional_id = db.mapped_column(db.Integer, db.ForeignKey('professional.id'), nullable=False,
+                                       active_history=True)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
-    date = db.Column(db.Date, nullable=False)
+    date = db.mapped_column(db.Date, nullable=False, active_history=True)
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
+    # date + start_time / end_time, kept in sync on flush for single-index range scans
+    starts_at = db.Column(db.DateTime)
+    ends_at = db.Column(db.DateTime)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, cancelled, completed
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set once the daily reminder for the current date and time was accepted by the mail transport
+    reminder_sent_at = db.Column(db.DateTime)
+    # Worker sending the reminder and the end of its lease; an expired claim is sent again
+    reminder_claimed_by = db.Column(db.String(32))
+    reminder_claimed_until = db.Column(db.DateTime)
     
     # Payment information
     cost = db.Column(db.Float, default=50.0)  # Default cost in currency units
@@ -118,6 +139,25 @@ class Appointment(db.Model):
     refund_id = db.Column(db.String(100))  # Stripe refund ID
     refund_timestamp = db.Column(db.DateTime)  # When the refund was processed
     
+    __table_args__ = (
+        # A slot can only be held by one active appointment
+        db.Index('uq_appointment_active_slot', 'professional_id', 'date', 'start_time', unique=True,
+                 sqlite_where=db.text("status != 'cancelled'"),
+                 postgresql_where=db.text("status != 'cancelled'")),
+        # Calendar ranges and overlap checks of a professional
+        db.Index('ix_appointment_professional_starts_at', 'professional_id', 'starts_at', 'ends_at'),
+        # Dashboards and appointment lists of a professional or a client
+        db.Index('ix_appointment_professional_date_status', 'professional_id', 'date', 'status'),
+        db.Index('ix_appointment_client_date_status', 'client_id', 'date', 'status'),
+        # Admin counts by status and recent appointments
+        db.Index('ix_appointment_status', 'status'),
+        db.Index('ix_appointment_created_at', 'created_at'),
+        # Daily reminders only look at confirmed appointments
+        db.Index('ix_appointment_confirmed_date', 'date',
+                 sqlite_where=db.text("status = 'confirmed'"),
+                 postgresql_where=db.text("status = 'confirmed'")),
+    )
+    
     # Relationships
     professional = db.relationship('Professional', back_populates='appointments')
     client = db.relationship('Client', back_populates='appointments')
@@ -125,30 +165,175 @@ class Appointment(db.Model):
     def __repr__(self):
         return f'<Appointment {self.professional.user.username} - {self.client.user.username}>'
     
+    def check_slot(self, buffer=0):
+        """
+        Check schedule containment and overlap with a single query.
+        
+        Args:
+            buffer (int): Minutes the professional keeps free around each appointment
+        
+        Returns:
+            tuple: ``(within_schedule, has_conflict)`` booleans
+        """
+        within, conflict = db.session.execute(self.slot_check_query(buffer)).one()
+        return bool(within), bool(conflict)
+    
+    def slot_check_query(self, buffer=0):
+        """
+        SELECT evaluating schedule containment and overlap as two EXISTS subqueries.
+        
+        The overlap test uses ``start < new.end + buffer AND end > new.start - buffer``
+        on the combined datetimes, a range scan of the (professional_id, starts_at)
+        index, so the buffer is kept on both sides of the new appointment.
+        """
+        within_schedule = db.select(Schedule.id).where(
+            Schedule.professional_id == self.professional_id,
+            Schedule.day_of_week == self.date.weekday(),
+            Schedule.start_time <= self.start_time,
+            Schedule.end_time >= self.end_time
+        ).exists()
+        
+        starts_at, ends_at = self.interval()
+        margin = timedelta(minutes=buffer)
+        overlapping = db.select(Appointment.id).where(
+            Appointment.professional_id == self.professional_id,
+            # Appointments never span midnight, so the scan starts at the beginning of the day
+            Appointment.starts_at >= datetime.combine(self.date, datetime.min.time()),
+            Appointment.starts_at < ends_at + margin,
+            Appointment.ends_at > starts_at - margin,
+            Appointment.status != 'cancelled'
+        )
+        if self.id is not None:
+            overlapping = overlapping.where(Appointment.id != self.id)
+        
+        return db.select(within_schedule, overlapping.exists())
+    
+    def interval(self):
+        """Start and end of the appointment as datetimes"""
+        return (datetime.combine(self.date, self.start_time),
+                datetime.combine(self.date, self.end_time))
+    
     def is_valid_time(self):
         """Check if appointment is within professional's schedule."""
-        day_of_week = self.date.weekday()
-        schedules = Schedule.query.filter_by(
-            professional_id=self.professional_id,
-            day_of_week=day_of_week
-        ).all()
-        
-        for schedule in schedules:
-            if (self.start_time >= schedule.start_time and 
-                self.end_time <= schedule.end_time):
-                return True
-        return False
+        return self.check_slot()[0]
     
     def has_conflict(self):
         """Check if appointment conflicts with other appointments."""
-        overlapping = Appointment.query.filter(
-            Appointment.professional_id == self.professional_id,
-            Appointment.date == self.date,
-            Appointment.id != self.id,
-            Appointment.status != 'cancelled',
-            ((Appointment.start_time <= self.start_time) & (Appointment.end_time > self.start_time)) |
-            ((Appointment.start_time < self.end_time) & (Appointment.end_time >= self.end_time)) |
-            ((Appointment.start_time >= self.start_time) & (Appointment.end_time <= self.end_time))
-        ).count()
-        
-        return overlapping > 0
+        return self.check_slot()[1]
+
+@event.listens_for(Appointment, 'before_insert')
+@event.listens_for(Appointment, 'before_update')
+def _sync_appointment_interval(mapper, connection, appointment):
+    """Keep starts_at/ends_at in sync with date, start_time and end_time"""
+    appointment.starts_at, appointment.ends_at = appointment.interval()
+
+@event.listens_for(Appointment, 'before_update')
+def _reset_appointment_reminder(mapper, connection, appointment):
+    """A rescheduled appointment gets a new reminder for its new date"""
+    state = inspect(appointment)
+    if state.attrs.date.history.has_changes() or state.attrs.start_time.history.has_changes():
+        appointment.reminder_sent_at = None
+        appointment.reminder_claimed_by = None
+        appointment.reminder_claimed_until = None
+
+class CacheVersion(db.Model):
+    """Change counter of a cached catalogue, shared by every worker process through the database."""
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}: {self.version}>'
+
+class EmailOutbox(db.Model):
+    """Email waiting to be delivered, written in the same transaction as the change it reports."""
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    html_body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # lease expiry while sending
+    claimed_by = db.Column(db.String(36))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Workers pick due rows in next_attempt_at order
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_email_outbox_claimed_by', 'claimed_by'),
+    )
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.recipient}: {self.status}>'
+
+class ReminderJob(db.Model):
+    """Background run of the daily reminders, resumable from its last recorded batch."""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)  # Date of the appointments to remind
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    total = db.Column(db.Integer, nullable=False, default=0)
+    sent = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    batches = db.Column(db.Integer, nullable=False, default=0)
+    last_appointment_id = db.Column(db.Integer, nullable=False, default=0)  # checkpoint of the last recorded batch
+    attempts = db.Column(db.Integer, nullable=False, default=0)  # runs started, more than one after a crash
+    claimed_by = db.Column(db.String(36))
+    locked_until = db.Column(db.DateTime)  # lease of the running worker, renewed on every checkpoint
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_reminder_job_status_locked_until', 'status', 'locked_until'),
+        db.Index('ix_reminder_job_day', 'day'),
+    )
+    
+    def to_dict(self):
+        """Progress report of the job"""
+        return {
+            'job_id': self.id,
+            'day': self.day.isoformat(),
+            'status': self.status,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'batches': self.batches,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+    
+    def __repr__(self):
+        return f'<ReminderJob {self.id} {self.day}: {self.status}>'
+
+class AvailabilityDay(db.Model):
+    """Materialized per-day availability summary derived from Schedule and Appointment."""
+    professional_id = db.Column(db.Integer, db.ForeignKey('professional.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    free_slots = db.Column(db.Integer, nullable=False, default=0)
+    free_minutes = db.Column(db.Integer, nullable=False, default=0)
+    first_free = db.Column(db.Time)  # Start of the earliest free slot, NULL when fully booked
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # "Who is free on date X" lookups
+        db.Index('ix_availability_day_date_free_slots', 'date', 'free_slots'),
+    )
+    
+    # Relationships
+    professional = db.relationship('Professional', back_populates='availability_days')
+    
+    def __repr__(self):
+        return f'<AvailabilityDay {self.professional_id} - {self.date}: {self.free_slots}>'
+
+class AvailabilityMaterializedDay(db.Model):
+    """Dates whose availability_day rows have been built, including dates nobody works."""
+    date = db.Column(db.Date, primary_key=True)
+    materialized_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AvailabilityMaterializedDay {self.date}>'
@@ -0,0 +1,261 @@
+"""
+Transactional email outbox and its background delivery workers.
+"""
+import logging
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from app import db
+from models import EmailOutbox
+from transport_utils import get_transport
+
+logger = logging.getLogger(__name__)
+
+# Statuses a worker may claim: due pending emails and sending emails whose
+# lease expired because their worker died before recording the result
+_CLAIMABLE = ('pending', 'sending')
+
+def enqueue_email(recipient, subject, html_body):
+    """
+    Add an email to the outbox in the current transaction
+
+    Nothing is sent until the transaction commits, and nothing is sent at all
+    if it rolls back. Delivery happens in the background (see
+    ``OutboxWorkerPool``).
+
+    Args:
+        recipient (str): Recipient email address
+        subject (str): Email subject
+        html_body (str): HTML content of the email
+
+    Returns:
+        EmailOutbox: The pending outbox row
+    """
+    email = EmailOutbox(recipient=recipient, subject=subject, html_body=html_body,
+                        status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+    db.session.add(email)
+    db.session.info['outbox_enqueued'] = True
+    return email
+
+def deliver_email(recipient, subject, html_body):
+    """
+    Send one email through the configured transport
+
+    With ``MAIL_TRANSPORT = 'auto'`` an email SendGrid does not accept is
+    sent through SMTP instead.
+
+    Raises:
+        Exception: If no transport accepted the email
+    """
+    transport = get_transport()
+    try:
+        transport.send(recipient, subject, html_body)
+    except Exception as e:
+        if transport.name != 'sendgrid' or current_app.config['MAIL_TRANSPORT'] != 'auto':
+            raise
+        logger.warning(f"SendGrid did not accept the email to {recipient}, falling back to SMTP: {e}")
+        get_transport('smtp').send(recipient, subject, html_body)
+
+def retry_delay(attempts):
+    """Seconds to wait after a failed delivery: exponential backoff with up to 10% jitter"""
+    config = current_app.config
+    delay = min(config['EMAIL_OUTBOX_BACKOFF'] * 2 ** (attempts - 1), config['EMAIL_OUTBOX_BACKOFF_MAX'])
+    return delay + random.uniform(0, delay / 10)
+
+def _lease_until():
+    return datetime.utcnow() + timedelta(seconds=current_app.config['EMAIL_OUTBOX_LEASE'])
+
+def claim_emails(limit):
+    """
+    Reserve up to ``limit`` due emails for this worker
+
+    A single UPDATE marks the rows as sending under a new claim token and
+    leases them for ``EMAIL_OUTBOX_LEASE`` seconds, so concurrent workers, in
+    this or other processes, do not claim the same email while the lease
+    lasts. ``deliver_pending`` renews the lease of each email right before
+    sending it, so a slow batch does not outlive it.
+
+    Returns:
+        list: Claimed ``EmailOutbox`` rows
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    table = EmailOutbox.__table__
+    due = table.c.status.in_(_CLAIMABLE) & (table.c.next_attempt_at <= now)
+    db.session.execute(
+        update(table)
+        .where(table.c.id.in_(select(table.c.id).where(due).order_by(table.c.next_attempt_at).limit(limit)), due)
+        .values(status='sending', claimed_by=token, attempts=table.c.attempts + 1, next_attempt_at=_lease_until())
+    )
+    db.session.commit()
+    return db.session.scalars(
+        select(EmailOutbox).where(EmailOutbox.claimed_by == token).order_by(EmailOutbox.id)
+    ).all()
+
+def _renew_lease(email_id, token):
+    """Extend the lease of a claimed email; False when another worker took it over"""
+    table = EmailOutbox.__table__
+    result = db.session.execute(
+        update(table).where(table.c.id == email_id, table.c.claimed_by == token).values(next_attempt_at=_lease_until())
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+def _record_result(email_id, token, attempts, recipient, error):
+    """
+    Record the outcome of a delivery, unless the claim was lost meanwhile
+
+    The update only applies while ``token`` still owns the row, so a worker
+    whose lease expired never overwrites the state set by the new owner.
+    """
+    now = datetime.utcnow()
+    if error is None:
+        values = {'status': 'sent', 'sent_at': now, 'last_error': None}
+    elif attempts >= current_app.config['EMAIL_OUTBOX_MAX_ATTEMPTS']:
+        # Dead letter: kept for inspection and manual requeueing
+        values = {'status': 'dead', 'last_error': error}
+        logger.error(f"Email {email_id} to {recipient} dead-lettered after {attempts} attempts: {error}")
+    else:
+        values = {'status': 'pending', 'next_attempt_at': now + timedelta(seconds=retry_delay(attempts)),
+                  'last_error': error}
+    table = EmailOutbox.__table__
+    result = db.session.execute(
+        update(table).where(table.c.id == email_id, table.c.claimed_by == token).values(claimed_by=None, **values)
+    )
+    db.session.commit()
+    if result.rowcount == 0:
+        logger.warning(f"Email {email_id} was claimed by another worker, dropping the result of this delivery")
+
+def deliver_pending(limit=None, send=deliver_email):
+    """
+    Claim and deliver one batch of due emails
+
+    The lease of each email is renewed just before it is sent and its
+    result committed as soon as it is known, so a crash only leaves the email
+    being sent to be retried once its lease expires.
+
+    Args:
+        limit (int, optional): Batch size, ``EMAIL_OUTBOX_BATCH_SIZE`` by default
+        send (callable, optional): ``send(recipient, subject, html_body)``,
+            raising on failure; ``deliver_email`` by default
+
+    Returns:
+        int: Number of emails attempted
+    """
+    emails = claim_emails(limit or current_app.config['EMAIL_OUTBOX_BATCH_SIZE'])
+    # Read before the first commit expires the instances
+    claimed = [(email.id, email.claimed_by, email.attempts, email.recipient, email.subject, email.html_body)
+               for email in emails]
+    for email_id, token, attempts, recipient, subject, html_body in claimed:
+        if not _renew_lease(email_id, token):
+            logger.warning(f"Lease of email {email_id} expired before it was sent, leaving it to its new worker")
+            continue
+        try:
+            send(recipient, subject, html_body)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.warning(f"Delivery of email {email_id} to {recipient} failed: {error}")
+        _record_result(email_id, token, attempts, recipient, error)
+    return len(emails)
+
+def requeue_dead_emails():
+    """
+    Give dead-lettered emails a fresh set of attempts
+
+    Returns:
+        int: Number of emails requeued
+    """
+    result = db.session.execute(
+        update(EmailOutbox).where(EmailOutbox.status == 'dead')
+        .values(status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+class OutboxWorkerPool:
+    """
+    Threads delivering the outbox in the background.
+
+    Each worker delivers batches while there is due mail and then sleeps
+    for ``EMAIL_OUTBOX_POLL_INTERVAL`` seconds, or until ``wake`` is called
+    when a transaction of this process commits new emails. Emails committed
+    by other processes are picked up on the next poll.
+    """
+
+    def __init__(self, app, workers, send=deliver_email):
+        self.app = app
+        self.workers = workers
+        self.send = send
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'email-outbox-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    delivered = deliver_pending(send=self.send)
+                except Exception:
+                    logger.exception("Email outbox worker failed")
+                    delivered = 0
+                finally:
+                    db.session.remove()
+            if not delivered:
+                self._wake.wait(self.app.config['EMAIL_OUTBOX_POLL_INTERVAL'])
+                self._wake.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def start_outbox_workers(app, workers=None):
+    """
+    Start this process's delivery workers once
+
+    Args:
+        app (Flask): Application the workers run in
+        workers (int, optional): Number of threads, ``EMAIL_OUTBOX_WORKERS`` by default
+
+    Returns:
+        OutboxWorkerPool: The running pool, or None when disabled
+    """
+    global _pool
+    if _pool is not None:
+        return _pool
+    workers = app.config['EMAIL_OUTBOX_WORKERS'] if workers is None else workers
+    with _pool_lock:
+        if _pool is None and workers > 0:
+            _pool = OutboxWorkerPool(app, workers)
+            _pool.start()
+    return _pool
+
+@event.listens_for(Session, 'after_commit')
+def _outbox_after_commit(session):
+    """Wake the local workers as soon as new emails are committed"""
+    if session.info.pop('outbox_enqueued', False) and _pool is not None:
+        _pool.wake()
+
+@event.listens_for(Session, 'after_rollback')
+def _outbox_after_rollback(session):
+    session.info.pop('outbox_enqueued', None)
@@ -0,0 +1,32 @@
+"""Script para reconstruir la disponibilidad materializada de los profesionales
+
+Recalcula la tabla availability_day (resumen diario de huecos libres) para
+los próximos días a partir de los horarios y las citas existentes. Las
+reservas y cambios de horario la mantienen al día de forma incremental;
+ejecútalo a diario (por ejemplo desde cron) para extender el horizonte y
+después de importar datos directamente en la base de datos.
+
+Uso:
+    python rebuild_availability.py [--days N]
+"""
+import argparse
+from datetime import datetime, timedelta
+from app import app, db
+from availability_utils import rebuild_availability
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconstruye la disponibilidad materializada')
+    parser.add_argument('--days', type=int, default=app.config['AVAILABILITY_HORIZON_DAYS'],
+                        help='Número de días a materializar a partir de hoy')
+    args = parser.parse_args()
+
+    start_date = datetime.now().date()
+    end_date = start_date + timedelta(days=args.days - 1)
+
+    with app.app_context():
+        written = rebuild_availability(start_date, end_date)
+        db.session.commit()
+        print(f"Disponibilidad materializada del {start_date} al {end_date}: {written} filas.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Daily appointment reminders, sent in batches of SendGrid personalizations
+by resumable background jobs.
+"""
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import aliased
+from app import db
+from models import User, Appointment, Client, Professional, ReminderJob
+from email_utils import fill_substitutions, render_recipients, shared_body
+from outbox_utils import enqueue_email
+from transport_utils import get_transport
+
+logger = logging.getLogger(__name__)
+
+def send_reminder_batch(recipients):
+    """
+    Send a batch of reminders
+
+    With a bulk transport such as SendGrid the whole batch is a single API
+    call. Otherwise every reminder is queued in the email outbox and
+    delivered by its workers.
+
+    Args:
+        recipients (list): Entries built by ``render_recipients('reminder', rows)``
+
+    Returns:
+        bool: True if the batch was accepted, False otherwise
+    """
+    body = shared_body('reminder')
+    transport = get_transport()
+    if transport.supports_bulk:
+        transport.send_bulk(body, recipients)
+        return True
+
+    for recipient in recipients:
+        enqueue_email(recipient['email'], recipient['subject'], fill_substitutions(body, recipient['substitutions']))
+    db.session.commit()
+    return True
+
+def _claim_reminders(day, after_id, limit):
+    """
+    Claim the next unsent reminders of ``day`` for this worker and load their rows
+
+    The claim is a lease, separate from ``reminder_sent_at``: a run at the
+    same time skips the claimed reminders, and if this worker dies they are
+    claimed again once the lease expires. The batch is read as plain rows for
+    ``email_utils``, without building ORM instances.
+
+    Returns:
+        tuple: (claim token, rows), with no rows when nothing is left
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    table = Appointment.__table__
+    claimable = ((table.c.date == day) & (table.c.status == 'confirmed') & table.c.reminder_sent_at.is_(None)
+                 & (table.c.reminder_claimed_until.is_(None) | (table.c.reminder_claimed_until < now)))
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(select(table.c.id).where(claimable, table.c.id > after_id).order_by(table.c.id).limit(limit)),
+               claimable)
+        .values(reminder_claimed_by=token,
+                reminder_claimed_until=now + timedelta(seconds=current_app.config['REMINDER_JOB_LEASE']))
+    )
+    db.session.commit()
+    if result.rowcount == 0:
+        return token, []
+
+    client_user = aliased(User)
+    professional_user = aliased(User)
+    return token, db.session.execute(
+        select(Appointment.id, Appointment.date, Appointment.start_time, Appointment.status,
+               client_user.email, client_user.first_name,
+               (professional_user.first_name + ' ' + professional_user.last_name).label('professional_name'))
+        .join(Client, Client.id == Appointment.client_id)
+        .join(client_user, client_user.id == Client.user_id)
+        .join(Professional, Professional.id == Appointment.professional_id)
+        .join(professional_user, professional_user.id == Professional.user_id)
+        .where(Appointment.reminder_claimed_by == token)
+        .order_by(Appointment.id)
+    ).mappings().all()
+
+def _finish_reminders(token, sent):
+    """
+    End the claim of a batch, recording it as sent when the transport accepted it
+
+    A failed batch is only released, so the next run retries it. Reminders
+    whose claim was lost meanwhile, e.g. a rescheduled appointment, are left alone.
+    """
+    table = Appointment.__table__
+    values = {'reminder_claimed_by': None, 'reminder_claimed_until': None}
+    if sent:
+        values['reminder_sent_at'] = datetime.utcnow()
+    db.session.execute(update(table).where(table.c.reminder_claimed_by == token).values(**values))
+    db.session.commit()
+
+def _release_claims(day, after_id):
+    """Release the claims left on ``day`` after ``after_id`` by a worker that died, so they are sent again"""
+    table = Appointment.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.date == day, table.c.id > after_id, table.c.reminder_sent_at.is_(None),
+               table.c.reminder_claimed_by.is_not(None))
+        .values(reminder_claimed_by=None, reminder_claimed_until=None)
+    )
+    db.session.commit()
+
+def process_daily_reminders(day=None, send=send_reminder_batch, after_id=0, checkpoint=None):
+    """
+    Send the reminders of the confirmed appointments of a day
+
+    Appointments are processed in id order, ``REMINDER_BATCH_SIZE`` at a
+    time, so memory and queries per batch stay constant however busy the day
+    is. A reminder is only marked as sent once the transport accepted its
+    batch; a failed batch is released for the next run.
+
+    Args:
+        day (date, optional): Day of the appointments, tomorrow by default
+        send (callable, optional): ``send(recipients)`` returning True when the
+            batch was accepted; ``send_reminder_batch`` by default
+        after_id (int, optional): Only appointments with a greater id, to resume a run
+        checkpoint (callable, optional): ``checkpoint(last_id, sent, failed)``
+            called after every batch; returning False stops the run
+
+    Returns:
+        tuple: (total_reminders, success_count, failed_count)
+    """
+    day = day or datetime.now().date() + timedelta(days=1)
+    batch_size = current_app.config['REMINDER_BATCH_SIZE']
+    success = 0
+    failed = 0
+    last_id = after_id
+
+    while True:
+        token, rows = _claim_reminders(day, last_id, batch_size)
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        try:
+            accepted = send(render_recipients('reminder', rows))
+        except Exception as e:
+            logger.error(f"Error sending a batch of {len(rows)} reminders: {str(e)}")
+            accepted = False
+
+        if not accepted:
+            db.session.rollback()
+        _finish_reminders(token, accepted)
+        batch_sent, batch_failed = (len(rows), 0) if accepted else (0, len(rows))
+        success += batch_sent
+        failed += batch_failed
+
+        if checkpoint is not None and not checkpoint(last_id, batch_sent, batch_failed):
+            break
+
+    logger.info(f"Daily reminders: {success} sent successfully, {failed} failed out of {success + failed} total")
+    return (success + failed, success, failed)
+
+def enqueue_reminder_job(day=None):
+    """
+    Queue a background run of the daily reminders
+
+    A day has at most one unfinished job: asking again while it is queued or
+    running returns that job, so cron retries do not start parallel runs.
+
+    Args:
+        day (date, optional): Day of the appointments, tomorrow by default
+
+    Returns:
+        ReminderJob: The queued or unfinished job
+    """
+    day = day or datetime.now().date() + timedelta(days=1)
+    job = ReminderJob.query.filter(
+        ReminderJob.day == day,
+        ReminderJob.status.in_(['queued', 'running'])
+    ).order_by(ReminderJob.id).first()
+    if job is None:
+        job = ReminderJob(day=day, status='queued')
+        db.session.add(job)
+        db.session.commit()
+    return job
+
+def _claimable_jobs(table, now):
+    # Queued jobs and running jobs whose worker stopped renewing its lease
+    return (table.c.status == 'queued') | ((table.c.status == 'running') & (table.c.locked_until < now))
+
+def claim_reminder_job():
+    """
+    Reserve the oldest queued or abandoned reminder job for this worker
+
+    Returns:
+        ReminderJob: The claimed job, or None when there is nothing to run
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    table = ReminderJob.__table__
+    claimable = _claimable_jobs(table, now)
+    db.session.execute(
+        update(table)
+        .where(table.c.id == select(table.c.id).where(claimable).order_by(table.c.id).limit(1).scalar_subquery(),
+               claimable)
+        .values(status='running', claimed_by=token, attempts=table.c.attempts + 1,
+                locked_until=now + timedelta(seconds=current_app.config['REMINDER_JOB_LEASE']),
+                started_at=func.coalesce(table.c.started_at, now))
+    )
+    db.session.commit()
+    return db.session.scalar(select(ReminderJob).where(ReminderJob.claimed_by == token))
+
+def run_reminder_job(job, send=send_reminder_batch):
+    """
+    Run a claimed reminder job, recording a checkpoint after every batch
+
+    A resumed job continues after the last recorded batch and sends again
+    the batch in flight when the previous worker died: nothing is lost, but
+    a batch the transport accepted just before the crash is delivered twice.
+
+    Args:
+        job (ReminderJob): Job returned by ``claim_reminder_job``
+        send (callable, optional): Batch sender, ``send_reminder_batch`` by default
+
+    Returns:
+        ReminderJob: The job with its final progress
+    """
+    job_id, token = job.id, job.claimed_by
+    table = ReminderJob.__table__
+    owned = (table.c.id == job_id) & (table.c.claimed_by == token)
+
+    if job.attempts == 1:
+        job.total = db.session.scalar(
+            select(func.count(Appointment.id)).where(
+                Appointment.date == job.day,
+                Appointment.status == 'confirmed',
+                Appointment.reminder_sent_at.is_(None)
+            )
+        )
+        db.session.commit()
+    else:
+        # Only one worker runs a job, so the claims after the checkpoint are the dead worker's
+        _release_claims(job.day, job.last_appointment_id)
+
+    def checkpoint(last_id, sent, failed):
+        result = db.session.execute(
+            update(table).where(owned).values(
+                last_appointment_id=last_id, sent=table.c.sent + sent, failed=table.c.failed + failed,
+                batches=table.c.batches + 1,
+                locked_until=datetime.utcnow() + timedelta(seconds=current_app.config['REMINDER_JOB_LEASE']))
+        )
+        db.session.commit()
+        if result.rowcount == 0:
+            logger.warning(f"Reminder job {job_id} was taken over by another worker, stopping")
+        return result.rowcount == 1
+
+    try:
+        process_daily_reminders(job.day, send=send, after_id=job.last_appointment_id, checkpoint=checkpoint)
+        status, error = 'completed', None
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Reminder job {job_id} failed: {str(e)}")
+        status, error = 'failed', str(e)
+
+    db.session.execute(
+        update(table).where(owned).values(status=status, error=error, claimed_by=None,
+                                          locked_until=None, finished_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return db.session.get(ReminderJob, job_id, populate_existing=True)
+
+def run_pending_reminder_jobs(send=send_reminder_batch):
+    """
+    Run queued and abandoned reminder jobs until none is left
+
+    Returns:
+        int: Number of jobs run
+    """
+    count = 0
+    while job := claim_reminder_job():
+        run_reminder_job(job, send=send)
+        count += 1
+    return count
+
+def is_abandoned(job):
+    """Whether a running job stopped renewing its lease, i.e. its worker died"""
+    return job.status == 'running' and job.locked_until is not None and job.locked_until < datetime.utcnow()
+
+def start_reminder_worker(app):
+    """
+    Run the pending reminder jobs in a background thread of this process
+
+    Args:
+        app (Flask): Application the worker runs in
+
+    Returns:
+        threading.Thread: The worker thread
+    """
+    def run():
+        with app.app_context():
+            try:
+                run_pending_reminder_jobs()
+            except Exception:
+                logger.exception("Reminder job worker failed")
+            finally:
+                db.session.remove()
+
+    thread = threading.Thread(target=run, name='reminder-jobs', daemon=True)
+    thread.start()
+    return thread
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from app import db
 from models import User, Professional, Client, Appointment, Specialty
 from forms import SpecialtyForm
+from stats_utils import get_dashboard_stats
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -36,17 +37,8 @@ def admin_access():
 @login_required
 def dashboard():
     """Admin dashboard with statistics"""
-    # User statistics
-    total_users = User.query.count()
-    total_professionals = Professional.query.count()
-    total_clients = Client.query.count()
-    
-    # Appointment statistics
-    total_appointments = Appointment.query.count()
-    pending_appointments = Appointment.query.filter_by(status='pending').count()
-    confirmed_appointments = Appointment.query.filter_by(status='confirmed').count()
-    cancelled_appointments = Appointment.query.filter_by(status='cancelled').count()
-    completed_appointments = Appointment.query.filter_by(status='completed').count()
+    # User and appointment statistics, from the background-refreshed snapshot
+    stats = get_dashboard_stats()
     
     # Recent users
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
@@ -73,14 +65,7 @@ def dashboard():
     ).limit(5).all()
     
     return render_template('admin/dashboard.html',
-                          total_users=total_users,
-                          total_professionals=total_professionals,
-                          total_clients=total_clients,
-                          total_appointments=total_appointments,
-                          pending_appointments=pending_appointments,
-                          confirmed_appointments=confirmed_appointments,
-                          cancelled_appointments=cancelled_appointments,
-                          completed_appointments=completed_appointments,
+                          **stats,
                           recent_users=recent_users,
                           recent_appointments=recent_appointments)
 
@@ -184,7 +169,8 @@ def specialties():
         else:
             specialty = Specialty(
                 name=form.name.data,
-                description=form.description.data
+                description=form.description.data,
+                slot_duration=form.slot_duration.data
             )
             db.session.add(specialty)
             db.session.commit()
@@ -222,6 +208,7 @@ def edit_specialty(specialty_id):
         else:
             specialty.name = form.name.data
             specialty.description = form.description.data
+            specialty.slot_duration = form.slot_duration.data
             db.session.commit()
             flash('Especialidad actualizada correctamente', 'success')
             return redirect(url_for('admin.specialties'))
@@ -229,6 +216,7 @@ def edit_specialty(specialty_id):
     elif request.method == 'GET':
         form.name.data = specialty.name
         form.description.data = specialty.description
+        form.slot_duration.data = specialty.slot_duration
     
     return render_template('admin/edit_specialty.html',
                           form=form,
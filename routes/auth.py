@@ -5,6 +5,7 @@ from datetime import datetime
 from app import db
 from models import User, Professional, Client, Specialty
 from forms import LoginForm, RegistrationForm, ChangePasswordForm
+from catalog_utils import specialty_choices
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -77,14 +78,9 @@ def register():
     if current_user.is_authenticated:
         return redirect(url_for('main.index'))
     
-    # Obtenemos todas las especialidades para el formulario
-    specialties = Specialty.query.order_by(Specialty.name).all()
-    
-    # Preparamos las opciones para el dropdown de especialidades
-    specialty_choices = [(0, 'Seleccione una especialidad')] + [(s.id, s.name) for s in specialties]
-    
+    # Opciones del dropdown de especialidades, desde la caché del catálogo
     form = RegistrationForm()
-    form.specialty.choices = specialty_choices
+    form.specialty.choices = [(0, 'Seleccione una especialidad'), *specialty_choices()]
     
     if form.validate_on_submit():
         user = User(
@@ -1,15 +1,19 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session
-from flask_login import login_required, current_user
-from datetime import datetime, timedelta
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, jsonify, g
+from flask_login import current_user
+from datetime import datetime, date, timedelta
 import json
 import google.oauth2.credentials
 import google_auth_oauthlib.flow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from sqlalchemy.orm import joinedload, selectinload
 from app import db
-from models import User, Client, Professional, Appointment, Specialty
+from models import Professional, Appointment, Specialty
 from forms import ClientProfileForm, AppointmentForm, SearchForm
-from utils import get_available_slots, send_confirmation_email, get_upcoming_appointments
+from utils import get_available_slots_range, queue_confirmation_email, get_upcoming_appointments
+from availability_utils import availability_version
+from access_utils import client_required
+from booking_utils import reserve_appointment, OutsideScheduleError, SlotTakenError, BookingBusyError
 from paypal_utils import create_checkout_session, refund_payment
 from google_calendar_utils import get_auth_url, add_appointment_to_calendar, get_credentials
 import os
@@ -17,20 +21,10 @@ import os
 client_bp = Blueprint('client', __name__)
 
 @client_bp.route('/profile', methods=['GET', 'POST'])
-@login_required
+@client_required
 def profile():
     """Client profile page"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    # Get client profile or create if not exists
-    client = Client.query.filter_by(user_id=current_user.id).first()
-    if not client:
-        client = Client(user_id=current_user.id)
-        db.session.add(client)
-        db.session.commit()
-    
+    client = g.client
     form = ClientProfileForm()
     if form.validate_on_submit():
         current_user.first_name = form.first_name.data
@@ -53,26 +47,25 @@ def profile():
     return render_template('profile.html', form=form, user=current_user)
 
 @client_bp.route('/my_appointments')
-@login_required
+@client_required
 def my_appointments():
     """View client's appointments"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
+    client = g.client
     
-    client = Client.query.filter_by(user_id=current_user.id).first()
-    if not client:
-        flash('Perfil de cliente no encontrado', 'warning')
-        return redirect(url_for('client.profile'))
+    # Professional, user and specialties are shown on every row: load them up front
+    row_options = joinedload(Appointment.professional).options(
+        joinedload(Professional.user),
+        selectinload(Professional.specialties)
+    )
     
     # Get appointments grouped by status
-    upcoming = Appointment.query.filter(
+    upcoming = Appointment.query.options(row_options).filter(
         Appointment.client_id == client.id,
         Appointment.date >= datetime.now().date(),
         Appointment.status.in_(['confirmed', 'pending'])
     ).order_by(Appointment.date, Appointment.start_time).all()
     
-    past = Appointment.query.filter(
+    past = Appointment.query.options(row_options).filter(
         Appointment.client_id == client.id,
         (Appointment.date < datetime.now().date()) | 
         (Appointment.status == 'cancelled') |
@@ -82,20 +75,12 @@ def my_appointments():
     return render_template('my_appointments.html', upcoming=upcoming, past=past)
 
 @client_bp.route('/book_appointment/<int:professional_id>', methods=['GET', 'POST'])
-@login_required
+@client_required
 def book_appointment(professional_id):
     """Book an appointment with a professional"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    professional = Professional.query.get_or_404(professional_id)
-    professional_user = User.query.get(professional.user_id)
-    client = Client.query.filter_by(user_id=current_user.id).first()
-    
-    if not client:
-        flash('Perfil de cliente no encontrado', 'warning')
-        return redirect(url_for('client.profile'))
+    professional = db.get_or_404(Professional, professional_id, options=[joinedload(Professional.user)])
+    professional_user = professional.user
+    client = g.client
     
     form = AppointmentForm()
     
@@ -121,52 +106,72 @@ def book_appointment(professional_id):
             status='pending'
         )
         
-        # Validate appointment against schedule and conflicts
-        if not appointment.is_valid_time():
+        # Validate against schedule and conflicts and insert atomically
+        try:
+            reserve_appointment(appointment, before_commit=queue_confirmation_email)
+        except OutsideScheduleError:
             flash('El horario seleccionado está fuera del horario de atención del profesional', 'danger')
-        elif appointment.has_conflict():
+        except SlotTakenError:
             flash('El horario seleccionado ya está reservado', 'danger')
+        except BookingBusyError:
+            flash('Hay muchas reservas en curso para este profesional. Por favor, inténtalo de nuevo.', 'warning')
         else:
-            db.session.add(appointment)
-            db.session.commit()
-            
-            # Send confirmation email
-            send_confirmation_email(appointment)
-            
             flash('Cita reservada exitosamente. Pendiente de confirmación por el profesional.', 'success')
             return redirect(url_for('client.my_appointments'))
     
-    # Get available slots for the next 7 days
-    today = datetime.now().date()
-    available_days = []
-    
-    for i in range(14):  # Check next 14 days
-        check_date = today + timedelta(days=i)
-        slots = get_available_slots(professional.id, check_date)
-        if slots:
-            available_days.append({
-                'date': check_date,
-                'slots': slots
-            })
-    
+    # Slots are fetched lazily by the page from api_availability
     return render_template('booking.html', 
                           form=form, 
                           professional=professional,
                           professional_user=professional_user,
-                          available_days=available_days)
+                          window_days=current_app.config['BOOKING_WINDOW_DAYS'])
+
+@client_bp.route('/api/availability/<int:professional_id>')
+def api_availability(professional_id):
+    """
+    API endpoint with the free slots of a professional over a date range
+    
+    Slots are ``[start, end]`` pairs of minutes since midnight grouped by ISO
+    date; days without free slots are omitted. The strong ETag changes with
+    the professional's availability version, so repeat views are answered
+    with 304 Not Modified without computing any slot.
+    """
+    today = datetime.now().date()
+    start = max(request.args.get('start', default=today, type=date.fromisoformat), today)
+    end = request.args.get('end', type=date.fromisoformat) or \
+        start + timedelta(days=current_app.config['BOOKING_WINDOW_DAYS'] - 1)
+    if end < start or (end - start).days >= current_app.config['AVAILABILITY_API_MAX_DAYS']:
+        return jsonify({'error': 'Invalid date range'}), 400
+    
+    version = availability_version(professional_id)
+    if version is None:
+        return jsonify({'error': 'Professional not found'}), 404
+    
+    etag = f'{professional_id}-{version}-{start.isoformat()}-{end.isoformat()}'
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        days = get_available_slots_range(professional_id, start, end)
+        response = jsonify({
+            'professional_id': professional_id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'days': {day.isoformat(): list(slots) for day, slots in days.items() if slots}
+        })
+    
+    # Availability is public: shared caches may keep it but must revalidate
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
 
 @client_bp.route('/cancel_appointment/<int:appointment_id>', methods=['POST'])
-@login_required
+@client_required
 def cancel_appointment(appointment_id):
     """Cancel an appointment"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    appointment = Appointment.query.get_or_404(appointment_id)
-    client = Client.query.filter_by(user_id=current_user.id).first()
+    appointment = Appointment.query.filter_by(id=appointment_id, client_id=g.client.id).first()
     
-    if appointment.client_id != client.id:
+    if appointment is None:
         flash('No tienes permiso para cancelar esta cita', 'danger')
         return redirect(url_for('client.my_appointments'))
     
@@ -183,26 +188,21 @@ def cancel_appointment(appointment_id):
             flash('No se pudo procesar el reembolso automáticamente. Contacte a soporte.', 'warning')
     
     appointment.status = 'cancelled'
-    db.session.commit()
     
-    # Send cancellation email
-    send_confirmation_email(appointment)
+    # Cancellation email, committed together with the new status
+    queue_confirmation_email(appointment)
+    db.session.commit()
     
     flash('Cita cancelada exitosamente', 'success')
     return redirect(url_for('client.my_appointments'))
 
 @client_bp.route('/pay_appointment/<int:appointment_id>')
-@login_required
+@client_required
 def pay_appointment(appointment_id):
     """Process payment for an appointment"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    appointment = Appointment.query.get_or_404(appointment_id)
-    client = Client.query.filter_by(user_id=current_user.id).first()
+    appointment = Appointment.query.filter_by(id=appointment_id, client_id=g.client.id).first()
     
-    if appointment.client_id != client.id:
+    if appointment is None:
         flash('No tienes permiso para pagar esta cita', 'danger')
         return redirect(url_for('client.my_appointments'))
     
@@ -226,17 +226,12 @@ def pay_appointment(appointment_id):
         return redirect(url_for('client.my_appointments'))
 
 @client_bp.route('/payment/success/<int:appointment_id>')
-@login_required
+@client_required
 def payment_success(appointment_id):
     """Handle successful payment"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
+    appointment = Appointment.query.filter_by(id=appointment_id, client_id=g.client.id).first()
     
-    appointment = Appointment.query.get_or_404(appointment_id)
-    client = Client.query.filter_by(user_id=current_user.id).first()
-    
-    if appointment.client_id != client.id:
+    if appointment is None:
         flash('No tienes permiso para ver esta información', 'danger')
         return redirect(url_for('client.my_appointments'))
     
@@ -253,26 +248,16 @@ def payment_success(appointment_id):
     return redirect(url_for('client.my_appointments'))
 
 @client_bp.route('/payment/cancel/<int:appointment_id>')
-@login_required
+@client_required
 def payment_cancel(appointment_id):
     """Handle cancelled payment"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    appointment = Appointment.query.get_or_404(appointment_id)
-    
     flash('El proceso de pago ha sido cancelado. Puedes intentarlo nuevamente más tarde.', 'info')
     return redirect(url_for('client.my_appointments'))
 
 @client_bp.route('/google/authorize')
-@login_required
+@client_required
 def authorize():
     """Authorize Google Calendar access"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
     # Get the authorization URL
     auth_url = get_auth_url()
     
@@ -283,13 +268,9 @@ def authorize():
     return redirect(auth_url)
 
 @client_bp.route('/google/oauth2callback')
-@login_required
+@client_required
 def oauth2callback():
     """Callback from Google OAuth2"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
     # Verificar que el estado exista en la sesión
     if 'state' not in session:
         flash('Error de autenticación: sesión inválida', 'danger')
@@ -343,23 +324,18 @@ def oauth2callback():
         return redirect(url_for('client.my_appointments'))
 
 @client_bp.route('/google/sync_appointment/<int:appointment_id>')
-@login_required
+@client_required
 def sync_appointment(appointment_id):
     """Sync an appointment with Google Calendar"""
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
     # Check if user has Google Calendar connected
     if not get_credentials():
         flash('Necesitas conectar tu cuenta de Google Calendar primero', 'warning')
         return redirect(url_for('client.authorize'))
     
     # Get the appointment
-    appointment = Appointment.query.get_or_404(appointment_id)
-    client = Client.query.filter_by(user_id=current_user.id).first()
+    appointment = Appointment.query.filter_by(id=appointment_id, client_id=g.client.id).first()
     
-    if appointment.client_id != client.id:
+    if appointment is None:
         flash('No tienes permiso para sincronizar esta cita', 'danger')
         return redirect(url_for('client.my_appointments'))
     
@@ -1,7 +1,12 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app
 from flask_login import current_user
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
 from models import Specialty, Professional, User
 from forms import SearchForm
+from catalog_utils import specialty_choices
+from availability_utils import ensure_materialized, free_capacity_query, earliest_available_slots
 from app import db
 
 main_bp = Blueprint('main', __name__)
@@ -9,11 +14,12 @@ main_bp = Blueprint('main', __name__)
 @main_bp.route('/')
 def index():
     """Home page with application information"""
-    specialties = Specialty.query.order_by(Specialty.name).all()
+    specialties = specialty_choices()
     professionals_count = Professional.query.count()
     
     # Featured professionals (just a sample of 4 professionals)
-    featured_professionals = db.session.query(Professional, User).join(User).limit(4).all()
+    featured_professionals = db.session.query(Professional, User).join(User).options(
+        selectinload(Professional.specialties)).limit(4).all()
     
     return render_template('index.html', 
                           specialties=specialties,
@@ -26,38 +32,133 @@ def search():
     form = SearchForm()
     
     # Populate specialty choices
-    specialties = Specialty.query.order_by(Specialty.name).all()
-    form.specialty.choices = [(0, 'Todas las especialidades')] + [(s.id, s.name) for s in specialties]
+    form.specialty.choices = [(0, 'Todas las especialidades'), *specialty_choices()]
     
     results = []
     
-    if form.validate_on_submit() or request.method == 'GET' and 'specialty' in request.args:
+    if form.validate_on_submit() or request.method == 'GET' and ('specialty' in request.args or 'date' in request.args):
         # Handle form submission or GET parameters
-        specialty_id = form.specialty.data if request.method == 'POST' else request.args.get('specialty', type=int, default=0)
-        date = form.date.data if request.method == 'POST' else None
+        if request.method == 'POST':
+            specialty_id = form.specialty.data
+            date = form.date.data
+            date_end = form.date_end.data
+            sort = form.sort.data
+        else:
+            specialty_id = request.args.get('specialty', type=int, default=0)
+            date = request.args.get('date', type=_parse_date)
+            date_end = request.args.get('date_end', type=_parse_date)
+            sort = request.args.get('sort', '')
+            form.specialty.data = specialty_id
+            form.date.data = date
+            form.date_end.data = date_end
+            form.sort.data = sort
         
-        # Query for professionals
-        query = db.session.query(Professional, User).join(User)
+        # Availability window: the requested dates, or the booking window when no date is given
+        today = datetime.now().date()
+        horizon = current_app.config['AVAILABILITY_HORIZON_DAYS']
+        if date:
+            start_date = max(date, today)
+            end_date = max(date_end or date, start_date)
+        else:
+            start_date = today
+            end_date = today + timedelta(days=current_app.config['BOOKING_WINDOW_DAYS'] - 1)
+        end_date = min(end_date, start_date + timedelta(days=horizon - 1))
+        
+        ensure_materialized(start_date, end_date)
+        capacity = free_capacity_query(start_date, end_date)
+        
+        # Query for professionals with their free capacity in the window
+        # Specialties are listed on every card: load them for the whole page in one IN query
+        query = db.session.query(Professional, User, capacity.c.free_slots).join(User).options(
+            selectinload(Professional.specialties))
+        if date:
+            # Only professionals with at least one free slot on the requested dates
+            query = query.join(capacity, capacity.c.professional_id == Professional.id)
+        else:
+            query = query.outerjoin(capacity, capacity.c.professional_id == Professional.id)
         
         # Filter by specialty if specified
         if specialty_id and specialty_id > 0:
             query = query.filter(Professional.specialties.any(id=specialty_id))
         
+        if sort == 'availability':
+            query = query.order_by(func.coalesce(capacity.c.free_slots, 0).desc(), Professional.id)
+        
         # Apply pagination
         page = request.args.get('page', 1, type=int)
-        pagination = query.paginate(page=page, per_page=12, error_out=False)
-        results = pagination.items
+        pagination = query.paginate(page=page, per_page=current_app.config['PROFESSIONALS_PER_PAGE'],
+                                    error_out=False)
+        results = [(professional, user) for professional, user, _ in pagination.items]
+        free_slots = {professional.id: slots or 0 for professional, _, slots in pagination.items}
         
         return render_template('search.html', form=form, results=results, 
-                              pagination=pagination, specialty_id=specialty_id)
+                              pagination=pagination, specialty_id=specialty_id,
+                              free_slots=free_slots, search_args={
+                                  'specialty': specialty_id,
+                                  'date': date.isoformat() if date else None,
+                                  'date_end': date_end.isoformat() if date_end else None,
+                                  'sort': sort or None
+                              })
     
     return render_template('search.html', form=form, results=results)
 
+@main_bp.route('/search/first-available')
+def first_available():
+    """Earliest free appointments across every professional of a specialty"""
+    specialty = Specialty.query.get_or_404(request.args.get('specialty', type=int, default=0))
+    limit = _first_available_limit()
+    
+    slots = _first_available_slots(specialty.id, limit)
+    
+    return render_template('first_available.html', specialty=specialty, slots=slots, limit=limit)
+
+@main_bp.route('/api/first-available')
+def api_first_available():
+    """API endpoint with the earliest free appointments of a specialty"""
+    specialty_id = request.args.get('specialty', type=int)
+    if not specialty_id or not db.session.get(Specialty, specialty_id):
+        return jsonify({'error': 'Specialty not found'}), 404
+    
+    slots = _first_available_slots(specialty_id, _first_available_limit())
+    
+    return jsonify([{
+        'professional_id': slot['professional'].id,
+        'professional_name': slot['user'].get_full_name(),
+        'date': slot['date'].isoformat(),
+        'start': slot['start'].strftime('%H:%M'),
+        'end': slot['end'].strftime('%H:%M')
+    } for slot in slots])
+
+def _first_available_limit():
+    """Number of slots requested, capped to keep the search bounded"""
+    limit = request.args.get('n', type=int, default=5)
+    return max(1, min(limit, current_app.config['FIRST_AVAILABLE_MAX_RESULTS']))
+
+def _first_available_slots(specialty_id, limit):
+    """Earliest slots of a specialty with their professional and user loaded in one query"""
+    slots = earliest_available_slots(specialty_id, limit)
+    
+    professional_ids = {slot['professional_id'] for slot in slots}
+    professionals = {
+        professional.id: (professional, user)
+        for professional, user in db.session.query(Professional, User).join(User).filter(
+            Professional.id.in_(professional_ids))
+    } if professional_ids else {}
+    
+    for slot in slots:
+        slot['professional'], slot['user'] = professionals[slot['professional_id']]
+    return slots
+
+def _parse_date(value):
+    """Parse an ISO date from the query string"""
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
 @main_bp.route('/professional/<int:professional_id>')
 def professional_profile(professional_id):
     """View a professional's profile and availability"""
-    professional = Professional.query.get_or_404(professional_id)
-    user = User.query.get(professional.user_id)
+    professional = db.get_or_404(Professional, professional_id, options=[
+        joinedload(Professional.user), selectinload(Professional.specialties)])
+    user = professional.user
     
     if not professional or not user:
         flash('Profesional no encontrado.', 'danger')
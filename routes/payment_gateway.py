@@ -1,6 +1,7 @@
-from flask import Blueprint, request, jsonify, current_app, redirect, url_for, flash, render_template
+from flask import Blueprint, request, jsonify, current_app, redirect, url_for, flash, render_template, g
 from flask_login import login_required, current_user
-from models import Appointment, Client, db
+from models import Appointment, db
+from access_utils import client_required, current_client
 from datetime import datetime
 import logging
 
@@ -13,19 +14,14 @@ logger = logging.getLogger(__name__)
 payment_bp = Blueprint('payment', __name__)
 
 @payment_bp.route('/process/<int:appointment_id>')
-@login_required
+@client_required
 def process_payment(appointment_id):
     """
     Procesar pago para una cita usando la pasarela configurada
     """
-    if not current_user.is_client():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    appointment = Appointment.query.get_or_404(appointment_id)
-    client = Client.query.filter_by(user_id=current_user.id).first()
+    appointment = Appointment.query.filter_by(id=appointment_id, client_id=g.client.id).first()
     
-    if appointment.client_id != client.id:
+    if appointment is None:
         flash('No tienes permiso para pagar esta cita', 'danger')
         return redirect(url_for('client.my_appointments'))
     
@@ -58,14 +54,14 @@ def refund_payment(appointment_id):
         flash('No tienes permisos para acceder a esta función', 'danger')
         return redirect(url_for('main.index'))
     
-    appointment = Appointment.query.get_or_404(appointment_id)
-    
-    # Verificar permisos
+    # Verificar permisos: los clientes solo pueden reembolsar sus propias citas
     if current_user.is_client():
-        client = Client.query.filter_by(user_id=current_user.id).first()
-        if appointment.client_id != client.id:
+        appointment = Appointment.query.filter_by(id=appointment_id, client_id=current_client().id).first()
+        if appointment is None:
             flash('No tienes permiso para reembolsar esta cita', 'danger')
             return redirect(url_for('client.my_appointments'))
+    else:
+        appointment = Appointment.query.get_or_404(appointment_id)
     
     # Verificar que el pago existe
     if appointment.payment_status != 'paid' or not appointment.payment_id:
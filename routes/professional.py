@@ -1,76 +1,73 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, g
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
+from sqlalchemy import select, func, or_
+from sqlalchemy.orm import aliased, joinedload
 from app import db
-from models import User, Professional, Specialty, Schedule, Appointment
+from models import User, Client, Professional, Specialty, Schedule, Appointment
+from access_utils import professional_required
+from catalog_utils import specialty_choices
 from forms import ProfessionalProfileForm, ScheduleForm, AppointmentStatusForm
-from utils import send_confirmation_email, get_upcoming_appointments
+from utils import queue_confirmation_email, get_upcoming_appointments
 
 professional_bp = Blueprint('professional', __name__)
 
+def _status_counts_query(professional_id):
+    """Number of appointments of a professional by status"""
+    return (select(Appointment.status, func.count())
+            .where(Appointment.professional_id == professional_id)
+            .group_by(Appointment.status))
+
+def _agenda_query(professional_id, today):
+    """
+    Active appointments from today on, numbered chronologically: the first
+    five are the upcoming list and today's are all kept for the agenda
+    """
+    ranked = select(
+        Appointment,
+        func.row_number().over(order_by=(Appointment.date, Appointment.start_time)).label('position')
+    ).where(
+        Appointment.professional_id == professional_id,
+        Appointment.date >= today,
+        Appointment.status.in_(['confirmed', 'pending'])
+    ).subquery()
+    ranked_appointment = aliased(Appointment, ranked)
+    return (select(ranked_appointment)
+            .where(or_(ranked.c.position <= 5, ranked.c.date == today))
+            .order_by(ranked.c.position)
+            .options(joinedload(ranked_appointment.client).joinedload(Client.user)))
+
 @professional_bp.route('/dashboard')
-@login_required
+@professional_required
 def dashboard():
     """Professional dashboard"""
-    if not current_user.is_professional():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
+    professional = g.professional
     
-    professional = Professional.query.filter_by(user_id=current_user.id).first()
-    if not professional:
-        flash('Perfil de profesional no encontrado', 'warning')
-        return redirect(url_for('professional.profile'))
+    # Get appointment statistics
+    counts = dict(db.session.execute(_status_counts_query(professional.id)).all())
     
-    # Get upcoming appointments
     today = datetime.now().date()
-    upcoming_appointments = Appointment.query.filter(
-        Appointment.professional_id == professional.id,
-        Appointment.date >= today,
-        Appointment.status.in_(['confirmed', 'pending'])
-    ).order_by(Appointment.date, Appointment.start_time).limit(5).all()
+    appointments = db.session.execute(_agenda_query(professional.id, today)).scalars().all()
     
-    # Get appointment statistics
-    total_appointments = Appointment.query.filter_by(professional_id=professional.id).count()
-    pending_appointments = Appointment.query.filter_by(
-        professional_id=professional.id, status='pending').count()
-    confirmed_appointments = Appointment.query.filter_by(
-        professional_id=professional.id, status='confirmed').count()
-    
-    # Get today's appointments
-    today_appointments = Appointment.query.filter(
-        Appointment.professional_id == professional.id,
-        Appointment.date == today,
-        Appointment.status.in_(['confirmed', 'pending'])
-    ).order_by(Appointment.start_time).all()
+    upcoming_appointments = appointments[:5]
+    today_appointments = [appointment for appointment in appointments if appointment.date == today]
     
     return render_template('professional/dashboard.html',
                           professional=professional,
                           upcoming_appointments=upcoming_appointments,
                           today_appointments=today_appointments,
-                          total_appointments=total_appointments,
-                          pending_appointments=pending_appointments,
-                          confirmed_appointments=confirmed_appointments)
+                          total_appointments=sum(counts.values()),
+                          pending_appointments=counts.get('pending', 0),
+                          confirmed_appointments=counts.get('confirmed', 0))
 
 @professional_bp.route('/profile', methods=['GET', 'POST'])
-@login_required
+@professional_required
 def profile():
     """Professional profile page"""
-    if not current_user.is_professional():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    # Get professional profile or create if not exists
-    professional = Professional.query.filter_by(user_id=current_user.id).first()
-    if not professional:
-        professional = Professional(user_id=current_user.id)
-        db.session.add(professional)
-        db.session.commit()
-    
-    # Get all specialties for the form
-    all_specialties = Specialty.query.order_by(Specialty.name).all()
+    professional = g.professional
     
     form = ProfessionalProfileForm()
-    form.specialties.choices = [(s.id, s.name) for s in all_specialties]
+    form.specialties.choices = list(specialty_choices())
     
     if form.validate_on_submit():
         current_user.first_name = form.first_name.data
@@ -80,9 +77,11 @@ def profile():
         professional.bio = form.bio.data
         professional.years_experience = form.years_experience.data
         professional.accepts_insurance = form.accepts_insurance.data
+        professional.slot_duration = form.slot_duration.data
+        professional.slot_buffer = form.slot_buffer.data or 0
         
         # Update specialties
-        professional.specialties = [Specialty.query.get(spec_id) for spec_id in form.specialties.data]
+        professional.specialties = Specialty.query.filter(Specialty.id.in_(form.specialties.data)).all()
         
         db.session.commit()
         flash('Perfil actualizado correctamente', 'success')
@@ -96,6 +95,8 @@ def profile():
         form.bio.data = professional.bio
         form.years_experience.data = professional.years_experience
         form.accepts_insurance.data = professional.accepts_insurance
+        form.slot_duration.data = professional.slot_duration
+        form.slot_buffer.data = professional.slot_buffer
         form.specialties.data = [s.id for s in professional.specialties]
     
     return render_template('profile.html', 
@@ -105,17 +106,10 @@ def profile():
                           is_professional=True)
 
 @professional_bp.route('/schedule', methods=['GET', 'POST'])
-@login_required
+@professional_required
 def schedule():
     """Manage professional's schedule"""
-    if not current_user.is_professional():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    professional = Professional.query.filter_by(user_id=current_user.id).first()
-    if not professional:
-        flash('Perfil de profesional no encontrado', 'warning')
-        return redirect(url_for('professional.profile'))
+    professional = g.professional
     
     form = ScheduleForm()
     
@@ -153,17 +147,12 @@ def schedule():
                           days=days)
 
 @professional_bp.route('/delete_schedule/<int:schedule_id>', methods=['POST'])
-@login_required
+@professional_required
 def delete_schedule(schedule_id):
     """Delete a schedule entry"""
-    if not current_user.is_professional():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    schedule = Schedule.query.get_or_404(schedule_id)
-    professional = Professional.query.filter_by(user_id=current_user.id).first()
+    schedule = Schedule.query.filter_by(id=schedule_id, professional_id=g.professional.id).first()
     
-    if schedule.professional_id != professional.id:
+    if schedule is None:
         flash('No tienes permiso para eliminar este horario', 'danger')
         return redirect(url_for('professional.schedule'))
     
@@ -174,17 +163,10 @@ def delete_schedule(schedule_id):
     return redirect(url_for('professional.schedule'))
 
 @professional_bp.route('/appointments')
-@login_required
+@professional_required
 def appointments():
     """View and manage appointments"""
-    if not current_user.is_professional():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    professional = Professional.query.filter_by(user_id=current_user.id).first()
-    if not professional:
-        flash('Perfil de profesional no encontrado', 'warning')
-        return redirect(url_for('professional.profile'))
+    professional = g.professional
     
     # Filter parameters
     status = request.args.get('status', 'all')
@@ -218,17 +200,14 @@ def appointments():
                           date_filter=date_filter)
 
 @professional_bp.route('/update_appointment/<int:appointment_id>', methods=['GET', 'POST'])
-@login_required
+@professional_required
 def update_appointment(appointment_id):
     """Update appointment status"""
-    if not current_user.is_professional():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    appointment = Appointment.query.get_or_404(appointment_id)
-    professional = Professional.query.filter_by(user_id=current_user.id).first()
+    appointment = Appointment.query.options(
+        joinedload(Appointment.client).joinedload(Client.user)
+    ).filter_by(id=appointment_id, professional_id=g.professional.id).first()
     
-    if appointment.professional_id != professional.id:
+    if appointment is None:
         flash('No tienes permiso para actualizar esta cita', 'danger')
         return redirect(url_for('professional.appointments'))
     
@@ -237,10 +216,10 @@ def update_appointment(appointment_id):
     if form.validate_on_submit():
         appointment.status = form.status.data
         appointment.notes = form.notes.data
-        db.session.commit()
         
-        # Send confirmation email for status change
-        send_confirmation_email(appointment)
+        # Status email, committed together with the change
+        queue_confirmation_email(appointment)
+        db.session.commit()
         
         flash('Estado de la cita actualizado correctamente', 'success')
         return redirect(url_for('professional.appointments'))
@@ -254,64 +233,84 @@ def update_appointment(appointment_id):
                           appointment=appointment)
 
 @professional_bp.route('/calendar')
-@login_required
+@professional_required
 def calendar():
     """Calendar view of appointments"""
-    if not current_user.is_professional():
-        flash('No tienes permisos para acceder a esta página', 'danger')
-        return redirect(url_for('main.index'))
-    
-    professional = Professional.query.filter_by(user_id=current_user.id).first()
-    if not professional:
-        flash('Perfil de profesional no encontrado', 'warning')
-        return redirect(url_for('professional.profile'))
+    professional = g.professional
     
     return render_template('professional/calendar.html', professional=professional)
 
+# FullCalendar event colors by appointment status
+STATUS_COLORS = {
+    'pending': '#ffc107',  # warning
+    'confirmed': '#28a745',  # success
+    'cancelled': '#dc3545',  # danger
+    'completed': '#17a2b8'   # info
+}
+
 @professional_bp.route('/api/appointments')
 @login_required
 def api_appointments():
-    """API endpoint to get appointments for calendar"""
+    """
+    API endpoint to get appointments for calendar
+    
+    Query parameters:
+        start, end: ISO range sent by FullCalendar (end exclusive), capped to
+            CALENDAR_MAX_RANGE_DAYS
+        include_cancelled: ``0`` or ``false`` to leave cancelled appointments out
+    """
     if not current_user.is_professional():
         return jsonify({'error': 'Unauthorized'}), 403
     
-    professional = Professional.query.filter_by(user_id=current_user.id).first()
-    if not professional:
+    professional_id = db.session.scalar(select(Professional.id).where(Professional.user_id == current_user.id))
+    if not professional_id:
         return jsonify({'error': 'Professional profile not found'}), 404
     
-    # Get date range from request
-    start = request.args.get('start', datetime.now().date().isoformat())
-    end = request.args.get('end', (datetime.now().date() + timedelta(days=30)).isoformat())
-    
-    # Get appointments in date range
-    appointments = Appointment.query.filter(
-        Appointment.professional_id == professional.id,
-        Appointment.date >= start,
-        Appointment.date <= end
-    ).all()
+    # Get date range from request (FullCalendar sends ISO datetimes, end exclusive)
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    start = _parse_calendar_datetime(request.args.get('start')) or today
+    end = _parse_calendar_datetime(request.args.get('end')) or today + timedelta(days=31)
+    end = min(end, start + timedelta(days=current_app.config['CALENDAR_MAX_RANGE_DAYS']))
+    
+    # Only the columns of the feed, with the client name joined in, from a
+    # range scan of (professional_id, starts_at)
+    query = select(
+        Appointment.id, Appointment.starts_at, Appointment.ends_at, Appointment.status,
+        Appointment.notes, User.first_name, User.last_name
+    ).join(
+        Client, Appointment.client_id == Client.id
+    ).join(
+        User, Client.user_id == User.id
+    ).where(
+        Appointment.professional_id == professional_id,
+        Appointment.starts_at >= start,
+        Appointment.starts_at < end
+    )
+    if request.args.get('include_cancelled', '1').lower() in ('0', 'false'):
+        query = query.where(Appointment.status != 'cancelled')
     
     # Format appointments for FullCalendar
     events = []
-    status_colors = {
-        'pending': '#ffc107',  # warning
-        'confirmed': '#28a745',  # success
-        'cancelled': '#dc3545',  # danger
-        'completed': '#17a2b8'   # info
-    }
-    
-    for appointment in appointments:
-        client_name = f"{appointment.client.user.first_name} {appointment.client.user.last_name}"
+    for row in db.session.execute(query):
+        client_name = f"{row.first_name} {row.last_name}"
         events.append({
-            'id': appointment.id,
+            'id': row.id,
             'title': f"Cita con {client_name}",
-            'start': f"{appointment.date.isoformat()}T{appointment.start_time.isoformat()}",
-            'end': f"{appointment.date.isoformat()}T{appointment.end_time.isoformat()}",
-            'color': status_colors.get(appointment.status, '#6c757d'),
+            'start': row.starts_at.isoformat(),
+            'end': row.ends_at.isoformat(),
+            'color': STATUS_COLORS.get(row.status, '#6c757d'),
             'extendedProps': {
-                'status': appointment.status,
+                'status': row.status,
                 'clientName': client_name,
-                'notes': appointment.notes
+                'notes': row.notes
             }
         })
     
     return jsonify(events)
+
+def _parse_calendar_datetime(value):
+    """Parse a FullCalendar range bound, ignoring its UTC offset; None if missing or invalid"""
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return None
@@ -1,11 +1,13 @@
 """
 Webhook routes for Stripe and other external services
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for
 import json
 import logging
 from paypal_utils import handle_webhook as handle_paypal_webhook
-from sendgrid_utils import process_daily_reminders
+from app import db
+from models import ReminderJob
+from reminder_utils import enqueue_reminder_job, start_reminder_worker, is_abandoned
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -34,23 +36,45 @@ def paypal_webhook():
         logger.error(f"Error processing Wompi webhook: {str(e)}")
         return jsonify({'error': str(e)}), 400
 
+def _cron_authorized():
+    api_key = request.headers.get('X-API-Key')
+    return bool(api_key) and api_key == current_app.config.get('CRON_API_KEY')
+
 @webhook_bp.route('/cron/daily-reminders', methods=['POST'])
 def daily_reminders():
     """
-    Process daily appointment reminders (to be triggered by a cron job)
+    Queue the daily appointment reminders (to be triggered by a cron job)
+
+    Answers at once with the background job; its progress is reported by
+    the status endpoint.
     """
-    api_key = request.headers.get('X-API-Key')
-    if not api_key or api_key != current_app.config.get('CRON_API_KEY'):
+    if not _cron_authorized():
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        total, success, failed = process_daily_reminders()
+        job = enqueue_reminder_job()
+        if not current_app.testing:
+            # Also resumes any job whose worker died
+            start_reminder_worker(current_app._get_current_object())
         return jsonify({
-            'status': 'success',
-            'total': total,
-            'success': success,
-            'failed': failed
-        }), 200
+            **job.to_dict(),
+            'status_url': url_for('webhooks.daily_reminders_status', job_id=job.id)
+        }), 202
     except Exception as e:
-        logger.error(f"Error processing daily reminders: {str(e)}")
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        logger.error(f"Error queueing daily reminders: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@webhook_bp.route('/cron/daily-reminders/<int:job_id>', methods=['GET'])
+def daily_reminders_status(job_id):
+    """
+    Report the progress of a daily reminders job
+    """
+    if not _cron_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = db.session.get(ReminderJob, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if is_abandoned(job) and not current_app.testing:
+        start_reminder_worker(current_app._get_current_object())
+    return jsonify(job.to_dict()), 200
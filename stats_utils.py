@@ -0,0 +1,53 @@
+"""
+Aggregated statistics for the admin dashboard.
+"""
+from flask import current_app
+from sqlalchemy import select, func
+from app import db
+from cache_utils import Snapshot
+from config import Config
+from models import User, Professional, Client, Appointment
+
+APPOINTMENT_STATUSES = ('pending', 'confirmed', 'cancelled', 'completed')
+
+# Counts shown on the admin dashboard, refreshed in the background every
+# ADMIN_STATS_TTL seconds so reloading the page does not rescan the tables
+dashboard_snapshot = Snapshot(ttl=Config.ADMIN_STATS_TTL)
+
+def compute_dashboard_stats():
+    """
+    Compute the dashboard counts with two queries
+
+    Returns:
+        dict: ``total_users``, ``total_professionals``, ``total_clients``,
+            ``total_appointments`` and ``<status>_appointments`` for every status
+    """
+    users, professionals, clients = db.session.execute(select(
+        select(func.count()).select_from(User).scalar_subquery(),
+        select(func.count()).select_from(Professional).scalar_subquery(),
+        select(func.count()).select_from(Client).scalar_subquery()
+    )).one()
+
+    by_status = dict(db.session.execute(
+        select(Appointment.status, func.count()).group_by(Appointment.status)
+    ).all())
+
+    stats = {
+        'total_users': users,
+        'total_professionals': professionals,
+        'total_clients': clients,
+        'total_appointments': sum(by_status.values()),
+    }
+    for status in APPOINTMENT_STATUSES:
+        stats[f'{status}_appointments'] = by_status.get(status, 0)
+    return stats
+
+def get_dashboard_stats():
+    """Dashboard counts from the snapshot, computed on first use"""
+    app = current_app._get_current_object()
+
+    def load():
+        with app.app_context():
+            return compute_dashboard_stats()
+
+    return dashboard_snapshot.get(load)
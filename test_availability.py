@@ -0,0 +1,399 @@
+import unittest
+from datetime import datetime, timedelta, time
+from sqlalchemy import event
+from app import app, db
+from models import User, Client, Professional, Appointment, Specialty, Schedule, AvailabilityDay
+from availability_utils import (get_available_slots, get_available_slots_range, _compute_day_slots,
+                                invalidate_availability, rebuild_availability, earliest_available_slots,
+                                availability_version, ensure_materialized)
+
+class TestAvailability(unittest.TestCase):
+    """Test suite for the availability engine"""
+
+    def setUp(self):
+        """Set up test environment before each test"""
+        # Configure app for testing
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use in-memory database
+        app.config['SECRET_KEY'] = 'test-secret-key'  # Set a secret key for testing
+        app.secret_key = 'test-secret-key'  # Also set directly on the app
+
+        # Create application context
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        # Create database tables
+        db.drop_all()
+        db.create_all()
+        invalidate_availability()
+
+        # Create a professional working Monday to Friday from 09:00 to 13:00
+        pro_user = User(username='testpro', email='pro@test.com',
+                        first_name='Pro', last_name='Test', role='professional')
+        pro_user.set_password('password123')
+        client_user = User(username='testclient', email='client@test.com',
+                           first_name='Client', last_name='Test', role='client')
+        client_user.set_password('password123')
+        db.session.add_all([pro_user, client_user])
+        db.session.flush()
+
+        self.professional = Professional(user_id=pro_user.id)
+        self.client_profile = Client(user_id=client_user.id)
+        db.session.add_all([self.professional, self.client_profile])
+        db.session.flush()
+
+        for day in range(5):
+            db.session.add(Schedule(professional_id=self.professional.id, day_of_week=day,
+                                    start_time=time(9, 0), end_time=time(13, 0)))
+        db.session.commit()
+
+        # First Monday after today
+        today = datetime.now().date()
+        self.monday = today + timedelta(days=7 - today.weekday())
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.close()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _book(self, date, start, end, status='confirmed'):
+        appointment = Appointment(professional_id=self.professional.id,
+                                  client_id=self.client_profile.id,
+                                  date=date, start_time=start, end_time=end, status=status)
+        db.session.add(appointment)
+        db.session.commit()
+        return appointment
+
+    def _count_queries(self, func, *args, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, len(statements)
+
+    def test_slots_exclude_booked_times(self):
+        """Booked and overlapping slots are not offered, cancelled ones are"""
+        self._book(self.monday, time(10, 0), time(11, 0))
+        self._book(self.monday, time(11, 30), time(12, 0))
+        self._book(self.monday, time(9, 0), time(10, 0), status='cancelled')
+
+        slots = get_available_slots(self.professional.id, self.monday)
+
+        self.assertEqual(list(slots), [(9 * 60, 10 * 60), (12 * 60, 13 * 60)])
+
+    def test_sweep_handles_unsorted_and_overlapping_bookings(self):
+        """Short slots are checked against unsorted, overlapping bookings"""
+        schedules = [Schedule(start_time=time(9, 0), end_time=time(10, 10))]
+        appointments = [
+            Appointment(start_time=time(9, 50), end_time=time(10, 0)),
+            Appointment(start_time=time(9, 10), end_time=time(9, 25)),
+            Appointment(start_time=time(9, 20), end_time=time(9, 35)),
+        ]
+
+        slots = _compute_day_slots(schedules, appointments, duration=15)
+
+        # Only the truncated last slot of the grid is free
+        self.assertEqual(list(slots), [(10 * 60, 10 * 60 + 10)])
+
+    def test_range_matches_single_day(self):
+        """The range API returns the same slots as the per-day API"""
+        self._book(self.monday, time(10, 0), time(11, 0))
+        self._book(self.monday + timedelta(days=2), time(9, 0), time(12, 0))
+        end = self.monday + timedelta(days=13)
+
+        days = get_available_slots_range(self.professional.id, self.monday, end)
+
+        self.assertEqual(len(days), 14)
+        for check_date, slots in days.items():
+            self.assertEqual(slots, get_available_slots(self.professional.id, check_date))
+        # Weekends have no schedule
+        self.assertEqual(len(days[self.monday + timedelta(days=5)]), 0)
+
+    def test_range_query_count_is_constant(self):
+        """The range API costs the same number of queries for 14 or 60 days"""
+        self._book(self.monday, time(10, 0), time(11, 0))
+        db.session.expire_all()
+
+        _, short_count = self._count_queries(
+            get_available_slots_range, self.professional.id, self.monday, self.monday + timedelta(days=13))
+        db.session.expire_all()
+        _, long_count = self._count_queries(
+            get_available_slots_range, self.professional.id, self.monday, self.monday + timedelta(days=59))
+
+        self.assertEqual(short_count, 2)
+        self.assertEqual(long_count, short_count)
+
+    def test_cache_serves_repeat_views_without_queries(self):
+        """A second view of the same window is answered from the cache"""
+        end = self.monday + timedelta(days=13)
+        first = get_available_slots_range(self.professional.id, self.monday, end)
+
+        second, count = self._count_queries(get_available_slots_range, self.professional.id, self.monday, end)
+
+        self.assertEqual(count, 0)
+        self.assertEqual(second, first)
+
+    def test_cache_invalidated_by_appointment_changes(self):
+        """Booking, cancelling and moving appointments refresh the cached days"""
+        tuesday = self.monday + timedelta(days=1)
+        get_available_slots_range(self.professional.id, self.monday, tuesday)
+
+        appointment = self._book(self.monday, time(9, 0), time(10, 0))
+        self.assertNotIn((540, 600), list(get_available_slots(self.professional.id, self.monday)))
+
+        appointment.date = tuesday
+        db.session.commit()
+        self.assertIn((540, 600), list(get_available_slots(self.professional.id, self.monday)))
+        self.assertNotIn((540, 600), list(get_available_slots(self.professional.id, tuesday)))
+
+        appointment.status = 'cancelled'
+        db.session.commit()
+        self.assertEqual(len(get_available_slots(self.professional.id, tuesday)), 4)
+
+    def test_cache_invalidated_by_schedule_changes(self):
+        """Editing a schedule refreshes every cached day of the professional"""
+        get_available_slots(self.professional.id, self.monday)
+
+        schedule = Schedule.query.filter_by(professional_id=self.professional.id, day_of_week=0).first()
+        schedule.end_time = time(11, 0)
+        db.session.commit()
+
+        self.assertEqual(len(get_available_slots(self.professional.id, self.monday)), 2)
+
+    def test_slot_settings_per_professional_and_specialty(self):
+        """Slot duration falls back from the professional to its specialty and the buffer spaces slots"""
+        specialty = Specialty(name='Pediatría', slot_duration=30)
+        db.session.add(specialty)
+        self.professional.specialties.append(specialty)
+        db.session.commit()
+        self.assertEqual(len(get_available_slots(self.professional.id, self.monday)), 8)
+
+        self.professional.slot_duration = 15
+        self.professional.slot_buffer = 5
+        db.session.commit()
+        slots = get_available_slots(self.professional.id, self.monday)
+        self.assertEqual(list(slots)[:2], [(540, 555), (560, 575)])
+        self.assertEqual(len(slots), 12)
+
+        # The buffer also applies after a booked appointment
+        self._book(self.monday, time(9, 0), time(9, 15))
+        self.assertEqual(list(get_available_slots(self.professional.id, self.monday))[0], (560, 575))
+
+        # and before it: the slot ending at 10:15 is too close to a booking at 10:18
+        self._book(self.monday, time(10, 18), time(10, 33))
+        self.assertNotIn((600, 615), list(get_available_slots(self.professional.id, self.monday)))
+
+        response = app.test_client().get(f'/client/api/availability/{self.professional.id}'
+                                         f'?start={self.monday.isoformat()}&end={self.monday.isoformat()}')
+        self.assertEqual(response.get_json()['days'][self.monday.isoformat()][0], [560, 575])
+
+    def test_availability_api_revalidates_with_etag(self):
+        """The JSON endpoint answers repeat views with 304 until the availability changes"""
+        client = app.test_client()
+        url = (f'/client/api/availability/{self.professional.id}'
+               f'?start={self.monday.isoformat()}&end={(self.monday + timedelta(days=6)).isoformat()}')
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.get_json()['days']),
+                         [(self.monday + timedelta(days=i)).isoformat() for i in range(5)])
+        self.assertEqual(response.get_json()['days'][self.monday.isoformat()][0], [540, 600])
+        etag = response.headers['ETag']
+
+        revalidated, count = self._count_queries(client.get, url, headers={'If-None-Match': etag})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(count, 1)
+
+        # Booking a slot bumps the version and the ETag
+        self._book(self.monday, time(9, 0), time(10, 0))
+        response = client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.get_json()['days'][self.monday.isoformat()][0], [600, 660])
+
+        self.assertEqual(client.get(f'/client/api/availability/{self.professional.id}'
+                                    f'?start={self.monday.isoformat()}&end=2000-01-01').status_code, 400)
+        self.assertEqual(client.get('/client/api/availability/999').status_code, 404)
+
+    def test_version_change_from_another_process_drops_cached_days(self):
+        """A version bumped by another process invalidates the local cache"""
+        availability_version(self.professional.id)
+        self.assertEqual(len(get_available_slots(self.professional.id, self.monday)), 4)
+
+        # Simulate another worker booking directly in the database
+        with db.engine.begin() as connection:
+            connection.execute(Appointment.__table__.insert().values(
+                professional_id=self.professional.id, client_id=self.client_profile.id,
+                date=self.monday, start_time=time(9, 0), end_time=time(10, 0), status='confirmed',
+                starts_at=datetime.combine(self.monday, time(9, 0)),
+                ends_at=datetime.combine(self.monday, time(10, 0))))
+            connection.execute(Professional.__table__.update().values(
+                availability_version=Professional.__table__.c.availability_version + 1))
+
+        self.assertEqual(len(get_available_slots(self.professional.id, self.monday)), 4)
+        availability_version(self.professional.id)
+        self.assertEqual(len(get_available_slots(self.professional.id, self.monday)), 3)
+
+    def _summary(self, date):
+        return db.session.get(AvailabilityDay, (self.professional.id, date))
+
+    def test_rebuild_materializes_working_days(self):
+        """The rebuild writes one summary row per working day of the horizon"""
+        self._book(self.monday, time(9, 0), time(10, 0))
+
+        written = rebuild_availability(self.monday, self.monday + timedelta(days=13))
+        db.session.commit()
+
+        self.assertEqual(written, 10)
+        summary = self._summary(self.monday)
+        self.assertEqual((summary.free_slots, summary.free_minutes, summary.first_free), (3, 180, time(10, 0)))
+        self.assertIsNone(self._summary(self.monday + timedelta(days=5)))
+
+    def test_materialized_window_is_not_rebuilt(self):
+        """Dates nobody works are remembered, so a repeated search only reads"""
+        saturday, sunday = self.monday + timedelta(days=5), self.monday + timedelta(days=6)
+        ensure_materialized(saturday, sunday)
+        self.assertIsNone(self._summary(saturday))
+
+        _, queries = self._count_queries(ensure_materialized, saturday, sunday)
+        self.assertEqual(queries, 1)
+
+        # A schedule added for a materialized date refreshes it
+        db.session.add(Schedule(professional_id=self.professional.id, day_of_week=5,
+                                start_time=time(9, 0), end_time=time(11, 0)))
+        db.session.commit()
+        self.assertEqual(self._summary(saturday).free_slots, 2)
+
+    def test_summary_maintained_incrementally(self):
+        """Bookings, cancellations and schedule edits update the materialized rows"""
+        rebuild_availability(self.monday, self.monday + timedelta(days=6))
+        db.session.commit()
+
+        appointment = self._book(self.monday, time(9, 0), time(11, 0))
+        self.assertEqual(self._summary(self.monday).free_slots, 2)
+
+        appointment.status = 'cancelled'
+        db.session.commit()
+        self.assertEqual(self._summary(self.monday).free_slots, 4)
+
+        schedule = Schedule.query.filter_by(professional_id=self.professional.id, day_of_week=1).first()
+        schedule.start_time = time(12, 0)
+        db.session.commit()
+        self.assertEqual(self._summary(self.monday + timedelta(days=1)).free_slots, 1)
+
+        db.session.delete(schedule)
+        db.session.commit()
+        self.assertIsNone(self._summary(self.monday + timedelta(days=1)))
+
+    def test_search_filters_by_free_capacity(self):
+        """Searching by date only lists professionals with free slots that day"""
+        busy_user = User(username='busypro', email='busy@test.com',
+                         first_name='Busy', last_name='Pro', role='professional')
+        busy_user.set_password('password123')
+        db.session.add(busy_user)
+        db.session.flush()
+        busy = Professional(user_id=busy_user.id)
+        db.session.add(busy)
+        db.session.flush()
+        db.session.add(Schedule(professional_id=busy.id, day_of_week=0,
+                                start_time=time(9, 0), end_time=time(10, 0)))
+        db.session.commit()
+        self._book(self.monday, time(10, 0), time(11, 0))
+
+        client = app.test_client()
+        response = client.get(f'/search?specialty=0&date={self.monday.isoformat()}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Pro Test', response.data)
+        self.assertIn(b'3 horarios disponibles', response.data)
+        self.assertIn(b'Busy Pro', response.data)
+
+        # Once the busy professional is fully booked they drop out of the results
+        appointment = Appointment(professional_id=busy.id, client_id=self.client_profile.id,
+                                  date=self.monday, start_time=time(9, 0), end_time=time(10, 0),
+                                  status='confirmed')
+        db.session.add(appointment)
+        db.session.commit()
+        response = client.get(f'/search?specialty=0&date={self.monday.isoformat()}')
+        self.assertIn(b'Pro Test', response.data)
+        self.assertNotIn(b'Busy Pro', response.data)
+
+        # Sorting by availability puts the professional with more free slots first over a range
+        response = client.get(f'/search?specialty=0&date={self.monday.isoformat()}'
+                              f'&date_end={(self.monday + timedelta(days=7)).isoformat()}&sort=availability')
+        self.assertIn(b'Busy Pro', response.data)
+        self.assertLess(response.data.index(b'Pro Test'), response.data.index(b'Busy Pro'))
+
+    def test_earliest_available_slots_merge_professionals(self):
+        """The earliest slots of a specialty interleave professionals chronologically"""
+        specialty = Specialty(name='Cardiología')
+        other_user = User(username='otherpro', email='other@test.com',
+                          first_name='Other', last_name='Pro', role='professional')
+        other_user.set_password('password123')
+        db.session.add_all([specialty, other_user])
+        db.session.flush()
+        other = Professional(user_id=other_user.id)
+        other.specialties.append(specialty)
+        self.professional.specialties.append(specialty)
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(Schedule(professional_id=other.id, day_of_week=0,
+                                start_time=time(8, 0), end_time=time(10, 0)))
+        db.session.commit()
+        self._book(self.monday, time(9, 0), time(10, 0))
+
+        slots = earliest_available_slots(specialty.id, limit=3, start_date=self.monday)
+
+        self.assertEqual([(s['professional_id'], s['date'], s['start']) for s in slots], [
+            (other.id, self.monday, time(8, 0)),
+            (other.id, self.monday, time(9, 0)),
+            (self.professional.id, self.monday, time(10, 0)),
+        ])
+
+        response = app.test_client().get(f'/api/first-available?specialty={specialty.id}&n=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_json()), 2)
+        response = app.test_client().get(f'/search/first-available?specialty={specialty.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Dr. Other Pro', response.data)
+
+    def test_earliest_available_slots_open_only_the_professionals_needed(self):
+        """Professionals whose first free slot comes later are never computed"""
+        specialty = Specialty(name='Dermatología')
+        self.professional.specialties.append(specialty)
+        db.session.add(specialty)
+        for number in range(10):
+            user = User(username=f'latepro{number}', email=f'late{number}@test.com',
+                        first_name='Late', last_name=str(number), role='professional')
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.flush()
+            late = Professional(user_id=user.id)
+            late.specialties.append(specialty)
+            db.session.add(late)
+            db.session.flush()
+            db.session.add(Schedule(professional_id=late.id, day_of_week=0,
+                                    start_time=time(11, 0), end_time=time(13, 0)))
+        db.session.commit()
+        ensure_materialized(self.monday, self.monday + timedelta(days=6))
+        invalidate_availability()
+
+        slots, count = self._count_queries(earliest_available_slots, specialty.id, limit=2,
+                                           start_date=self.monday, days=7)
+
+        self.assertEqual([(s['professional_id'], s['start']) for s in slots],
+                         [(self.professional.id, time(9, 0)), (self.professional.id, time(10, 0))])
+        # Materialized dates, first free slots, then the schedules and
+        # appointments of the one professional whose stream was opened
+        self.assertEqual(count, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,237 @@
+import threading
+import time as clock
+import unittest
+from datetime import datetime, timedelta, time
+from unittest import mock
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app import app, db
+from models import User, Client, Professional, Appointment, Schedule
+from availability_utils import invalidate_availability
+import booking_utils
+from booking_utils import reserve_appointment, OutsideScheduleError, SlotTakenError, BookingBusyError
+
+class TestBooking(unittest.TestCase):
+    """Test suite for atomic appointment booking"""
+
+    THREADS = 16
+
+    def setUp(self):
+        """Set up test environment before each test"""
+        # Configure app for testing
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use in-memory database
+        app.config['SECRET_KEY'] = 'test-secret-key'  # Set a secret key for testing
+        app.secret_key = 'test-secret-key'  # Also set directly on the app
+
+        # Create application context
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        # Create database tables
+        db.drop_all()
+        db.create_all()
+        invalidate_availability()
+
+        # A professional working every day from 08:00 to 20:00 and one client per thread
+        pro_user = User(username='testpro', email='pro@test.com',
+                        first_name='Pro', last_name='Test', role='professional')
+        pro_user.set_password('password123')
+        db.session.add(pro_user)
+        db.session.flush()
+        self.professional = Professional(user_id=pro_user.id)
+        db.session.add(self.professional)
+
+        self.client_ids = []
+        for index in range(self.THREADS):
+            client_user = User(username=f'client{index}', email=f'client{index}@test.com',
+                               first_name='Client', last_name=str(index), role='client')
+            client_user.password_hash = 'unused'
+            db.session.add(client_user)
+            db.session.flush()
+            client = Client(user_id=client_user.id)
+            db.session.add(client)
+            db.session.flush()
+            self.client_ids.append(client.id)
+
+        for day in range(7):
+            db.session.add(Schedule(professional_id=self.professional.id, day_of_week=day,
+                                    start_time=time(8, 0), end_time=time(20, 0)))
+        db.session.commit()
+
+        self.professional_id = self.professional.id
+        self.date = datetime.now().date() + timedelta(days=7)
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.close()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _appointment(self, client_id, start, end, date=None):
+        return Appointment(professional_id=self.professional_id, client_id=client_id,
+                           date=date or self.date, start_time=start, end_time=end, status='pending')
+
+    def _run_parallel(self, bookings):
+        """Book every (client_id, start, end, date) in its own thread, released together"""
+        results = [None] * len(bookings)
+        barrier = threading.Barrier(len(bookings))
+
+        def worker(index, booking):
+            with app.app_context():
+                try:
+                    barrier.wait()
+                    reserve_appointment(self._appointment(*booking))
+                    results[index] = 'booked'
+                except SlotTakenError:
+                    results[index] = 'taken'
+                except Exception as e:
+                    results[index] = repr(e)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=worker, args=(index, booking))
+                   for index, booking in enumerate(bookings)]
+        started = clock.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, clock.perf_counter() - started
+
+    def test_rejects_outside_schedule_and_overlaps(self):
+        """Bookings outside the schedule or overlapping an active appointment are rejected"""
+        reserve_appointment(self._appointment(self.client_ids[0], time(9, 0), time(10, 0)))
+
+        with self.assertRaises(OutsideScheduleError):
+            reserve_appointment(self._appointment(self.client_ids[1], time(19, 30), time(20, 30)))
+        with self.assertRaises(SlotTakenError):
+            reserve_appointment(self._appointment(self.client_ids[1], time(9, 30), time(10, 30)))
+
+        self.assertEqual(Appointment.query.count(), 1)
+
+    def test_slot_buffer_is_kept_around_appointments(self):
+        """Bookings closer to another appointment than the professional's buffer are rejected"""
+        self.professional.slot_buffer = 15
+        db.session.commit()
+        reserve_appointment(self._appointment(self.client_ids[0], time(8, 0), time(8, 30)))
+
+        with self.assertRaises(SlotTakenError):
+            reserve_appointment(self._appointment(self.client_ids[1], time(8, 30), time(9, 0)))
+        reserve_appointment(self._appointment(self.client_ids[1], time(8, 45), time(9, 15)))
+        with self.assertRaises(SlotTakenError):
+            reserve_appointment(self._appointment(self.client_ids[2], time(9, 20), time(9, 50)))
+        self.assertEqual(Appointment.query.count(), 2)
+
+        # The buffer only widens the overlap test of the single validation query
+        self.assertEqual(self._appointment(self.client_ids[2], time(9, 15), time(9, 45)).check_slot(15),
+                         (True, True))
+        self.assertEqual(self._appointment(self.client_ids[2], time(9, 30), time(10, 0)).check_slot(15),
+                         (True, False))
+
+    def test_validation_runs_a_single_query(self):
+        """Schedule containment and every kind of overlap are checked in one statement"""
+        reserve_appointment(self._appointment(self.client_ids[0], time(9, 0), time(10, 0)))
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        cases = [
+            ((time(8, 0), time(9, 0)), (True, False)),     # ends where the booking starts
+            ((time(10, 0), time(11, 0)), (True, False)),   # starts where the booking ends
+            ((time(8, 30), time(9, 30)), (True, True)),    # overlaps the start
+            ((time(9, 30), time(10, 30)), (True, True)),   # overlaps the end
+            ((time(9, 15), time(9, 45)), (True, True)),    # inside the booking
+            ((time(8, 30), time(10, 30)), (True, True)),   # contains the booking
+            ((time(19, 30), time(20, 30)), (False, False)),
+        ]
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            for (start, end), expected in cases:
+                statements.clear()
+                self.assertEqual(self._appointment(self.client_ids[1], start, end).check_slot(), expected)
+                self.assertEqual(len(statements), 1)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    def test_interval_columns_follow_date_and_times(self):
+        """starts_at/ends_at are written on insert and follow later edits"""
+        appointment = reserve_appointment(self._appointment(self.client_ids[0], time(9, 0), time(10, 0)))
+        self.assertEqual((appointment.starts_at, appointment.ends_at),
+                         (datetime.combine(self.date, time(9, 0)), datetime.combine(self.date, time(10, 0))))
+
+        appointment.date = self.date + timedelta(days=1)
+        appointment.end_time = time(9, 30)
+        db.session.commit()
+        self.assertEqual((appointment.starts_at, appointment.ends_at),
+                         (datetime.combine(self.date + timedelta(days=1), time(9, 0)),
+                          datetime.combine(self.date + timedelta(days=1), time(9, 30))))
+
+    def test_unique_index_rejects_duplicate_active_slot(self):
+        """The database rejects a second active appointment in the same slot"""
+        first = self._appointment(self.client_ids[0], time(9, 0), time(10, 0))
+        db.session.add(first)
+        db.session.commit()
+
+        db.session.add(self._appointment(self.client_ids[1], time(9, 0), time(10, 0)))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # Once cancelled, the slot can be booked again
+        first.status = 'cancelled'
+        db.session.commit()
+        reserve_appointment(self._appointment(self.client_ids[1], time(9, 0), time(10, 0)))
+        self.assertEqual(Appointment.query.filter(Appointment.status != 'cancelled').count(), 1)
+
+    def test_lock_timeouts_are_retried_then_reported(self):
+        """A timed out wait for the professional's lock is rolled back and retried a bounded number of times"""
+        lock = booking_utils._lock_professional
+        timeout = OperationalError('UPDATE professional', {}, Exception('database is locked'))
+
+        timeouts = [timeout, timeout]
+
+        def lock_after_timeouts(professional_id):
+            if timeouts:
+                raise timeouts.pop()
+            return lock(professional_id)
+
+        with mock.patch.object(booking_utils, '_lock_professional', side_effect=lock_after_timeouts):
+            reserve_appointment(self._appointment(self.client_ids[0], time(9, 0), time(10, 0)))
+        self.assertEqual(Appointment.query.count(), 1)
+
+        with mock.patch.object(booking_utils, '_lock_professional', side_effect=timeout) as locked:
+            with self.assertRaises(BookingBusyError):
+                reserve_appointment(self._appointment(self.client_ids[1], time(10, 0), time(11, 0)))
+        self.assertEqual(locked.call_count, app.config['BOOKING_LOCK_RETRIES'] + 1)
+        self.assertEqual(Appointment.query.count(), 1)
+
+    def test_parallel_bookings_of_one_slot_have_one_winner(self):
+        """Many clients racing for the same slot: exactly one booking succeeds"""
+        results, elapsed = self._run_parallel(
+            [(client_id, time(9, 0), time(10, 0), None) for client_id in self.client_ids])
+
+        self.assertEqual(results.count('booked'), 1, results)
+        self.assertEqual(results.count('taken'), self.THREADS - 1, results)
+        db.session.expire_all()
+        self.assertEqual(Appointment.query.count(), 1)
+        print(f"\n{self.THREADS} contended bookings resolved in {elapsed * 1000:.0f} ms")
+
+    def test_parallel_bookings_of_distinct_slots_all_succeed(self):
+        """Serializing per professional does not reject bookings of different slots"""
+        bookings = [(client_id, time(8 + index % 12, 0), time(9 + index % 12, 0),
+                     self.date + timedelta(days=index // 12))
+                    for index, client_id in enumerate(self.client_ids)]
+
+        results, elapsed = self._run_parallel(bookings)
+
+        self.assertEqual(results, ['booked'] * self.THREADS)
+        db.session.expire_all()
+        self.assertEqual(Appointment.query.count(), self.THREADS)
+        print(f"\n{self.THREADS} parallel bookings: {self.THREADS / elapsed:.0f} bookings/s")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import unittest
+from flask import g
+from sqlalchemy import event
+from app import app, db
+from models import User, Client
+import login_utils
+from login_utils import load_user, set_user_cache, user_cache, CachedUser
+
+class SharedCache:
+    """Dictionary standing in for a cache shared by several worker processes"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def set(self, key, value):
+        self.entries[key] = value
+        return True
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+class TestLoginCache(unittest.TestCase):
+    """Test suite for the cached Flask-Login user loader"""
+
+    def setUp(self):
+        """Set up test environment before each test"""
+        # Configure app for testing
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use in-memory database
+        app.config['SECRET_KEY'] = 'test-secret-key'  # Set a secret key for testing
+        app.secret_key = 'test-secret-key'  # Also set directly on the app
+
+        # Create application context
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        # Create database tables
+        db.drop_all()
+        db.create_all()
+        user_cache.clear()
+
+        self.client_user = self._user('testclient', 'client')
+        db.session.add(Client(user_id=self.client_user.id))
+        self.admin_user = self._user('admin', 'admin')
+        db.session.commit()
+        self.client_id = self.client_user.id
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.close()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _user(self, username, role):
+        user = User(username=username, email=f'{username}@test.com',
+                    first_name=username.capitalize(), last_name='Test', role=role)
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.flush()
+        return user
+
+    def _login(self, email, password='password123'):
+        client = app.test_client()
+        client.post('/login', data={'email': email, 'password': password})
+        return client
+
+    def _count_queries(self, func, *args, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, len(statements)
+
+    def test_loader_reads_the_database_once(self):
+        """The first load reads the user and later loads are served from the cache"""
+        user, count = self._count_queries(load_user, str(self.client_id))
+        self.assertEqual(count, 1)
+        self.assertIsInstance(user, CachedUser)
+
+        user, count = self._count_queries(load_user, str(self.client_id))
+        self.assertEqual(count, 0)
+        self.assertEqual(user.get_id(), str(self.client_id))
+        self.assertEqual(user.get_full_name(), 'Testclient Test')
+        self.assertTrue(user.is_client())
+        self.assertFalse(user.is_admin())
+        self.assertEqual(user, self.client_user)
+        self.assertIsNone(load_user('9999'))
+
+    def test_changes_to_the_user_invalidate_the_cache(self):
+        """Role, activation and password changes are seen on the next load"""
+        load_user(str(self.client_id))
+
+        self.client_user.role = 'professional'
+        db.session.commit()
+        self.assertTrue(load_user(str(self.client_id)).is_professional())
+
+        self.client_user.set_password('newpassword123')
+        db.session.commit()
+        self.assertNotIn(self.client_id, user_cache._entries)
+
+        # Other columns keep the cached record
+        load_user(str(self.client_id))
+        self.client_user.last_login = db.func.now()
+        db.session.commit()
+        self.assertIn(self.client_id, user_cache._entries)
+
+    def test_changes_reach_a_shared_cache(self):
+        """With a cache shared between processes, a commit drops the copy every process reads"""
+        shared = SharedCache()
+        set_user_cache(shared)
+        try:
+            self.assertIsNotNone(load_user(str(self.client_id)))
+            self.assertIs(login_utils.user_cache, shared)
+            record = shared.get(self.client_id)
+            self.assertTrue(record['is_active'])
+
+            # Another worker caches the old record while this one deactivates the user
+            self.client_user.is_active = False
+            db.session.flush()
+            shared.set(self.client_id, record)
+            db.session.commit()
+
+            self.assertNotIn(self.client_id, shared.entries)
+            self.assertIsNone(load_user(str(self.client_id)))
+        finally:
+            set_user_cache(user_cache)
+
+    def test_deactivation_signs_the_user_out(self):
+        """Deactivating a logged in user through the admin takes effect on their next request"""
+        # Requests share the test's app context, so each one must forget the
+        # user loaded by the previous one
+        browser = self._login('testclient@test.com')
+        g.pop('_login_user', None)
+        self.assertEqual(browser.get('/client/profile').status_code, 200)
+
+        g.pop('_login_user', None)
+        admin = self._login('admin@test.com')
+        g.pop('_login_user', None)
+        response = admin.post(f'/admin/toggle_user/{self.client_id}')
+        self.assertEqual(response.location, '/admin/users')
+
+        g.pop('_login_user', None)
+        response = browser.get('/client/profile')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/login', response.location)
+
+    def test_writes_through_current_user_are_saved(self):
+        """Profile and password updates made on current_user reach the database"""
+        browser = self._login('testclient@test.com')
+
+        response = browser.post('/client/profile', data={
+            'first_name': 'Nuevo', 'last_name': 'Nombre', 'phone': '600123123',
+            'address': '', 'insurance_info': ''})
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual((self.client_user.first_name, self.client_user.phone), ('Nuevo', '600123123'))
+        self.assertIn(b'Nuevo Nombre', browser.get('/client/profile').data)
+
+        browser.post('/change_password', data={
+            'current_password': 'password123', 'new_password': 'newpassword123',
+            'confirm_password': 'newpassword123'})
+        db.session.expire_all()
+        self.assertTrue(self.client_user.check_password('newpassword123'))
+
+
+if __name__ == '__main__':
+    unittest.main()
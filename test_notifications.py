@@ -0,0 +1,536 @@
+import threading
+import time as clock
+import unittest
+from datetime import datetime, timedelta, time
+from unittest import mock
+from jinja2 import DictLoader, Environment
+from sqlalchemy import event
+from app import app, db
+from models import User, Client, Professional, Appointment, Schedule, EmailOutbox, ReminderJob
+from availability_utils import invalidate_availability
+from booking_utils import reserve_appointment, SlotTakenError
+from login_utils import user_cache
+from outbox_utils import enqueue_email, claim_emails, deliver_pending, deliver_email, OutboxWorkerPool
+from fake_mail_servers import FakeSendGridServer, FakeSMTPServer
+from reminder_utils import process_daily_reminders, enqueue_reminder_job, claim_reminder_job, run_pending_reminder_jobs
+import email_utils
+from email_utils import (appointment_row, fill_substitutions, get_template, render_batch, render_email,
+                         render_recipients, shared_body)
+from sendgrid_utils import build_bulk_message
+from utils import queue_confirmation_email
+from transport_utils import MailTransport, get_transport
+
+class WorkerCrash(BaseException):
+    """Stands for a worker process dying in the middle of a job"""
+
+
+class TestNotifications(unittest.TestCase):
+    """Test suite for the transactional email outbox"""
+
+    def setUp(self):
+        """Set up test environment before each test"""
+        # Configure app for testing
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use in-memory database
+        app.config['SECRET_KEY'] = 'test-secret-key'  # Set a secret key for testing
+        app.secret_key = 'test-secret-key'  # Also set directly on the app
+
+        # Create application context
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        # Create database tables
+        db.drop_all()
+        db.create_all()
+        invalidate_availability()
+        user_cache.clear()
+
+        pro_user = User(username='testpro', email='pro@test.com',
+                        first_name='Pro', last_name='Test', role='professional')
+        client_user = User(username='testclient', email='client@test.com',
+                           first_name='Client', last_name='Test', role='client')
+        for user in (pro_user, client_user):
+            user.set_password('password123')
+            db.session.add(user)
+        db.session.flush()
+        self.professional = Professional(user_id=pro_user.id)
+        self.client = Client(user_id=client_user.id)
+        db.session.add_all([self.professional, self.client])
+        db.session.flush()
+        for day in range(7):
+            db.session.add(Schedule(professional_id=self.professional.id, day_of_week=day,
+                                    start_time=time(8, 0), end_time=time(20, 0)))
+        db.session.commit()
+
+        self.date = datetime.now().date() + timedelta(days=7)
+        self.sent = []
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.close()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _configure(self, **values):
+        """Change app settings for this test only"""
+        for key in values:
+            self.addCleanup(app.config.__setitem__, key, app.config.get(key))
+        app.config.update(values)
+
+    def _appointment(self, start, end, status='pending'):
+        return Appointment(professional_id=self.professional.id, client_id=self.client.id,
+                           date=self.date, start_time=start, end_time=end, status=status)
+
+    def _record(self, recipient, subject, html_body):
+        self.sent.append((recipient, subject))
+
+    def _fail(self, recipient, subject, html_body):
+        raise ConnectionError('SMTP server unavailable')
+
+    def _enqueue(self, count):
+        for index in range(count):
+            enqueue_email(f'user{index}@test.com', f'Asunto {index}', '<p>Hola</p>')
+        db.session.commit()
+
+    def test_booking_queues_its_email_in_the_same_transaction(self):
+        """A booking writes its email to the outbox on commit and a rejected one writes nothing"""
+        reserve_appointment(self._appointment(time(9, 0), time(10, 0)), before_commit=queue_confirmation_email)
+
+        email = EmailOutbox.query.one()
+        self.assertEqual((email.recipient, email.status, email.attempts), ('client@test.com', 'pending', 0))
+        self.assertEqual(email.subject, 'Confirmación de Cita con Pro Test')
+        self.assertIn('Pendiente', email.html_body)
+
+        with self.assertRaises(SlotTakenError):
+            reserve_appointment(self._appointment(time(9, 30), time(10, 30)), before_commit=queue_confirmation_email)
+        self.assertEqual(EmailOutbox.query.count(), 1)
+
+    def test_cancel_queues_email_without_sending(self):
+        """Cancelling only writes the email; delivery is left to the workers"""
+        appointment = self._appointment(time(9, 0), time(10, 0), status='confirmed')
+        db.session.add(appointment)
+        db.session.commit()
+        browser = app.test_client()
+        browser.post('/login', data={'email': 'client@test.com', 'password': 'password123'})
+
+        response = browser.post(f'/client/cancel_appointment/{appointment.id}')
+
+        self.assertEqual(response.status_code, 302)
+        db.session.expire_all()
+        self.assertEqual(appointment.status, 'cancelled')
+        email = EmailOutbox.query.one()
+        self.assertEqual(email.status, 'pending')
+        self.assertIn('Cancelada', email.html_body)
+
+    def test_delivery_retries_with_backoff_then_dead_letters(self):
+        """Failures are retried later with growing delays and given up after the last attempt"""
+        self._enqueue(1)
+        email = EmailOutbox.query.one()
+        max_attempts = app.config['EMAIL_OUTBOX_MAX_ATTEMPTS']
+        base = app.config['EMAIL_OUTBOX_BACKOFF']
+
+        delays = []
+        for attempt in range(1, max_attempts):
+            started = datetime.utcnow()
+            self.assertEqual(deliver_pending(send=self._fail), 1)
+            db.session.refresh(email)
+            self.assertEqual((email.status, email.attempts), ('pending', attempt))
+            self.assertIn('SMTP server unavailable', email.last_error)
+            delays.append((email.next_attempt_at - started).total_seconds())
+            # Not due yet
+            self.assertEqual(deliver_pending(send=self._fail), 0)
+            email.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+        self.assertGreaterEqual(delays[0], base * 0.99)
+        self.assertGreaterEqual(delays[1], delays[0] * 1.5)
+
+        deliver_pending(send=self._fail)
+        db.session.refresh(email)
+        self.assertEqual((email.status, email.attempts), ('dead', max_attempts))
+        self.assertEqual(deliver_pending(send=self._record), 0)
+        self.assertEqual(self.sent, [])
+
+    def test_delivery_marks_emails_sent_once(self):
+        """Delivered emails are marked sent and never picked up again"""
+        self._enqueue(3)
+
+        self.assertEqual(deliver_pending(send=self._record), 3)
+        self.assertEqual(deliver_pending(send=self._record), 0)
+
+        self.assertEqual(len(self.sent), 3)
+        self.assertEqual({email.status for email in EmailOutbox.query}, {'sent'})
+        self.assertTrue(all(email.sent_at for email in EmailOutbox.query))
+
+    def test_expired_lease_is_reclaimed_after_a_crash(self):
+        """An email claimed by a worker that died is delivered once its lease expires"""
+        self._enqueue(1)
+        claimed = claim_emails(10)
+        self.assertEqual(len(claimed), 1)
+
+        # The worker dies without recording a result: the lease protects the email meanwhile
+        self.assertEqual(claim_emails(10), [])
+        claimed[0].next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+        self.assertEqual(deliver_pending(send=self._record), 1)
+        email = EmailOutbox.query.one()
+        self.assertEqual((email.status, email.attempts), ('sent', 2))
+
+    def test_slow_batch_never_sends_an_email_twice(self):
+        """Emails of a batch whose lease ran out go to the next worker and are skipped by the slow one"""
+        self._enqueue(2)
+        table = EmailOutbox.__table__
+
+        def slow_send(recipient, subject, html_body):
+            self._record(recipient, subject, html_body)
+            if len(self.sent) == 1:
+                # While the first email is sent the lease of the second one runs out and another worker takes it
+                db.session.execute(table.update().where(table.c.recipient != recipient).values(
+                    next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+                db.session.commit()
+                for email in claim_emails(10):
+                    self._record(email.recipient, email.subject, email.html_body)
+
+        deliver_pending(send=slow_send)
+
+        self.assertEqual(sorted(recipient for recipient, _ in self.sent), ['user0@test.com', 'user1@test.com'])
+        self.assertEqual(EmailOutbox.query.filter_by(status='sent').count(), 1)
+
+    def test_result_of_a_lost_claim_is_dropped(self):
+        """A worker whose lease was taken over does not overwrite the new owner's state"""
+        self._enqueue(1)
+
+        def overtaken_send(recipient, subject, html_body):
+            db.session.execute(EmailOutbox.__table__.update().values(
+                next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+            db.session.commit()
+            self.assertEqual(len(claim_emails(10)), 1)
+            raise ConnectionError('SMTP server unavailable')
+
+        deliver_pending(send=overtaken_send)
+
+        email = EmailOutbox.query.one()
+        self.assertEqual((email.status, email.attempts, email.last_error), ('sending', 2, None))
+        self.assertIsNotNone(email.claimed_by)
+
+    def test_concurrent_workers_claim_disjoint_batches(self):
+        """Workers racing for the outbox never claim the same email"""
+        self._enqueue(40)
+        claims = []
+        barrier = threading.Barrier(4)
+
+        def worker():
+            with app.app_context():
+                try:
+                    barrier.wait()
+                    while batch := claim_emails(5):
+                        claims.extend(email.id for email in batch)
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(claims), sorted(email.id for email in EmailOutbox.query))
+
+    def test_worker_pool_delivers_in_the_background(self):
+        """Committing new emails wakes the pool, which delivers them without any request waiting"""
+        pool = OutboxWorkerPool(app, 2, send=self._record)
+        pool.start()
+        try:
+            self._enqueue(5)
+            pool.wake()
+            deadline = clock.monotonic() + 5
+            while len(self.sent) < 5 and clock.monotonic() < deadline:
+                clock.sleep(0.01)
+        finally:
+            pool.stop(timeout=5)
+
+        self.assertEqual(sorted(recipient for recipient, _ in self.sent),
+                         sorted(f'user{index}@test.com' for index in range(5)))
+        db.session.expire_all()
+        self.assertEqual({email.status for email in EmailOutbox.query}, {'sent'})
+
+    def _book_tomorrow(self, count):
+        """Confirmed appointments of tomorrow, one minute apart"""
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        appointments = [Appointment(professional_id=self.professional.id, client_id=self.client.id, date=tomorrow,
+                                    start_time=time(8 + index // 60, index % 60),
+                                    end_time=time(8 + (index + 1) // 60, (index + 1) % 60), status='confirmed')
+                        for index in range(count)]
+        db.session.add_all(appointments)
+        db.session.commit()
+        return appointments
+
+    def _send_batch(self, recipients):
+        self.sent.append(recipients)
+        return True
+
+    def test_daily_reminders_are_batched_and_sent_once(self):
+        """Reminders go out in batches of REMINDER_BATCH_SIZE and a second run sends nothing"""
+        self.addCleanup(app.config.__setitem__, 'REMINDER_BATCH_SIZE', app.config['REMINDER_BATCH_SIZE'])
+        app.config['REMINDER_BATCH_SIZE'] = 10
+        self._book_tomorrow(25)
+        # Neither pending appointments nor other days get a reminder
+        db.session.add(self._appointment(time(18, 0), time(19, 0), status='confirmed'))
+        db.session.add(Appointment(professional_id=self.professional.id, client_id=self.client.id,
+                                   date=datetime.now().date() + timedelta(days=1),
+                                   start_time=time(18, 0), end_time=time(19, 0), status='pending'))
+        db.session.commit()
+
+        self.assertEqual(process_daily_reminders(send=self._send_batch), (25, 25, 0))
+        self.assertEqual([len(batch) for batch in self.sent], [10, 10, 5])
+        self.assertEqual(self.sent[0][0]['email'], 'client@test.com')
+        self.assertEqual(self.sent[0][0]['subject'], 'Recordatorio de Cita con Pro Test')
+        self.assertEqual(self.sent[0][0]['substitutions']['-time-'], '08:00')
+
+        self.assertEqual(process_daily_reminders(send=self._send_batch), (0, 0, 0))
+        self.assertEqual(len(self.sent), 3)
+
+    def test_failed_reminder_batch_is_retried_by_next_run(self):
+        """A rejected batch is released and the next run sends exactly that batch"""
+        self.addCleanup(app.config.__setitem__, 'REMINDER_BATCH_SIZE', app.config['REMINDER_BATCH_SIZE'])
+        app.config['REMINDER_BATCH_SIZE'] = 10
+        self._book_tomorrow(25)
+        calls = []
+
+        def reject_second(recipients):
+            calls.append(recipients)
+            return len(calls) != 2
+
+        self.assertEqual(process_daily_reminders(send=reject_second), (25, 15, 10))
+        self.assertEqual(process_daily_reminders(send=self._send_batch), (10, 10, 0))
+        self.assertEqual([entry['substitutions']['-time-'] for entry in self.sent[0]],
+                         [entry['substitutions']['-time-'] for entry in calls[1]])
+
+    def test_daily_reminder_queries_do_not_grow_with_the_batch(self):
+        """Each batch costs one claim, one load and one mark, whatever its size"""
+        self._book_tomorrow(50)
+        db.session.expunge_all()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            process_daily_reminders(send=self._send_batch)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        self.assertEqual(len(self.sent[0]), 50)
+        # Claim, load and mark of the batch, then the empty claim that ends the run
+        self.assertEqual(len(statements), 4)
+
+    def test_rescheduled_appointment_gets_a_new_reminder(self):
+        """Moving an appointment clears its reminder marker"""
+        appointment = self._book_tomorrow(1)[0]
+        process_daily_reminders(send=self._send_batch)
+        db.session.refresh(appointment)
+        self.assertIsNotNone(appointment.reminder_sent_at)
+
+        appointment.start_time, appointment.end_time = time(12, 0), time(13, 0)
+        db.session.commit()
+
+        self.assertIsNone(appointment.reminder_sent_at)
+        self.assertEqual(process_daily_reminders(send=self._send_batch), (1, 1, 0))
+
+    def test_bulk_message_has_one_personalization_per_recipient(self):
+        """A full batch is a single SendGrid request with the data of every recipient"""
+        appointment = self._book_tomorrow(1)[0]
+        recipient = render_recipients('reminder', [appointment_row(appointment)])[0]
+
+        message = build_bulk_message('<p>Hola -first_name-</p>', [recipient] * 1000).get()
+
+        self.assertEqual(len(message['personalizations']), 1000)
+        self.assertEqual(message['personalizations'][0], {
+            'to': [{'email': 'client@test.com'}],
+            'subject': 'Recordatorio de Cita con Pro Test',
+            'substitutions': recipient['substitutions'],
+        })
+
+    def test_cron_endpoint_queues_a_job_and_reports_progress(self):
+        """The cron call returns a job at once and the status endpoint follows its progress"""
+        self.addCleanup(app.config.__setitem__, 'CRON_API_KEY', app.config.get('CRON_API_KEY'))
+        self.addCleanup(app.config.__setitem__, 'REMINDER_BATCH_SIZE', app.config['REMINDER_BATCH_SIZE'])
+        app.config['CRON_API_KEY'] = 'cron-key'
+        app.config['REMINDER_BATCH_SIZE'] = 10
+        self._book_tomorrow(25)
+        browser = app.test_client()
+        headers = {'X-API-Key': 'cron-key'}
+
+        response = browser.post('/webhooks/cron/daily-reminders', headers=headers)
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json['job_id']
+        self.assertEqual(response.json['status'], 'queued')
+        self.assertEqual(response.json['status_url'], f'/webhooks/cron/daily-reminders/{job_id}')
+        self.assertEqual(self.sent, [])
+        # A retried cron call gets the same job
+        self.assertEqual(browser.post('/webhooks/cron/daily-reminders', headers=headers).json['job_id'], job_id)
+
+        self.assertEqual(run_pending_reminder_jobs(send=self._send_batch), 1)
+
+        status = browser.get(f'/webhooks/cron/daily-reminders/{job_id}', headers=headers).json
+        self.assertEqual((status['status'], status['total'], status['sent'], status['failed'], status['batches']),
+                         ('completed', 25, 25, 0, 3))
+        self.assertEqual(browser.get(f'/webhooks/cron/daily-reminders/{job_id}').status_code, 401)
+        self.assertEqual(browser.post('/webhooks/cron/daily-reminders', headers={'X-API-Key': 'wrong'}).status_code, 401)
+        self.assertEqual(browser.get('/webhooks/cron/daily-reminders/999', headers=headers).status_code, 404)
+
+    def test_crashed_job_resumes_from_its_last_checkpoint(self):
+        """A job whose worker died is resumed after its lease and resends the batch in flight"""
+        self.addCleanup(app.config.__setitem__, 'REMINDER_BATCH_SIZE', app.config['REMINDER_BATCH_SIZE'])
+        app.config['REMINDER_BATCH_SIZE'] = 10
+        appointments = self._book_tomorrow(25)
+        job = enqueue_reminder_job()
+        calls = []
+
+        def crash_on_second(recipients):
+            calls.append(recipients)
+            if len(calls) == 2:
+                raise WorkerCrash()
+            return True
+
+        with self.assertRaises(WorkerCrash):
+            run_pending_reminder_jobs(send=crash_on_second)
+        db.session.rollback()
+        db.session.refresh(job)
+        self.assertEqual((job.status, job.total, job.sent, job.batches), ('running', 25, 10, 1))
+        self.assertEqual(job.last_appointment_id, appointments[9].id)
+        # The batch in flight is claimed, not marked as sent
+        self.assertEqual(Appointment.query.filter(Appointment.reminder_sent_at.isnot(None)).count(), 10)
+        self.assertEqual(Appointment.query.filter(Appointment.reminder_claimed_by.isnot(None)).count(), 10)
+
+        # The lease keeps other workers away until it expires
+        self.assertIsNone(claim_reminder_job())
+        job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+        self.assertEqual(run_pending_reminder_jobs(send=self._send_batch), 1)
+        db.session.refresh(job)
+        self.assertEqual((job.status, job.attempts, job.sent, job.failed, job.batches), ('completed', 2, 25, 0, 3))
+        # The batch in flight at the crash and the rest: no reminder is lost
+        self.assertEqual([entry['substitutions']['-time-'] for batch in self.sent for entry in batch],
+                         [f'08:{minute}' for minute in range(10, 25)])
+        self.assertEqual(Appointment.query.filter(Appointment.reminder_sent_at.is_(None)).count(), 0)
+
+    def test_bulk_and_single_emails_render_the_same_body(self):
+        """The shared body with its substitutions filled is the email rendered for the row"""
+        # A value containing a tag is inserted as is, not filled in turn
+        row = {'email': 'ana@test.com', 'first_name': 'Ana -date- <b>', 'professional_name': 'Dr. Pérez & Hijos',
+               'date': self.date, 'start_time': time(9, 30), 'status': 'confirmed'}
+
+        recipient, subject, html_body = render_email('reminder', row)
+        bulk = render_recipients('reminder', [row])[0]
+        filled = fill_substitutions(shared_body('reminder'), bulk['substitutions'])
+
+        self.assertEqual(filled, html_body)
+        self.assertEqual((bulk['email'], bulk['subject']), (recipient, subject))
+        self.assertEqual(subject, 'Recordatorio de Cita con Dr. Pérez & Hijos')
+        self.assertIn('Hola Ana -date- &lt;b&gt;,', html_body)
+        self.assertIn('Dr. Pérez &amp; Hijos', html_body)
+        self.assertIn('<p><strong>Hora:</strong> 09:30</p>', html_body)
+
+    def test_batch_rendering_matches_the_jinja_template(self):
+        """Emails joined from the template's fragments are exactly what Jinja renders, escaping included"""
+        row = {'email': 'ana@test.com', 'first_name': 'Ana -time- <i>', 'professional_name': '"Dr." O\'Neil',
+               'date': self.date, 'start_time': time(9, 30), 'status': 'cancelled'}
+        for name in ('confirmation', 'reminder'):
+            html_body = render_email(name, row)[2]
+            self.assertEqual(html_body, get_template(name).render(
+                first_name=row['first_name'], professional_name=row['professional_name'],
+                date=self.date.strftime('%d/%m/%Y'), time='09:30', status_label='Cancelada'))
+
+    def test_templates_with_logic_on_their_fields_are_rejected(self):
+        """Fragments are only built from templates that print their fields as is"""
+        environment = Environment(loader=DictLoader({
+            'plain.html': '<p>Hola {{ first_name }}, a las {{ time }}</p>',
+            'filtered.html': '<p>Hola {{ first_name|upper }}</p>',
+            'conditional.html': '<p>{{ status_label }}{% if status_label == "Cancelada" %}, lo sentimos{% endif %}</p>',
+        }), autoescape=True)
+        with mock.patch.object(email_utils, '_environment', environment):
+            try:
+                self.assertEqual([field for field, _ in email_utils._fragments('plain')[1]], ['first_name', 'time'])
+                for name in ('filtered', 'conditional'):
+                    with self.assertRaisesRegex(ValueError, name):
+                        email_utils._fragments(name)
+            finally:
+                email_utils.shared_body.cache_clear()
+                email_utils._fragments.cache_clear()
+
+    def test_confirmation_batch_shows_each_status(self):
+        """Rows are rendered in order with the label of their status"""
+        rows = [{'email': f'user{index}@test.com', 'first_name': 'Ana', 'professional_name': 'Pro Test',
+                 'date': self.date, 'start_time': time(9, 0), 'status': status}
+                for index, status in enumerate(['pending', 'confirmed', 'cancelled', 'completed'])]
+
+        messages = render_batch('confirmation', rows)
+
+        self.assertEqual([recipient for recipient, _, _ in messages], [row['email'] for row in rows])
+        for (_, subject, html_body), label in zip(messages, ['Pendiente', 'Confirmada', 'Cancelada', 'Completada']):
+            self.assertEqual(subject, 'Confirmación de Cita con Pro Test')
+            self.assertIn(f'Tu cita ha sido <strong>{label}</strong>.', html_body)
+
+    def test_outbox_delivers_through_fake_sendgrid(self):
+        """The SendGrid transport posts to SENDGRID_API_HOST and rejected emails are retried"""
+        with FakeSendGridServer() as server:
+            self._configure(MAIL_TRANSPORT='sendgrid', SENDGRID_API_KEY='fake-key', SENDGRID_API_HOST=server.url)
+            self._enqueue(3)
+            self.assertEqual(deliver_pending(send=deliver_email), 3)
+            self.assertEqual(sorted(server.messages), [(f'user{index}@test.com', f'Asunto {index}') for index in range(3)])
+
+            server.failure_rate = 1.0
+            self._enqueue(1)
+            deliver_pending(send=deliver_email)
+
+        email = EmailOutbox.query.filter_by(status='pending').one()
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('503', email.last_error)
+        self.assertEqual((server.requests, server.failures), (4, 1))
+
+    def test_transport_is_built_once_per_configuration(self):
+        """Deliveries reuse the transport, and its API client, until the configuration changes"""
+        self._configure(MAIL_TRANSPORT='sendgrid', SENDGRID_API_KEY='fake-key', SENDGRID_API_HOST='http://one')
+        transport = get_transport()
+        self.assertIs(get_transport(), transport)
+        self.assertIs(get_transport().client, transport.client)
+
+        self._configure(SENDGRID_API_HOST='http://two')
+        self.assertIsNot(get_transport(), transport)
+        with self.assertRaises(TypeError):
+            MailTransport()
+
+    def test_outbox_delivers_through_fake_smtp(self):
+        """The SMTP transport talks to MAIL_SERVER and a refused email is retried"""
+        with FakeSMTPServer() as server:
+            self._configure(MAIL_TRANSPORT='smtp', MAIL_SERVER=server.host, MAIL_PORT=server.port,
+                            MAIL_USE_TLS=False, MAIL_SUPPRESS_SEND=False)
+            reserve_appointment(self._appointment(time(9, 0), time(10, 0)), before_commit=queue_confirmation_email)
+            self.assertEqual(deliver_pending(send=deliver_email), 1)
+            self.assertEqual(server.messages, [('client@test.com', 'Confirmación de Cita con Pro Test')])
+
+            server.failure_rate = 1.0
+            self._enqueue(1)
+            deliver_pending(send=deliver_email)
+
+        email = EmailOutbox.query.filter_by(status='pending').one()
+        self.assertIn('451', email.last_error)
+
+    def test_reminders_take_one_request_per_batch_on_fake_sendgrid(self):
+        """The default reminder sender packs every batch into one SendGrid request"""
+        self._book_tomorrow(25)
+        with FakeSendGridServer() as server:
+            self._configure(MAIL_TRANSPORT='sendgrid', SENDGRID_API_KEY='fake-key', SENDGRID_API_HOST=server.url,
+                            REMINDER_BATCH_SIZE=10)
+            self.assertEqual(process_daily_reminders(), (25, 25, 0))
+
+        self.assertEqual(server.requests, 3)
+        self.assertEqual(len(server.messages), 25)
+        self.assertEqual(set(server.messages), {('client@test.com', 'Recordatorio de Cita con Pro Test')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,383 @@
+import re
+import time as clock
+import unittest
+from datetime import datetime, timedelta, time
+from flask import g, template_rendered
+from sqlalchemy import event, update
+from app import app, db
+from models import User, Client, Professional, Appointment, Schedule, Specialty, CacheVersion
+from catalog_utils import specialty_choices, catalog_version, SPECIALTY_CATALOG, _bump_catalog_version
+from login_utils import user_cache
+from routes.professional import _agenda_query, _status_counts_query
+from stats_utils import dashboard_snapshot, compute_dashboard_stats, get_dashboard_stats
+
+class TestQueries(unittest.TestCase):
+    """Test suite checking that the hot queries use their indexes and a bounded number of round trips"""
+
+    def setUp(self):
+        """Set up test environment before each test"""
+        # Configure app for testing
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use in-memory database
+        app.config['SECRET_KEY'] = 'test-secret-key'  # Set a secret key for testing
+        app.secret_key = 'test-secret-key'  # Also set directly on the app
+
+        # Create application context
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        # Create database tables
+        db.drop_all()
+        db.create_all()
+        dashboard_snapshot.invalidate()
+        user_cache.clear()
+
+        self.today = datetime.now().date()
+
+    def tearDown(self):
+        """Clean up after each test"""
+        db.session.close()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _plan(self, query):
+        """EXPLAIN QUERY PLAN details of an ORM query or a select()"""
+        statement = getattr(query, 'statement', query)
+        sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        return [row[-1] for row in db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+
+    def assertUsesIndex(self, query, index):
+        plan = self._plan(query)
+        # Scanning the rows a subquery produced is fine, scanning a table is not
+        subqueries = {detail.split(' ', 1)[1] for detail in plan if detail.startswith(('CO-ROUTINE', 'MATERIALIZE'))}
+        self.assertTrue(any(re.search(rf'INDEX {index}\b', detail) for detail in plan), plan)
+        self.assertFalse(any(detail.startswith('SCAN') and 'INDEX' not in detail and detail[5:] not in subqueries
+                             for detail in plan), plan)
+
+    def test_professional_dashboard_queries_use_index(self):
+        """The dashboard's numbered fetch of upcoming and today's appointments and its per-status counts"""
+        self.assertUsesIndex(_agenda_query(1, self.today), 'ix_appointment_professional_date_status')
+        self.assertUsesIndex(_status_counts_query(1), 'ix_appointment_professional_date_status')
+
+    def test_client_appointments_use_index(self):
+        """Upcoming appointments of a client"""
+        upcoming = Appointment.query.filter(
+            Appointment.client_id == 1,
+            Appointment.date >= self.today,
+            Appointment.status.in_(['confirmed', 'pending'])
+        ).order_by(Appointment.date, Appointment.start_time)
+
+        self.assertUsesIndex(upcoming, 'ix_appointment_client_date_status')
+
+    def test_admin_dashboard_queries_use_index(self):
+        """Counts by status and the most recent appointments"""
+        pending = db.session.query(Appointment.id).filter_by(status='pending')
+        recent = Appointment.query.order_by(Appointment.created_at.desc()).limit(5)
+
+        self.assertUsesIndex(pending, 'ix_appointment_status')
+        self.assertUsesIndex(recent, 'ix_appointment_created_at')
+
+    def test_reminders_use_partial_index(self):
+        """Confirmed appointments of tomorrow come from the partial index"""
+        tomorrow = Appointment.query.filter(
+            Appointment.date == self.today + timedelta(days=1),
+            Appointment.status == 'confirmed'
+        )
+
+        self.assertUsesIndex(tomorrow, 'ix_appointment_confirmed_date')
+
+    def test_schedule_lookup_uses_index(self):
+        """Schedules of a professional for one weekday"""
+        schedules = Schedule.query.filter_by(professional_id=1, day_of_week=0)
+
+        self.assertUsesIndex(schedules, 'ix_schedule_professional_day')
+
+    def _count_queries(self, func, *args, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, len(statements)
+
+    def _user(self, username, role):
+        user = User(username=username, email=f'{username}@test.com',
+                    first_name=username.capitalize(), last_name='Test', role=role)
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.flush()
+        return user
+
+    def _client(self):
+        client = Client(user_id=self._user('testclient', 'client').id)
+        db.session.add(client)
+        db.session.flush()
+        return client
+
+    def _professional(self, username, specialty_name):
+        professional = Professional(user_id=self._user(username, 'professional').id)
+        professional.specialties.append(Specialty(name=specialty_name))
+        db.session.add(professional)
+        db.session.flush()
+        return professional
+
+    def _add_appointments(self, client, professionals, days, first_day):
+        """One appointment per professional per day, half of them in the past"""
+        for offset in range(days):
+            for hour, professional in enumerate(professionals, start=8):
+                db.session.add(Appointment(
+                    professional_id=professional.id, client_id=client.id,
+                    date=first_day + timedelta(days=offset), start_time=time(hour, 0),
+                    end_time=time(hour + 1, 0), status='confirmed' if offset % 3 else 'cancelled'))
+        db.session.commit()
+
+    def _login(self, email):
+        client = app.test_client()
+        client.post('/login', data={'email': email, 'password': 'password123'})
+        return client
+
+    def test_my_appointments_query_count_is_constant(self):
+        """The client's appointments page costs the same queries for 6 or 200 appointments"""
+        client = self._client()
+        professionals = [self._professional('proa', 'Cardiología'), self._professional('prob', 'Pediatría')]
+        self._add_appointments(client, professionals, 3, self.today - timedelta(days=1))
+        browser = self._login('testclient@test.com')
+
+        db.session.expire_all()
+        response, small_count = self._count_queries(browser.get, '/client/my_appointments')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Cardiolog', response.data)
+
+        professionals += [self._professional(f'pro{index}', f'Especialidad {index}') for index in range(3)]
+        self._add_appointments(client, professionals, 40, self.today + timedelta(days=2))
+
+        db.session.expire_all()
+        response, large_count = self._count_queries(browser.get, '/client/my_appointments')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Especialidad 2', response.data)
+        self.assertLessEqual(small_count, 8)
+        self.assertEqual(large_count, small_count)
+
+    def test_calendar_feed_is_a_single_query(self):
+        """The professional calendar feed is one joined query whatever the number of events"""
+        client = self._client()
+        professional = self._professional('proa', 'Cardiología')
+        self._add_appointments(client, [professional], 30, self.today)
+        browser = self._login('proa@test.com')
+        start, end = self.today.isoformat(), (self.today + timedelta(days=30)).isoformat()
+
+        db.session.expire_all()
+        response, count = self._count_queries(browser.get, f'/professional/api/appointments?start={start}&end={end}')
+        events = response.get_json()
+        self.assertEqual(len(events), 30)
+        self.assertEqual(events[0]['title'], 'Cita con Testclient Test')
+        self.assertEqual(events[0]['start'], f'{start}T08:00:00')
+        # Session user, professional id and the feed itself
+        self.assertEqual(count, 3)
+
+        response = browser.get(f'/professional/api/appointments?start={start}&end={end}&include_cancelled=0')
+        self.assertEqual(len(response.get_json()), 20)
+        self.assertNotIn('cancelled', {event['extendedProps']['status'] for event in response.get_json()})
+
+        # Ranges longer than CALENDAR_MAX_RANGE_DAYS are cut
+        max_range = app.config['CALENDAR_MAX_RANGE_DAYS']
+        app.config['CALENDAR_MAX_RANGE_DAYS'] = 10
+        try:
+            response = browser.get(f'/professional/api/appointments?start={start}&end={end}')
+        finally:
+            app.config['CALENDAR_MAX_RANGE_DAYS'] = max_range
+        self.assertEqual(len(response.get_json()), 10)
+
+    def test_professional_dashboard_query_count(self):
+        """Counters and both appointment lists of the professional dashboard take two queries"""
+        client = self._client()
+        professional = self._professional('proa', 'Cardiología')
+        self._add_appointments(client, [professional], 30, self.today)
+        for hour in range(9, 16):
+            db.session.add(Appointment(professional_id=professional.id, client_id=client.id,
+                                       date=self.today, start_time=time(hour, 0),
+                                       end_time=time(hour, 30), status='pending'))
+        db.session.commit()
+        browser = self._login('proa@test.com')
+        rendered = []
+
+        def record(sender, template, context, **extra):
+            rendered.append(context)
+
+        db.session.expire_all()
+        with template_rendered.connected_to(record, app):
+            response, count = self._count_queries(browser.get, '/professional/dashboard')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Testclient Test', response.data)
+        # Session user, professional, counters and appointments
+        self.assertEqual(count, 4)
+
+        context = rendered[0]
+        self.assertEqual((context['total_appointments'], context['pending_appointments'],
+                          context['confirmed_appointments']), (37, 7, 20))
+        self.assertEqual([a.start_time.hour for a in context['today_appointments']], list(range(9, 16)))
+        self.assertEqual(context['upcoming_appointments'], context['today_appointments'][:5])
+
+        # Without enough appointments today, the upcoming list reaches into the next days
+        Appointment.query.filter_by(date=self.today).delete()
+        db.session.commit()
+        rendered.clear()
+        with template_rendered.connected_to(record, app):
+            browser.get('/professional/dashboard')
+        context = rendered[0]
+        self.assertEqual(context['today_appointments'], [])
+        self.assertEqual([a.date for a in context['upcoming_appointments']],
+                         [self.today + timedelta(days=offset) for offset in (1, 2, 4, 5, 7)])
+
+    def _new_request(self):
+        """Forget the request state kept in the test's app context by the previous request"""
+        for name in ('_login_user', 'client', 'professional'):
+            g.pop(name, None)
+
+    def test_role_profile_and_ownership_in_one_query_each(self):
+        """The client profile is loaded with its user once and ownership is part of the appointment query"""
+        client = self._client()
+        professional = self._professional('proa', 'Cardiología')
+        self._add_appointments(client, [professional], 3, self.today + timedelta(days=1))
+        other = Client(user_id=self._user('otherclient', 'client').id)
+        db.session.add(other)
+        db.session.commit()
+        own_id = Appointment.query.filter_by(client_id=client.id, status='confirmed').first().id
+
+        browser = self._login('otherclient@test.com')
+        self._new_request()
+        db.session.expire_all()
+        response, count = self._count_queries(browser.post, f'/client/cancel_appointment/{own_id}')
+        self.assertEqual(response.status_code, 302)
+        # Session user, client profile with its user, and the owned appointment lookup
+        self.assertEqual(count, 3)
+        self.assertEqual(db.session.get(Appointment, own_id).status, 'confirmed')
+
+        self._new_request()
+        browser = self._login('testclient@test.com')
+        self._new_request()
+        browser.post(f'/client/cancel_appointment/{own_id}')
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Appointment, own_id).status, 'cancelled')
+
+        # Updating the profile writes through the user loaded with the profile
+        self._new_request()
+        db.session.expire_all()
+        response, count = self._count_queries(browser.post, '/client/profile', data={
+            'first_name': 'Nuevo', 'last_name': 'Test', 'phone': '', 'address': 'Calle 1', 'insurance_info': ''})
+        self.assertEqual(response.status_code, 302)
+        # Client profile with its user, then the two updates
+        self.assertEqual(count, 3)
+        self.assertEqual(db.session.get(Client, client.id).address, 'Calle 1')
+        self.assertEqual(client.user.first_name, 'Nuevo')
+
+    def test_specialty_catalogue_reloads_only_after_changes(self):
+        """Dropdown choices come from the cache until a Specialty write bumps the shared version"""
+        db.session.add_all([Specialty(name='Pediatría'), Specialty(name='Cardiología')])
+        db.session.commit()
+
+        choices, count = self._count_queries(specialty_choices)
+        self.assertEqual([name for _, name in choices], ['Cardiología', 'Pediatría'])
+        self.assertEqual(count, 2)
+        # Only the version is read while nothing changes
+        _, count = self._count_queries(specialty_choices)
+        self.assertEqual(count, 1)
+
+        # Other columns and professionals do not change the choices
+        cardiology = Specialty.query.filter_by(name='Cardiología').one()
+        cardiology.description = 'Corazón'
+        version = catalog_version(SPECIALTY_CATALOG)
+        db.session.commit()
+        self.assertEqual(catalog_version(SPECIALTY_CATALOG), version)
+
+        cardiology.name = 'Cardiología adultos'
+        db.session.commit()
+        self.assertEqual(catalog_version(SPECIALTY_CATALOG), version + 1)
+        self.assertEqual(specialty_choices()[0][1], 'Cardiología adultos')
+
+        # A bump made by another worker process is seen through the database
+        db.session.execute(update(CacheVersion).values(version=CacheVersion.version + 1))
+        db.session.execute(update(Specialty).where(Specialty.name == 'Pediatría').values(name='Neurología'))
+        db.session.commit()
+        self.assertEqual([name for _, name in specialty_choices()], ['Cardiología adultos', 'Neurología'])
+
+    def test_catalogue_counter_is_created_and_bumped_by_one_upsert(self):
+        """The first write creates the counter in the same single statement that later bumps it"""
+        self.assertEqual(catalog_version('other'), 0)
+        for expected in (1, 2):
+            _, count = self._count_queries(_bump_catalog_version, db.session.connection(), 'other')
+            self.assertEqual(count, 1)
+            self.assertEqual(catalog_version('other'), expected)
+
+    def test_search_results_query_count_is_constant(self):
+        """Specialties of every result card are loaded together, whatever the page size"""
+        def search_page():
+            self._new_request()
+            browser.get('/search?specialty=0')  # materializes the availability window
+            self._new_request()
+            db.session.expire_all()
+            response, count = self._count_queries(browser.get, '/search?specialty=0')
+            self.assertEqual(response.status_code, 200)
+            return response, count
+
+        browser = app.test_client()
+        for index in range(2):
+            self._professional(f'pro{index}', f'Especialidad {index}')
+        db.session.commit()
+        _, small_count = search_page()
+
+        for index in range(2, app.config['PROFESSIONALS_PER_PAGE']):
+            self._professional(f'pro{index}', f'Especialidad {index}')
+        db.session.commit()
+        response, large_count = search_page()
+
+        self.assertIn(f'Especialidad {app.config["PROFESSIONALS_PER_PAGE"] - 1}'.encode(), response.data)
+        self.assertEqual(large_count, small_count)
+
+    def test_dashboard_stats_in_two_queries(self):
+        """User counts and per-status appointment counts come from two queries"""
+        client = self._client()
+        self._add_appointments(client, [self._professional('proa', 'Cardiología')], 6, self.today)
+
+        stats, count = self._count_queries(compute_dashboard_stats)
+
+        self.assertEqual(count, 2)
+        self.assertEqual(stats, {
+            'total_users': 2, 'total_professionals': 1, 'total_clients': 1, 'total_appointments': 6,
+            'pending_appointments': 0, 'confirmed_appointments': 4,
+            'cancelled_appointments': 2, 'completed_appointments': 0,
+        })
+
+    def test_dashboard_stats_served_from_snapshot(self):
+        """Reloads reuse the snapshot and an expired one is refreshed in the background"""
+        self._user('admin', 'admin')
+        db.session.commit()
+        browser = self._login('admin@test.com')
+
+        response = browser.get('/admin/dashboard')
+        self.assertEqual(response.status_code, 200)
+        _, count = self._count_queries(get_dashboard_stats)
+        self.assertEqual(count, 0)
+
+        self._client()
+        db.session.commit()
+        dashboard_snapshot.ttl = 0
+        try:
+            # The stale counts are served at once while the refresh runs
+            self.assertEqual(get_dashboard_stats()['total_clients'], 0)
+            deadline = clock.monotonic() + 5
+            while get_dashboard_stats()['total_clients'] == 0 and clock.monotonic() < deadline:
+                clock.sleep(0.01)
+        finally:
+            dashboard_snapshot.ttl = app.config['ADMIN_STATS_TTL']
+        self.assertEqual(get_dashboard_stats()['total_clients'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
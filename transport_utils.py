@@ -0,0 +1,135 @@
+"""
+Mail transports: SendGrid's HTTP API and SMTP, selected by configuration.
+"""
+import smtplib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from flask import current_app
+from flask_mail import Message
+from sendgrid import SendGridAPIClient
+from email_utils import fill_substitutions
+from sendgrid_utils import build_bulk_message
+
+class MailTransport(ABC):
+    """
+    Delivers rendered emails.
+
+    ``send`` raises when the email is not accepted. Transports with
+    ``supports_bulk`` deliver a whole batch of recipients in one request;
+    the others send one email per recipient. A transport keeps no state
+    between sends, so one instance is shared by every thread.
+    """
+    name = None
+    supports_bulk = False
+
+    @abstractmethod
+    def send(self, recipient, subject, html_body):
+        """Send one email, raising if it is not accepted"""
+
+    def send_bulk(self, html_body, recipients):
+        """
+        Send a body to many recipients, filling the tags of each one
+
+        Args:
+            html_body (str): HTML content with ``-field-`` tags
+            recipients (list): Dicts with ``email``, ``subject`` and ``substitutions``
+        """
+        for recipient in recipients:
+            self.send(recipient['email'], recipient['subject'],
+                      fill_substitutions(html_body, recipient['substitutions']))
+
+
+class SendGridTransport(MailTransport):
+    """SendGrid v3 API; a bulk send is one request with a personalization per recipient."""
+    name = 'sendgrid'
+    supports_bulk = True
+
+    def __init__(self, api_key, host):
+        self.client = SendGridAPIClient(api_key, host=host)
+
+    def send(self, recipient, subject, html_body):
+        self.send_bulk(html_body, [{'email': recipient, 'subject': subject, 'substitutions': {}}])
+
+    def send_bulk(self, html_body, recipients):
+        # The client raises on error statuses; anything else but 2xx is a failure too
+        response = self.client.send(build_bulk_message(html_body, recipients))
+        if not 200 <= response.status_code < 300:
+            raise RuntimeError(f"SendGrid answered {response.status_code}: {response.body}")
+
+
+class SMTPTransport(MailTransport):
+    """Plain SMTP; a bulk send reuses one connection for the whole batch."""
+    name = 'smtp'
+
+    def __init__(self, server, port, use_tls=False, username=None, password=None, sender=None, timeout=30,
+                 suppress=False):
+        self.server = server
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.timeout = timeout
+        # Like Flask-Mail, send nothing while testing unless MAIL_SUPPRESS_SEND is off
+        self.suppress = suppress
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        if self.use_tls:
+            connection.starttls()
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        return connection
+
+    def _deliver(self, connection, recipient, subject, html_body):
+        message = Message(subject=subject, recipients=[recipient], html=html_body, sender=self.sender)
+        connection.sendmail(self.sender, [recipient], message.as_bytes())
+
+    def send(self, recipient, subject, html_body):
+        if self.suppress:
+            return
+        with self._connect() as connection:
+            self._deliver(connection, recipient, subject, html_body)
+
+    def send_bulk(self, html_body, recipients):
+        if self.suppress:
+            return
+        with self._connect() as connection:
+            for recipient in recipients:
+                self._deliver(connection, recipient['email'], recipient['subject'],
+                              fill_substitutions(html_body, recipient['substitutions']))
+
+
+@lru_cache(maxsize=16)
+def _build_transport(transport_class, *settings):
+    # One transport, and for SendGrid one API client, per configuration
+    return transport_class(*settings)
+
+def get_transport(name=None):
+    """
+    Get the mail transport of the application configuration
+
+    Transports are built once per configuration and reused, so delivering
+    an email does not create a new API client.
+
+    Args:
+        name (str, optional): ``'sendgrid'`` or ``'smtp'``; by default
+            ``MAIL_TRANSPORT``, where ``'auto'`` means SendGrid when
+            ``SENDGRID_API_KEY`` is set and SMTP otherwise
+
+    Returns:
+        MailTransport: The transport
+    """
+    config = current_app.config
+    name = name or config['MAIL_TRANSPORT']
+    if name == 'auto':
+        name = 'sendgrid' if config.get('SENDGRID_API_KEY') else 'smtp'
+
+    if name == 'sendgrid':
+        return _build_transport(SendGridTransport, config['SENDGRID_API_KEY'], config['SENDGRID_API_HOST'])
+    if name == 'smtp':
+        return _build_transport(SMTPTransport, config['MAIL_SERVER'], config['MAIL_PORT'], config['MAIL_USE_TLS'],
+                                config.get('MAIL_USERNAME'), config.get('MAIL_PASSWORD'),
+                                config['MAIL_DEFAULT_SENDER'], config['MAIL_TIMEOUT'],
+                                config.get('MAIL_SUPPRESS_SEND', current_app.testing))
+    raise ValueError(f"Unknown mail transport: {name}")